@@ -0,0 +1,272 @@
+# coding: utf-8
+'''
+Synthetic source dumps for benchmarks
+
+Records mimic the shape and fan-out of the real dumps, including the large
+history fields importers do not read.
+'''
+
+import json
+import random
+from datetime import date, timedelta
+
+COUNTRIES = ['Austria', 'Belgium', 'France', 'Germany', 'Italy', 'Spain',
+             'Sweden', 'Poland', 'Portugal', 'Ireland', 'Netherlands']
+
+GROUPS = [
+    ('PPE', u"Group of the European People's Party (Christian Democrats)"),
+    ('S&D', u'Group of the Progressive Alliance of Socialists and Democrats '
+            u'in the European Parliament'),
+    ('ECR', u'European Conservatives and Reformists Group'),
+    ('ALDE', u'Group of the Alliance of Liberals and Democrats for Europe'),
+    ('Verts/ALE', u'Group of the Greens/European Free Alliance'),
+    ('GUE/NGL', u'Confederal Group of the European United Left - Nordic '
+                u'Green Left'),
+    ('NA', u'Non-attached Members'),
+]
+
+COMMITTEES = ['AFET', 'DEVE', 'INTA', 'BUDG', 'CONT', 'ECON', 'EMPL', 'ENVI',
+              'ITRE', 'IMCO', 'TRAN', 'REGI', 'AGRI', 'PECH', 'CULT', 'JURI',
+              'LIBE', 'AFCO', 'FEMM', 'PETI']
+
+FIRST_NAMES = [u'Hubert', u'Olle', u'Anne', u'Élise', u'Jürgen', u'María',
+               u'Bairbre', u'Søren', u'Łukasz', u'Françoise', u'João']
+
+LAST_NAMES = [u'PIRKER', u'LUDVIGSSON', u'de BRÚN', u'MÜLLER', u'GARCÍA',
+              u'van DALEN', u'KOWALSKI', u'DUPONT', u'ROSSI', u'O’BRIEN']
+
+
+def _date(rnd, start=1950, end=2020):
+    day = date(start, 1, 1) + timedelta(
+        days=rnd.randint(0, (end - start) * 365))
+    return day.strftime('%Y-%m-%dT00:00:00')
+
+
+def _term(rnd):
+    start = rnd.randint(1979, 2014)
+    end = start + rnd.choice([1, 2, 5])
+    return {
+        'start': '%s-07-14T00:00:00' % start,
+        'end': ('9999-12-31T00:00:00' if end > 2019 else
+                '%s-07-13T00:00:00' % end),
+    }
+
+
+def parltrack_mep(rnd, index, history=50):
+    '''
+    A parltrack ep_meps_current record; history is the number of entries of
+    the changes and activities fields, which importers ignore
+    '''
+    first = rnd.choice(FIRST_NAMES)
+    last = u'%s%s' % (rnd.choice(LAST_NAMES), index)
+    uid = 100000 + index
+
+    mep = {
+        '_id': '%024x' % index,
+        'UserID': uid,
+        'Name': {'full': u'%s %s' % (first, last), 'sur': first,
+                 'family': last, 'familylc': last.lower(),
+                 'aliases': [u'%s %s' % (first, last)]},
+        'Birth': {'date': _date(rnd, 1940, 1990), 'place': u'Place %s' % (
+            index % 500)},
+        'Gender': rnd.choice(['M', 'F']),
+        'active': rnd.random() < 0.8,
+        'Photo': 'http://www.europarl.europa.eu/mepphoto/%s.jpg' % uid,
+        'CV': [u'Curriculum line %s' % i for i in range(rnd.randint(0, 8))],
+        'Mail': ['%s.%s@europarl.europa.eu' % (first.lower(), index)],
+        'Homepage': ['http://example.org/%s' % uid] if rnd.random() < .5
+        else [],
+        'Twitter': ['http://twitter.com/mep%s' % uid],
+        'Facebook': ['https://www.facebook.com/mep%s' % uid],
+        'meta': {'url': 'http://www.europarl.europa.eu/meps/en/%s/'
+                        '_history.html' % uid, 'updated': _date(rnd)},
+    }
+
+    mep['Addresses'] = {
+        'Brussels': {'Phone': '+322 28 %05d' % index, 'Fax': '+322 28 0',
+                     'Address': {'Office': 'ASP%05d' % index,
+                                 'Building': u'Bât. Altiero Spinelli'}},
+        'Strasbourg': {'Phone': '+333 88 %05d' % index,
+                       'Address': {'Office': 'WEI%05d' % index}},
+        'Postal': ['European Parliament', 'Rue Wiertz'],
+    }
+
+    group = rnd.choice(GROUPS)
+    mep['Groups'] = [dict(_term(rnd), groupid=group[0], Organization=group[1],
+                          role=rnd.choice(['Member', 'Vice-Chair']))
+                     for i in range(rnd.randint(1, 3))]
+
+    country = rnd.choice(COUNTRIES)
+    mep['Constituencies'] = [dict(_term(rnd), country=country,
+                                  party=u'%s party %s' % (country, i % 4))
+                             for i in range(rnd.randint(1, 3))]
+
+    mep['Committees'] = [dict(_term(rnd), committee_id=committee,
+                              abbr=committee,
+                              Organization=u'Committee %s' % committee,
+                              role=rnd.choice(['Member', 'Substitute']))
+                         for committee in rnd.sample(COMMITTEES, 4)]
+
+    mep['Delegations'] = [dict(_term(rnd), abbr=None,
+                               Organization=u'Delegation %s' % rnd.randint(
+                                   1, 40),
+                               role='Member')
+                          for i in range(rnd.randint(1, 4))]
+
+    mep['Staff'] = [dict(_term(rnd), abbr=None,
+                         Organization=u'Conference of Delegation Chairs',
+                         role='Member')
+                    for i in range(rnd.randint(0, 1))]
+
+    mep['activities'] = {
+        'CRE': [{'url': 'http://www.europarl.europa.eu/cre/%s/%s' % (uid, i),
+                 'title': u'Debate %s' % i, 'term': 8, 'date': _date(rnd)}
+                for i in range(history)],
+    }
+    mep['changes'] = dict(
+        (_date(rnd, 2010, 2020), [{'type': 'changed', 'path': ['Groups', 0],
+                                   'data': [mep['Groups'][0]]}])
+        for i in range(history))
+
+    return mep
+
+
+def parltrack_meps(count, seed=0, history=50):
+    rnd = random.Random(seed)
+    for index in range(count):
+        yield parltrack_mep(rnd, index, history)
+
+
+FRENCH_GROUPS = [
+    ('SRC', u'Socialiste, républicain et citoyen'),
+    ('UMP', u'Union pour un mouvement populaire'),
+    ('UDI', u'Union des démocrates et indépendants'),
+    ('ECOLO', u'Écologiste'),
+    ('GDR', u'Gauche démocrate et républicaine'),
+    ('NI', u'Non inscrit'),
+]
+
+FRENCH_COMMITTEES = [
+    u'Commission des affaires culturelles et de l\'éducation',
+    u'Commission des affaires économiques',
+    u'Commission des affaires étrangères',
+    u'Commission des affaires européennes',
+    u'Commission des affaires sociales',
+    u'Commission des finances, de l\'économie générale et du '
+    u'contrôle budgétaire',
+    u'Commission d\'enquête sur le fonctionnement des services',
+]
+
+DEPARTMENTS = [('01', u'Ain'), ('13', u'Bouches-du-Rhône'),
+               ('33', u'Gironde'), ('59', u'Nord'), ('69', u'Rhône'),
+               ('75', u'Paris'), ('971', u'Guadeloupe')]
+
+
+def _french_date(rnd, start, end):
+    return _date(rnd, start, end)[:10]
+
+
+def francedata_rep(rnd, index):
+    '''
+    A francedata record of a depute or, one time out of four, of a senator
+    '''
+    chamber = 'SEN' if index % 4 == 3 else 'AN'
+    first = rnd.choice(FIRST_NAMES)
+    last = u'%s%s' % (rnd.choice(LAST_NAMES).title(), index)
+    slug = u'%s-%s' % (first.lower(), index)
+    department = rnd.choice(DEPARTMENTS)
+    group = rnd.choice(FRENCH_GROUPS)
+    start = _french_date(rnd, 1997, 2016)
+    domain = 'senat.fr' if chamber == 'SEN' else 'assemblee-nationale.fr'
+
+    rep = {
+        'id': index,
+        'slug': slug,
+        'chambre': chamber,
+        'nom': u'%s %s' % (first, last),
+        'prenom': first,
+        'nom_de_famille': last,
+        'sexe': rnd.choice(['H', 'F']),
+        'date_naissance': _french_date(rnd, 1940, 1990),
+        'lieu_naissance': u'Ville %s (%s)' % (index % 300, department[1]),
+        'profession': u'Profession %s' % (index % 50),
+        'photo_url': 'http://www.nosdeputes.fr/depute/photo/%s' % slug,
+        'parti_ratt_financier': u'Parti %s' % (index % 12),
+        'groupe': {'organisme': group[1],
+                   'fonction': rnd.choice([u'membre', u'président'])},
+        'groupe_sigle': group[0],
+        'num_deptmt': department[0],
+        'nom_circo': department[1],
+        'num_circo': ('non disponible' if chamber == 'SEN'
+                      else rnd.randint(1, 12)),
+        'mandat_debut': start,
+        'nb_mandats': rnd.randint(1, 4),
+        'place_en_hemicycle': str(rnd.randint(1, 577)),
+        'twitter': 'rep%s' % index if rnd.random() < .6 else '',
+        'emails': [{'email': '%s@%s' % (slug, domain)}] + [
+            {'email': 'contact@%s.fr' % slug}
+            for i in range(rnd.randint(0, 1))],
+        'sites_web': [{'site': 'http://www.%s.fr' % slug}] + [
+            {'site': 'https://twitter.com/rep%s' % index}
+            for i in range(rnd.randint(0, 1))],
+        'responsabilites': [
+            {'responsabilite': {'organisme': committee,
+                                'fonction': rnd.choice([u'membre',
+                                                        u'secrétaire'])}}
+            for committee in rnd.sample(FRENCH_COMMITTEES, 2)
+        ] + [
+            {'responsabilite': {'organisme': u'Délégation %s' % (
+                rnd.randint(1, 30)), 'fonction': u'membre'}}
+            for i in range(rnd.randint(0, 2))
+        ],
+        'groupes_parlementaires': [
+            {'responsabilite': {'organisme': u'Groupe d\'amitié %s' % (
+                rnd.randint(1, 150)), 'fonction': u'membre'}}
+            for i in range(rnd.randint(0, 5))
+        ],
+        'anciens_mandats': [
+            {'mandat': u'%s /  / ' % start}],
+        'anciens_autres_mandats': [
+            {'mandat': u'%s / Conseil municipal / Membre / 14/03/1983 / '
+                       u'19/03/1989' % department[1]}
+            for i in range(rnd.randint(0, 6))],
+        'adresses': [
+            {'adresse': u'Permanence, %s Rue %s, %s000 %s' % (
+                index % 200, index, department[0], department[1]),
+             'tel': '03 20 %02d %02d %02d' % (index % 100, index % 97,
+                                              index % 89)}
+            for i in range(rnd.randint(0, 2))],
+    }
+
+    if chamber == 'SEN':
+        rep['url_institution'] = 'http://www.senat.fr/senateur/%s.html' % slug
+        rep['url_nossenateurs'] = 'https://www.nossenateurs.fr/%s' % slug
+    else:
+        rep['url_an'] = ('http://www2.assemblee-nationale.fr/deputes/fiche/'
+                         'OMC_PA%s' % index)
+        rep['url_nosdeputes'] = 'https://www.nosdeputes.fr/%s' % slug
+
+    if rnd.random() < .2:
+        rep['mandat_fin'] = _french_date(rnd, 2017, 2020)
+        rep['ancien_depute' if chamber == 'AN' else 'ancien_senateur'] = 1
+
+    return rep
+
+
+def francedata_reps(count, seed=0):
+    rnd = random.Random(seed)
+    for index in range(count):
+        yield francedata_rep(rnd, index)
+
+
+def write_dump(path, records):
+    '''
+    Write records as a JSON array without holding them all in memory
+    '''
+    with open(path, 'w') as f:
+        f.write('[')
+        for index, record in enumerate(records):
+            if index:
+                f.write(',\n')
+            json.dump(record, f)
+        f.write(']')
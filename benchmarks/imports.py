@@ -0,0 +1,127 @@
+# coding: utf-8
+'''
+Import throughput of parltrack_import_representatives and
+francedata_import_representatives on synthetic dumps, against SQLite and a
+local PostgreSQL: a cold import into an empty database then a warm
+re-import of the same dump, each in its own process.
+
+    python benchmarks/imports.py [--records 1000 10000 100000]
+        [--database sqlite postgresql] [--command parltrack francedata]
+        [--parltrack-args '--batch-size 100']
+
+See settings.py for the database configuration. Tables but countries are
+emptied before each cold import.
+'''
+
+import argparse
+import json
+import os
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from dumps import francedata_reps, parltrack_meps, write_dump
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+COMMANDS = {
+    'parltrack': parltrack_meps,
+    'francedata': francedata_reps,
+}
+
+SETUP = '''
+import django
+from django.core.management import call_command
+from django.core.management.color import no_style
+from django.db import connection
+django.setup()
+call_command('migrate', verbosity=0)
+# Countries are loaded by migrations, keep them
+tables = [t for t in connection.introspection.django_table_names(True)
+          if t != 'representatives_country']
+with connection.cursor() as cursor:
+    for sql in connection.ops.sql_flush(no_style(), tables, ()):
+        cursor.execute(sql)
+'''
+
+IMPORT = '''
+from representatives.contrib.%s.import_representatives import main
+main()
+'''
+
+
+def python(code, database, tmp, args=(), stdin=None):
+    '''
+    Run code with a fresh interpreter configured for database, return its
+    standard output
+    '''
+    env = dict(os.environ,
+               DJANGO_SETTINGS_MODULE='settings',
+               BENCHMARK_DATABASE=database,
+               BENCHMARK_SQLITE_PATH=os.path.join(tmp, 'db.sqlite3'),
+               PYTHONPATH=os.pathsep.join(
+                   [HERE, os.path.dirname(HERE)] +
+                   os.environ.get('PYTHONPATH', '').split(os.pathsep)))
+
+    process = subprocess.Popen([sys.executable, '-c', code] + list(args),
+                               env=env, stdin=stdin, stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE)
+    out, err = process.communicate()
+    if process.returncode:
+        sys.stderr.write(err)
+        raise RuntimeError('Benchmark process failed')
+    return out
+
+
+def measure(command, database, tmp, path, args):
+    with open(path, 'rb') as f:
+        out = python(IMPORT % command, database, tmp, ['--stats'] + args, f)
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def report(command, database, records, run, summary):
+    print('%-10s %-10s %7s %-4s %9.1f records/s %7.2f queries/record '
+          '%7.1f MB peak %s' % (
+              command, database, records, run,
+              summary['records'] / max(summary['elapsed'], 1e-6),
+              summary['queries_per_record'],
+              (summary['peak_rss_kb'] or 0) / 1024.,
+              '' if summary['complete'] else '(incomplete)'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--records', type=int, nargs='+', default=[1000])
+    parser.add_argument('--database', nargs='+', default=['sqlite'],
+                        choices=('sqlite', 'postgresql'))
+    parser.add_argument('--command', nargs='+', default=sorted(COMMANDS),
+                        choices=sorted(COMMANDS))
+    parser.add_argument('--seed', type=int, default=0)
+    for command in COMMANDS:
+        parser.add_argument('--%s-args' % command, default='',
+                            help='Options passed to the %s import' % command)
+    options = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    try:
+        for records in options.records:
+            for command in options.command:
+                path = os.path.join(tmp, '%s-%s.json' % (command, records))
+                write_dump(path, COMMANDS[command](records, options.seed))
+                args = shlex.split(getattr(options, '%s_args' % command))
+
+                for database in options.database:
+                    python(SETUP, database, tmp)
+                    for run in ('cold', 'warm'):
+                        summary = measure(command, database, tmp, path, args)
+                        report(command, database, records, run, summary)
+
+                os.unlink(path)
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main()
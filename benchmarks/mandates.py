@@ -0,0 +1,167 @@
+# coding: utf-8
+'''
+Current-mandate queries on a synthetic mandate table: MandateQuerySet
+filters compiled to SQL, with and without the (representative, end_date),
+(group, end_date) and (constituency, end_date) indexes, against filtering
+every mandate in Python.
+
+    python benchmarks/mandates.py [--mandates 1000000] [--per-rep 10]
+        [--lookups 1000] [--python]
+
+The database is selected as for the import benchmarks, see settings.py.
+Mandate, group, constituency and representative tables are emptied first.
+'''
+
+import argparse
+import os
+import random
+import time
+from datetime import date, timedelta
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings')
+django.setup()
+
+from django.core.management import call_command  # noqa
+from django.db import connection, transaction  # noqa
+
+from representatives.models import (  # noqa
+    Constituency, Group, Mandate, Representative)
+
+
+def _date(rnd, start=1979, end=2030):
+    return date(start, 1, 1) + timedelta(
+        days=rnd.randint(0, (end - start) * 365))
+
+
+def populate(count, per_rep, seed=0, batch_size=10000):
+    '''
+    Create count mandates of count / per_rep representatives spread over
+    100 groups and 500 constituencies, a tenth of them current
+    '''
+    rnd = random.Random(seed)
+    for model in (Mandate, Representative, Group, Constituency):
+        model.objects.all().delete()
+
+    Group.objects.bulk_create(
+        Group(name='Group %s' % i, kind='group') for i in range(100))
+    Constituency.objects.bulk_create(
+        Constituency(name='Constituency %s' % i) for i in range(500))
+    Representative.objects.bulk_create(
+        Representative(slug='rep-%s' % i, full_name='Rep %s' % i)
+        for i in range(count // per_rep))
+
+    groups = list(Group.objects.values_list('pk', flat=True))
+    constituencies = list(Constituency.objects.values_list('pk', flat=True))
+    reps = list(Representative.objects.values_list('pk', flat=True))
+
+    def mandate(i):
+        begin = _date(rnd)
+        end = (date(9999, 12, 31) if rnd.random() < .1 else
+               begin + timedelta(days=rnd.randint(1, 5 * 365)))
+        return Mandate(representative_id=reps[i % len(reps)],
+                       group_id=rnd.choice(groups),
+                       constituency_id=rnd.choice(constituencies),
+                       role=str(i), begin_date=begin, end_date=end,
+                       link='http://example.com/%s' % i)
+
+    with transaction.atomic():
+        for start in range(0, count, batch_size):
+            Mandate.objects.bulk_create(
+                mandate(i) for i in range(start, min(start + batch_size,
+                                                     count)))
+
+    # Planner statistics, as a maintained database would have
+    if connection.vendor in ('postgresql', 'sqlite'):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    return reps, groups
+
+
+def drop_indexes():
+    '''
+    Drop the index_together indexes, alter_index_together() cannot remake
+    the mandate table on SQLite
+    '''
+    indexed = [[Mandate._meta.get_field(field).column for field in fields]
+               for fields in Mandate._meta.index_together]
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(
+            cursor, Mandate._meta.db_table)
+        for name, constraint in constraints.items():
+            if constraint['index'] and constraint['columns'] in indexed:
+                cursor.execute('DROP INDEX %s' %
+                               connection.ops.quote_name(name))
+
+
+def create_indexes():
+    with connection.schema_editor() as editor:
+        for fields in Mandate._meta.index_together:
+            editor.execute(editor._create_index_sql(
+                Mandate, [Mandate._meta.get_field(field)
+                          for field in fields], suffix='_idx'))
+
+
+def measure(name, queries):
+    start = time.time()
+    result = sum(query() for query in queries)
+    elapsed = time.time() - start
+    print('%-34s %9.1f ms %9.3f ms/query %9s rows' % (
+        name, elapsed * 1000, elapsed * 1000 / len(queries), result))
+
+
+def run(reps, groups, lookups, rnd):
+    on = date(2010, 6, 1)
+    measure('active().count()', [
+        lambda: Mandate.objects.active().count()])
+    measure('active(on).count()', [
+        lambda: Mandate.objects.active(on).count()])
+    measure('between(start, end).count()', [
+        lambda: Mandate.objects.between(date(2009, 1, 1),
+                                        date(2009, 12, 31)).count()])
+    measure('current_for(representative)', [
+        lambda rep=rep: len(Mandate.objects.current_for(rep))
+        for rep in rnd.sample(reps, min(lookups, len(reps)))])
+    measure('filter(group).active(on)', [
+        lambda group=group: Mandate.objects.filter(
+            group_id=group).active(on).count()
+        for group in groups])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--mandates', type=int, default=1000000)
+    parser.add_argument('--per-rep', type=int, default=10)
+    parser.add_argument('--lookups', type=int, default=1000,
+                        help='Number of current_for() queries')
+    parser.add_argument('--python', action='store_true',
+                        help='Also filter every mandate with Mandate.active')
+    parser.add_argument('--seed', type=int, default=0)
+    options = parser.parse_args()
+
+    call_command('migrate', verbosity=0)
+    start = time.time()
+    reps, groups = populate(options.mandates, options.per_rep, options.seed)
+    print('%s: %s mandates of %s representatives created in %.1f s' % (
+        connection.vendor, options.mandates, len(reps), time.time() - start))
+
+    if options.python:
+        measure('Python Mandate.active', [
+            lambda: sum(1 for mandate in Mandate.objects.iterator()
+                        if mandate.active)])
+
+    print('\nWith end_date indexes')
+    run(reps, groups, options.lookups, random.Random(options.seed))
+
+    drop_indexes()
+    try:
+        print('\nWithout end_date indexes')
+        run(reps, groups, options.lookups, random.Random(options.seed))
+    finally:
+        create_indexes()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+# coding: utf-8
+'''
+Parse throughput of the installed ijson backends on a synthetic parltrack
+dump, building whole records or projecting them on the keys the importer
+uses.
+
+    python benchmarks/parse.py [--records 2000] [--history 50]
+'''
+
+import argparse
+import importlib
+import os
+import tempfile
+import time
+
+import django
+
+from dumps import parltrack_meps, write_dump
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE',
+                      'representatives.tests.settings')
+django.setup()
+
+from representatives.contrib.importer import (  # noqa
+    IJSON_BACKENDS, project_items)
+from representatives.contrib.parltrack.import_representatives import (  # noqa
+    ParltrackImporter)
+
+
+def measure(size, path, parse):
+    with open(path, 'rb') as f:
+        start = time.time()
+        count = sum(1 for record in parse(f))
+        elapsed = time.time() - start
+
+    return '%8.1f MB/s %8.0f records/s' % (size / elapsed, count / elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--records', type=int, default=2000)
+    parser.add_argument('--history', type=int, default=50)
+    options = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix='.json')
+    os.close(fd)
+    try:
+        write_dump(path, parltrack_meps(options.records,
+                                        history=options.history))
+        size = os.path.getsize(path) / 1024. / 1024.
+        print('Dump: %s records, %.1f MB' % (options.records, size))
+
+        for name in IJSON_BACKENDS:
+            try:
+                backend = importlib.import_module('ijson.backends.' + name)
+            except ImportError:
+                print('%-12s not installed' % name)
+                continue
+
+            print('%-12s items     %s' % (name, measure(
+                size, path, lambda f: backend.items(f, 'item'))))
+            print('%-12s projected %s' % (name, measure(
+                size, path, lambda f: project_items(
+                    backend, f, ParltrackImporter.fields))))
+    finally:
+        os.unlink(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+# coding: utf-8
+'''
+Representative name searches on a synthetic table: ranked searches on the
+indexed search documents against the icontains lookups of search_fields.
+
+    python benchmarks/search.py [--representatives 200000] [--queries 200]
+
+The database is selected as for the import benchmarks, see settings.py.
+Representative and search document tables are emptied first.
+'''
+
+import argparse
+import operator
+import os
+import random
+import time
+
+import django
+
+from dumps import FIRST_NAMES, LAST_NAMES
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings')
+django.setup()
+
+from django.core.management import call_command  # noqa
+from django.db import connection, transaction  # noqa
+from django.db.models import Q  # noqa
+
+from representatives.models import Representative, SearchDocument  # noqa
+from representatives.search import search  # noqa
+
+SEARCH_FIELDS = ('first_name', 'last_name', 'slug')
+
+
+def populate(count, seed=0, batch_size=10000):
+    rnd = random.Random(seed)
+    Representative.objects.all().delete()
+    SearchDocument.objects.all().delete()
+
+    def rep(i):
+        first = rnd.choice(FIRST_NAMES)
+        # Suffixes make last names mostly unique
+        last = u'%s%s' % (rnd.choice(LAST_NAMES), i)
+        return Representative(slug=u'rep-%s' % i, first_name=first,
+                              last_name=last,
+                              full_name=u'%s %s' % (first, last))
+
+    with transaction.atomic():
+        for start in range(0, count, batch_size):
+            Representative.objects.bulk_create(
+                rep(i) for i in range(start, min(start + batch_size, count)))
+
+    start = time.time()
+    SearchDocument.objects.rebuild(Representative)
+    return time.time() - start
+
+
+def icontains(queryset, text):
+    for term in text.split():
+        queryset = queryset.filter(reduce(operator.or_, [
+            Q(**{'%s__icontains' % field: term})
+            for field in SEARCH_FIELDS]))
+    return queryset
+
+
+def measure(name, filter_, terms):
+    queryset = Representative.objects.all()
+    start = time.time()
+    rows = sum(len(filter_(queryset, text)[:20]) for text in terms)
+    elapsed = time.time() - start
+    print('%-10s %9.3f ms/query %7.1f rows/query' % (
+        name, elapsed * 1000 / len(terms), float(rows) / len(terms)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--representatives', type=int, default=200000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    options = parser.parse_args()
+
+    call_command('migrate', verbosity=0)
+    elapsed = populate(options.representatives, options.seed)
+    print('%s: %s search documents built in %.1f s' % (
+        connection.vendor, options.representatives, elapsed))
+
+    if search(Representative.objects.all(), u'x') is None:
+        print('Search documents are not indexed on this database')
+        return
+
+    rnd = random.Random(options.seed)
+    # Autocompletion prefixes then whole names, the first page of results
+    terms = [rnd.choice(LAST_NAMES)[:3] for i in range(options.queries)]
+    terms += [u'%s %s%s' % (rnd.choice(FIRST_NAMES), rnd.choice(LAST_NAMES),
+                            rnd.randint(0, options.representatives - 1))
+              for i in range(options.queries)]
+
+    measure('indexed', search, terms)
+    measure('icontains', icontains, terms)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+'''
+Settings of the import benchmarks, the database is selected with the
+BENCHMARK_DATABASE environment variable:
+
+- sqlite: a file database at BENCHMARK_SQLITE_PATH,
+- postgresql: database BENCHMARK_PG_NAME of the server the PGHOST, PGPORT,
+  PGUSER and PGPASSWORD variables point to, local by default.
+'''
+
+import os
+
+from representatives.tests.settings import *  # noqa
+
+if os.environ.get('BENCHMARK_DATABASE', 'sqlite') == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql_psycopg2',
+            'NAME': os.environ.get('BENCHMARK_PG_NAME',
+                                   'representatives_benchmark'),
+            'HOST': os.environ.get('PGHOST', ''),
+            'PORT': os.environ.get('PGPORT', ''),
+            'USER': os.environ.get('PGUSER', ''),
+            'PASSWORD': os.environ.get('PGPASSWORD', ''),
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('BENCHMARK_SQLITE_PATH',
+                                   'benchmark.sqlite3'),
+        }
+    }
+
+# Queries must not be logged in memory
+DEBUG = False
+LOGGING['loggers']['representatives']['level'] = 'WARNING'  # noqa
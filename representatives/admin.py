@@ -23,6 +23,7 @@ from django.contrib import admin
 
 from .models import (Address, Constituency, Country, Email, Group, Mandate,
                      Phone, Representative, WebSite)
+from .search import search
 
 
 class EmailInline(admin.TabularInline):
@@ -50,7 +51,21 @@ class MandateInline(admin.StackedInline):
     extra = 0
 
 
-class RepresentativeAdmin(admin.ModelAdmin):
+class IndexedSearchAdmin(admin.ModelAdmin):
+    """
+    Search on indexed documents, or on search_fields when the database does
+    not index them
+    """
+
+    def get_search_results(self, request, queryset, search_term):
+        found = search(queryset, search_term) if search_term else None
+        if found is None:
+            return super(IndexedSearchAdmin, self).get_search_results(
+                request, queryset, search_term)
+        return found, False
+
+
+class RepresentativeAdmin(IndexedSearchAdmin):
     list_display = ('id', 'full_name', 'gender', 'birth_place')
     search_fields = ('first_name', 'last_name', 'birth_place')
     list_filter = ('gender', )
@@ -63,9 +78,10 @@ class RepresentativeAdmin(admin.ModelAdmin):
     ]
 
 
-class GroupAdmin(admin.ModelAdmin):
+class GroupAdmin(IndexedSearchAdmin):
     list_display = ('id', 'name', 'abbreviation', 'kind')
     list_filter = ('kind',)
+    search_fields = ('name', 'abbreviation')
 
 
 class MandateAdmin(admin.ModelAdmin):
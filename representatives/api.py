@@ -1,3 +1,4 @@
+import django_filters
 from django.db import models
 
 from rest_framework import (
@@ -9,6 +10,8 @@ from rest_framework import (
 
 from rql_filter.backend import RQLFilterBackend
 
+from representatives.search import search
+
 from representatives.serializers import (
     ChamberSerializer,
     ConstituencySerializer,
@@ -28,6 +31,7 @@ from .models import (
     Mandate,
     Phone,
     Representative,
+    fold,
 )
 
 
@@ -45,6 +49,78 @@ class DefaultWebPagination(pagination.PageNumberPagination):
         return size
 
 
+class IndexedSearchFilter(filters.SearchFilter):
+    """
+    Search on the indexed documents of the view model, best matches first,
+    or on search_fields when the database does not index them
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if terms:
+            found = search(queryset, u' '.join(terms))
+            if found is not None:
+                return found
+
+        return super(IndexedSearchFilter, self).filter_queryset(
+            request, queryset, view)
+
+
+class FoldedFilter(django_filters.CharFilter):
+    """
+    Filter on a folded name field with the folded value, insensitive to case
+    and accents
+    """
+
+    def filter(self, qs, value):
+        return super(FoldedFilter, self).filter(qs, fold(value) or value)
+
+
+class RepresentativeFilter(django_filters.FilterSet):
+    first_name = FoldedFilter(name='folded_first_name')
+    first_name__icontains = FoldedFilter(name='folded_first_name',
+                                         lookup_expr='contains')
+    last_name = FoldedFilter(name='folded_last_name')
+    last_name__icontains = FoldedFilter(name='folded_last_name',
+                                        lookup_expr='contains')
+    full_name = FoldedFilter(name='folded_full_name')
+    full_name__icontains = FoldedFilter(name='folded_full_name',
+                                        lookup_expr='contains')
+
+    class Meta:
+        model = Representative
+        fields = {
+            'active': ['exact'],
+            'slug': ['exact', 'icontains'],
+            'id': ['exact'],
+            'gender': ['exact'],
+            'birth_place': ['exact'],
+            'birth_date': ['exact', 'gte', 'lte'],
+            # Current affiliations, one join on their snapshot
+            'current__chamber': ['exact'],
+            'current__chamber__abbreviation': ['exact'],
+            'current__group': ['exact'],
+            'current__group__abbreviation': ['exact'],
+            'current__country': ['exact'],
+            'current__country__code': ['exact'],
+            'current__committee': ['exact'],
+            'current__committee__abbreviation': ['exact'],
+        }
+
+
+class MandateFilter(django_filters.FilterSet):
+    group__name = FoldedFilter(name='group__folded_name')
+    group__name__icontains = FoldedFilter(name='group__folded_name',
+                                          lookup_expr='contains')
+
+    class Meta:
+        model = Mandate
+        fields = {
+            'id': ['exact'],
+            'group__abbreviation': ['exact'],
+        }
+
+
 class RepresentativeViewSet(viewsets.ReadOnlyModelViewSet):
     """
     API endpoint that allows representatives to be viewed.
@@ -52,21 +128,11 @@ class RepresentativeViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Representative.objects.all()
     filter_backends = (
         filters.DjangoFilterBackend,
-        filters.SearchFilter,
+        IndexedSearchFilter,
         filters.OrderingFilter,
         RQLFilterBackend
     )
-    filter_fields = {
-        'active': ['exact'],
-        'slug': ['exact', 'icontains'],
-        'id': ['exact'],
-        'first_name': ['exact', 'icontains'],
-        'last_name': ['exact', 'icontains'],
-        'full_name': ['exact', 'icontains'],
-        'gender': ['exact'],
-        'birth_place': ['exact'],
-        'birth_date': ['exact', 'gte', 'lte'],
-    }
+    filter_class = RepresentativeFilter
     search_fields = ('first_name', 'last_name', 'slug')
     ordering_fields = ('id', 'birth_date', 'last_name', 'full_name')
     pagination_class = DefaultWebPagination
@@ -111,11 +177,7 @@ class MandateViewSet(viewsets.ReadOnlyModelViewSet):
         filters.OrderingFilter,
         RQLFilterBackend
     )
-    filter_fields = {
-        'id': ['exact'],
-        'group__name': ['exact', 'icontains'],
-        'group__abbreviation': ['exact'],
-    }
+    filter_class = MandateFilter
     search_fields = ('group__name', 'group__abbreviation')
 
 
@@ -135,8 +197,10 @@ class GroupViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = GroupSerializer
 
     filter_backends = (
+        IndexedSearchFilter,
         RQLFilterBackend,
     )
+    search_fields = ('name', 'abbreviation')
 
 
 class ChamberViewSet(viewsets.ReadOnlyModelViewSet):
@@ -1,20 +1,26 @@
 # coding: utf-8
 
+import argparse
 import logging
 import re
 import sys
 from datetime import datetime
 
 import django.dispatch
-import ijson
 import django
 from django.apps import apps
 from django.db import transaction
-from django.utils import timezone
 from django.utils.text import slugify
 
-from representatives.models import (Country, Mandate, Email, Address, WebSite,
-                                    Representative, Constituency, Phone, Group,
+from representatives.contrib.importer import (IJSON_BACKENDS, Changeset,
+                                              GenericImporter, ReferenceData,
+                                              Staging, chunked,
+                                              fingerprint_stream,
+                                              get_ijson_backend,
+                                              import_records, project_items,
+                                              stats)
+from representatives.models import (Email, Address, WebSite,
+                                    Constituency, Phone, Group,
                                     Chamber)
 from variants import FranceDataVariants
 
@@ -24,196 +30,197 @@ logger = logging.getLogger(__name__)
 representative_pre_import = django.dispatch.Signal(
     providing_args=['representative_data'])
 
+# Sent with lists of reps, receivers return the list of reps to import
+representatives_pre_import = django.dispatch.Signal(
+    providing_args=['representatives_data'])
 
-def _get_mdef_item(mdef, item, json, default=None):
+
+def _compile_mdef_item(mdef, item, default=None):
+    '''
+    Return a function extracting item of the mandate definition mdef from a
+    json dict, see the variants module for the supported formats
+    '''
     if item in mdef:
-        try:
-            return mdef[item] % json
-        except:
-            return default
+        fmt = mdef[item]
+        if '%' not in fmt:
+            return lambda json: fmt
+
+        match = re.match(r'^%\((\w+)\)s$', fmt)
+        if match:
+            key = match.group(1)
+
+            def extract_key(json):
+                try:
+                    return fmt % {key: json[key]}
+                except (KeyError, TypeError, ValueError):
+                    return default
+            return extract_key
+
+        def extract_format(json):
+            try:
+                return fmt % json
+            except (KeyError, TypeError, ValueError):
+                return default
+        return extract_format
 
     if '%s_path' % item in mdef:
-        return _get_path(json, mdef['%s_path' % item])
+        return _compile_path(mdef['%s_path' % item])
 
     if '%s_fn' % item in mdef:
-        return mdef['%s_fn' % item](json)
+        return mdef['%s_fn' % item]
 
-    return default
+    return lambda json: default
 
 
 def _parse_date(date):
     return datetime.strptime(date, "%Y-%m-%d").date()
 
 
-def _create_mandate(representative, group, constituency, role='',
-                    begin_date=None, end_date=None):
-    mandate, _ = Mandate.objects.get_or_create(
-        representative=representative,
-        group=group,
-        constituency=constituency,
-        role=role,
-        begin_date=begin_date,
-        end_date=end_date
-    )
-
-    if _:
-        logger.debug('Created mandate %s', mandate.pk)
-
-
-def _get_path(dict_, path):
+def _compile_path(path):
     '''
-    Get value at specific path in dictionary. Path is specified by slash-
-    separated string, eg _get_path(foo, 'bar/baz') returns foo['bar']['baz']
+    Return a function getting the value at specific path in a dictionary.
+    Path is specified by slash-separated string, eg _compile_path('bar/baz')
+    returns a function returning foo['bar']['baz'] when called with foo
     '''
-    cur = dict_
-    for part in path.split('/'):
-        cur = cur[part]
-    return cur
-
+    parts = path.split('/')
 
-class GenericImporter(object):
+    def get_path(dict_):
+        cur = dict_
+        for part in parts:
+            cur = cur[part]
+        return cur
+    return get_path
 
-    def pre_import(self):
-        self.import_start_datetime = timezone.now()
 
-    def touch_model(self, model, **data):
-        '''
-        This method create or look up a model with the given data
-        it saves the given model if it exists, updating its
-        updated field
-        '''
+class MandateDefinition(object):
+    '''
+    A mandate definition of FranceDataVariants, compiled once into functions
+    extracting its items from rep json
+    '''
 
-        instance, created = model.objects.get_or_create(**data)
+    def __init__(self, mdef):
+        self.kind = mdef['kind']
+        self.chamber = mdef.get('chamber', False)
+        self.elems = mdef.get('from', lambda json: [json])
+        self.name = _compile_mdef_item(mdef, 'name', '')
+        self.abbr = _compile_mdef_item(mdef, 'abbr', '')
+        self.role = _compile_mdef_item(mdef, 'role', 'membre')
+        self.start = _compile_mdef_item(mdef, 'start', None)
+        self.end = _compile_mdef_item(mdef, 'end', None)
 
-        if not created:
-            if instance.updated < self.import_start_datetime:
-                instance.save()     # Updates updated field
 
-        return (instance, created)
+def _get_chamber(reference, variant):
+    return reference.get_or_create(Chamber, name=variant['chamber'],
+                                   abbreviation=variant['abbreviation'],
+                                   country=reference.country('France'))
 
 
-def ensure_chambers():
+def ensure_chambers(reference=None):
     """
     Ensures chambers are created
     """
-    france = Country.objects.get(name="France")
+    reference = reference or ReferenceData()
     for key in ('AN', 'SEN'):
-        variant = FranceDataVariants[key]
-        Chamber.objects.get_or_create(name=variant['chamber'],
-                                      abbreviation=variant['abbreviation'],
-                                      country=france)
+        _get_chamber(reference, FranceDataVariants[key])
 
 
 class FranceDataImporter(GenericImporter):
     url = 'http://francedata.future/data/parlementaires.json'
+    source = 'francedata'
+    pre_import_signal = representative_pre_import
+    batch_pre_import_signal = representatives_pre_import
+    detail_fields = ('first_name', 'last_name', 'full_name', 'gender',
+                     'birth_place', 'birth_date', 'photo', 'active')
 
     def parse_date(self, date):
         return _parse_date(date)
 
-    def __init__(self, variant):
-        self.france = Country.objects.get(name="France")
+    def __init__(self, variant, reference=None):
+        self.reference = reference or ReferenceData()
+        self.france = self.reference.country('France')
         self.variant = FranceDataVariants[variant]
-        self.chamber = Chamber.objects.get(name=self.variant['chamber'])
-        self.ch_constituency, _ = Constituency.objects.get_or_create(
-            name=self.variant['chamber'], country=self.france)
+        self.mandate_definitions = [MandateDefinition(mdef)
+                                    for mdef in self.variant['mandates']]
+        self.chamber = _get_chamber(self.reference, self.variant)
+        self.ch_constituency = self.reference.get_or_create(
+            Constituency, name=self.variant['chamber'], country=self.france)
+
+    def record_slug(self, rep_json):
+        return slugify('%s-%s' % (
+            rep_json['nom'] if 'nom' in rep_json
+            else rep_json['prenom'] + " " + rep_json['nom_de_famille'],
+            _parse_date(rep_json["date_naissance"])
+        ))
 
     @transaction.atomic
     def manage_rep(self, rep_json):
         '''
         Import a rep as a representative from the json dict fetched from
-        FranceData (which comes from nosdeputes.fr)
+        FranceData (which comes from nosdeputes.fr), reps skipped by pre
+        import receivers must have been filtered out, see filter_records()
         '''
 
-        # Some versions of memopol will connect to this and skip inactive reps.
-        responses = representative_pre_import.send(sender=self,
-                representative_data=rep_json)
-
-        for receiver, response in responses:
-            if response is False:
-                logger.debug(
-                    'Skipping MEP %s', rep_json['nom'])
-                return
+        # Left over by a previous record that failed
+        self.discard_queued()
 
-        changed = False
-        slug = slugify('%s-%s' % (
-            rep_json['nom'] if 'nom' in rep_json
-            else rep_json['prenom'] + " " + rep_json['nom_de_famille'],
-            _parse_date(rep_json["date_naissance"])
-        ))
+        slug = self.record_slug(rep_json)
+        digest = self.record_digest(rep_json)
+        if self.is_unchanged(slug, digest):
+            logger.debug('Unchanged MEP %s', slug)
+            return
 
-        try:
-            representative = Representative.objects.get(slug=slug)
-        except Representative.DoesNotExist:
-            representative = Representative(slug=slug)
-            changed = True
+        representative = self.import_record(rep_json)
+        self.save_digest(slug, digest)
+        return representative
 
+    def import_record(self, rep_json):
+        slug = self.record_slug(rep_json)
         if rep_json['num_circo'] == 'non disponible':
             rep_json['num_circo'] = 'nd'
 
         # Save representative attributes
-        self.import_representative_details(representative, rep_json, changed)
+        with stats.phase('details'):
+            representative = self.import_representative_details(slug,
+                                                                rep_json)
 
-        self.add_mandates(representative, rep_json)
+        with stats.phase('mandates'):
+            self.add_mandates(representative, rep_json)
 
-        self.add_contacts(representative, rep_json)
+        with stats.phase('contacts'):
+            self.add_contacts(representative, rep_json)
 
         logger.debug('Imported MEP %s', unicode(representative))
 
         return representative
 
-    def import_representative_details(self, representative, rep_json, changed):
+    def import_representative_details(self, slug, rep_json):
         active = True
         if rep_json.get("ancien_depute", 0) == 1:
             active = False
         if rep_json.get("ancien_senateur", 0) == 1:
             active = False
-        if representative.active != active:
-            representative.active = active
-            changed = True
+
+        details = {
+            'active': active,
+            'photo': rep_json['photo_url'],
+            'first_name': rep_json['prenom'],
+            'last_name': rep_json['nom_de_famille'],
+            'full_name': rep_json["nom"],
+        }
 
         if rep_json.get("date_naissance"):
-            birth_date = _parse_date(rep_json["date_naissance"])
-            if representative.birth_date != birth_date:
-                representative.birth_date = birth_date
-                changed = True
+            details['birth_date'] = _parse_date(rep_json["date_naissance"])
 
         if rep_json.get("lieu_naissance"):
-            birth_place = rep_json["lieu_naissance"]
-            if representative.birth_place != birth_place:
-                representative.birth_place = birth_place
-                changed = True
-
-        photo = rep_json['photo_url']
-        if representative.photo != photo:
-            representative.photo = photo
-            changed = True
-
-        first_name = rep_json['prenom']
-        if representative.first_name != first_name:
-            representative.first_name = first_name
-            changed = True
-
-        last_name = rep_json['nom_de_famille']
-        if representative.last_name != last_name:
-            representative.last_name = last_name
-            changed = True
-
-        full_name = rep_json["nom"]
-        if representative.full_name != full_name:
-            representative.full_name = full_name
-            changed = True
+            details['birth_place'] = rep_json["lieu_naissance"]
 
         gender_convertion_dict = {u"F": 1, u"H": 2}
         if 'sexe' in rep_json:
-            gender = gender_convertion_dict.get(rep_json['sexe'], 0)
+            details['gender'] = gender_convertion_dict.get(rep_json['sexe'], 0)
         else:
-            gender = 0
-        if representative.gender != gender:
-            representative.gender = gender
-            changed = True
+            details['gender'] = 0
 
-        if changed:
-            representative.save()
+        return self.import_representative(slug, details)
 
     def add_mandates(self, representative, rep_json):
         '''
@@ -222,7 +229,8 @@ class FranceDataImporter(GenericImporter):
 
         # Mandate in country group for party constituency
         if rep_json.get('parti_ratt_financier'):
-            constituency, _ = Constituency.objects.get_or_create(
+            constituency, _ = self.touch_model(
+                Constituency,
                 name=rep_json.get('parti_ratt_financier'), country=self.france)
 
             group, _ = self.touch_model(model=Group,
@@ -230,83 +238,67 @@ class FranceDataImporter(GenericImporter):
                                         kind='country',
                                         name=self.france.name)
 
-            _create_mandate(representative, group, constituency, 'membre')
+            self.add_mandate(representative, group, constituency, 'membre')
 
         # Configurable mandates
-        for mdef in self.variant['mandates']:
-            if mdef.get('chamber', False):
+        for mdef in self.mandate_definitions:
+            if mdef.chamber:
                 chamber = self.chamber
             else:
                 chamber = None
 
-            if 'from' in mdef:
-                elems = mdef['from'](rep_json)
-            else:
-                elems = [rep_json]
-
-            for elem in elems:
-                name = _get_mdef_item(mdef, 'name', elem, '')
-                abbr = _get_mdef_item(mdef, 'abbr', elem, '')
+            for elem in mdef.elems(rep_json):
+                name = mdef.name(elem)
+                abbr = mdef.abbr(elem)
 
                 group, _ = self.touch_model(model=Group,
                                             abbreviation=abbr,
-                                            kind=mdef['kind'],
+                                            kind=mdef.kind,
                                             chamber=chamber,
                                             name=name)
 
-                role = _get_mdef_item(mdef, 'role', elem, 'membre')
-                start = _get_mdef_item(mdef, 'start', elem, None)
+                role = mdef.role(elem)
+                start = mdef.start(elem)
                 if start is not None:
                     start = _parse_date(start)
-                end = _get_mdef_item(mdef, 'end', elem, None)
+                end = mdef.end(elem)
                 if end is not None:
                     end = _parse_date(end)
 
-                _create_mandate(representative, group, self.ch_constituency,
-                                role, start, end)
+                self.add_mandate(representative, group,
+                                 self.ch_constituency, role, start, end)
 
                 logger.debug(
                     '%s => %s: %s of "%s" (%s) %s-%s' % (rep_json['slug'],
-                    mdef['kind'], role, name, abbr, start, end))
+                    mdef.kind, role, name, abbr, start, end))
+
+        # Batched imports insert mandates of the whole batch at once
+        if self.batch is None:
+            self.flush_mandates()
 
     def add_contacts(self, representative, rep_json):
         # Chamber page
-        changed = False
-        try:
-            site = WebSite.objects.get(kind=self.variant['abbreviation'],
-                                       representative=representative)
-        except WebSite.DoesNotExist:
-            site = WebSite(kind=self.variant['abbreviation'],
-                           representative=representative)
-            changed = True
-
-        if site.url != rep_json[self.variant['chamber_url_field']]:
-            site.url = rep_json[self.variant['chamber_url_field']]
-            changed = True
-
-        if changed:
-            site.save()
+        self.add_contact(representative, WebSite,
+                         kind=self.variant['abbreviation'],
+                         url=rep_json[self.variant['chamber_url_field']])
 
         # Websites
         websites = rep_json.get('sites_web', [])
         for site in websites:
             if re.search(r'facebook\.com', site['site']):
-                self.touch_model(model=WebSite,
+                self.add_contact(representative, WebSite,
                                  url=site['site'],
-                                 kind='facebook',
-                                 representative=representative
+                                 kind='facebook'
                                  )
             elif not re.search(r'twitter\.com', site['site']):
-                self.touch_model(model=WebSite,
-                                 url=site['site'],
-                                 representative=representative
+                self.add_contact(representative, WebSite,
+                                 url=site['site']
                                  )
 
         # Twitter
         if rep_json.get('twitter'):
             tid = rep_json.get('twitter')
-            self.touch_model(model=WebSite,
-                             representative=representative,
+            self.add_contact(representative, WebSite,
                              kind='twitter',
                              url='http://twitter.com/%s' % tid
                              )
@@ -315,25 +307,23 @@ class FranceDataImporter(GenericImporter):
         emails = rep_json.get('emails', [])
         for email in emails:
             mail = email['email']
-            self.touch_model(
-                model=Email,
-                representative=representative,
+            self.add_contact(
+                representative, Email,
                 kind=('official' if mail.endswith(self.variant['mail_domain'])
                     else 'other'),
                 email=mail)
 
         # Official address
         off_name = self.variant['off_name']
-        official_addr, _ = self.touch_model(model=Address,
-                                            representative=representative,
-                                            country=self.france,
-                                            city=self.variant['off_city'],
-                                            street=self.variant['off_street'],
-                                            number=self.variant['off_number'],
-                                            postcode=self.variant['off_code'],
-                                            kind='official',
-                                            name=off_name
-                                            )
+        official_addr = self.add_contact(representative, Address,
+                                         country=self.france,
+                                         city=self.variant['off_city'],
+                                         street=self.variant['off_street'],
+                                         number=self.variant['off_number'],
+                                         postcode=self.variant['off_code'],
+                                         kind='official',
+                                         name=off_name
+                                         )
 
         # Addresses & phone numbers
         addresses = rep_json.get('adresses', [])
@@ -346,41 +336,157 @@ class FranceDataImporter(GenericImporter):
                 if item['adresse'].lower().startswith('permanence'):
                     name = 'Permanence'
 
-                addr, _ = self.touch_model(model=Address,
-                                           representative=representative,
-                                           country=self.france,
-                                           city=props.get('city', ''),
-                                           street=props.get('street', ''),
-                                           number=props.get('housenumber', ''),
-                                           postcode=props.get('postcode', ''),
-                                           kind='',
-                                           name=name
-                                           )
+                addr = self.add_contact(representative, Address,
+                                        country=self.france,
+                                        city=props.get('city', ''),
+                                        street=props.get('street', ''),
+                                        number=props.get('housenumber', ''),
+                                        postcode=props.get('postcode', ''),
+                                        kind='',
+                                        name=name
+                                        )
             elif item['adresse'].lower().startswith(off_name.lower()):
                 addr = official_addr
 
             if 'tel' in item:
-                self.touch_model(model=Phone, address=addr,
-                                 representative=representative,
+                self.add_contact(representative, Phone, address=addr,
                                  kind='', number=item['tel']
                                  )
 
+        if self.batch is None:
+            self.sync_contacts()
+
+
+def main(stream=None, argv=None):
+    parser = argparse.ArgumentParser(
+        description='Import representatives from a francedata dump')
+    parser.add_argument('--parser', choices=('auto',) + IJSON_BACKENDS,
+        help='ijson backend parsing the dump, defaults to the '
+             'REPRESENTATIVES_IJSON_BACKEND setting or to the fastest one')
+    parser.add_argument('--commit-every', type=int, default=0, metavar='N',
+        help='Commit representatives N at a time, a failing representative '
+             'is rolled back and logged on its own')
+    parser.add_argument('--sweep', action='store_true', default=False,
+        help='After a complete run, delete representatives missing from the '
+             'dump and their contacts and mandates that were not seen')
+    parser.add_argument('--resume', action='store_true', default=False,
+        help='Continue an interrupted run of the same dump, redirected '
+             'from a file, after its last committed representative')
+    parser.add_argument('--stats', action='store_true', default=False,
+        help='Print a JSON summary of timings, queries and rows written at '
+             'the end')
+    parser.add_argument('--progress', type=int, default=0, metavar='N',
+        help='Log a progress line every N representatives read')
+    parser.add_argument('--dry-run', action='store_true', default=False,
+        help='Write nothing, print counts of the rows the import would '
+             'create, update and leave stale as JSON')
+    parser.add_argument('--diff', action='store_true', default=False,
+        help='Like --dry-run, listing the rows and changed fields')
+    parser.add_argument('--staging', action='store_true', default=False,
+        help='Load the whole dump into staging tables, then publish it in '
+             'one transaction so that readers never see a partial import')
+
+    if argv is None:
+        argv = sys.argv[1:] if stream is None else []
+    options = parser.parse_args(argv)
+    dry_run = options.dry_run or options.diff
+    if dry_run and options.resume:
+        parser.error('--dry-run is not supported with --resume')
+    if options.staging and (dry_run or options.resume):
+        parser.error('--staging is not supported with --dry-run or --resume')
 
-def main(stream=None):
     if not apps.ready:
         django.setup()
 
-    ensure_chambers()
+    if options.stats:
+        stats.enable()
+
+    changeset = Changeset(FranceDataImporter.source) if dry_run else None
+    reference = ReferenceData(changeset)
+    ensure_chambers(reference)
 
-    an_importer = FranceDataImporter('AN')
+    an_importer = FranceDataImporter('AN', reference)
+    an_importer.changeset = changeset
     GenericImporter.pre_import(an_importer)
 
-    sen_importer = FranceDataImporter('SEN')
+    sen_importer = FranceDataImporter('SEN', reference)
+    sen_importer.changeset = changeset
     GenericImporter.pre_import(sen_importer)
 
-    for data in ijson.items(stream or sys.stdin, ''):
-        for rep in data:
-            if rep['chambre'] == 'AN':
-                an_importer.manage_rep(rep)
-            elif rep['chambre'] == 'SEN':
-                sen_importer.manage_rep(rep)
+    # Both chambers come from the same source and share one run
+    dump_digest, stream = fingerprint_stream(stream or sys.stdin)
+    if options.resume and not dump_digest:
+        parser.error('--resume needs the dump redirected from a file, a '
+                     'piped dump cannot be identified')
+    sen_importer.run = an_importer.start_run(dump_digest, options.resume)
+    sen_importer.import_start_datetime = an_importer.import_start_datetime
+
+    def manage_rep(rep):
+        if rep['chambre'] == 'AN':
+            an_importer.manage_rep(rep)
+        elif rep['chambre'] == 'SEN':
+            sen_importer.manage_rep(rep)
+
+    def checkpoint(failed):
+        sen_importer.flush_touched()
+        sen_importer.touch_unchanged()
+        an_importer.checkpoint(failed)
+
+    def filter_reps(reps):
+        # Pre import signals are sent by the importer of the rep chamber
+        kept = set()
+        for importer in (an_importer, sen_importer):
+            chamber = importer.variant['abbreviation']
+            kept.update(id(rep) for rep in importer.filter_records(
+                [rep for rep in reps if rep['chambre'] == chamber]))
+        return [rep for rep in reps if id(rep) in kept]
+
+    # Stream representatives one at a time out of the top-level array
+    backend = get_ijson_backend(options.parser)
+    reps = project_items(backend, stream, skip=an_importer.run.records)
+    if options.stats or options.progress:
+        reps = stats.timed(reps, options.progress)
+    reps = an_importer.journal(reps)
+
+    # Some versions of memopol will connect to this and skip inactive reps.
+    if any(importer.has_pre_import_receivers()
+           for importer in (an_importer, sen_importer)):
+        reps = an_importer.pre_filter(reps, options.commit_every,
+                                      filter_reps)
+
+    if options.staging:
+        # Both chambers share groups, constituencies and staging tables
+        an_importer.staging = Staging(an_importer.source,
+                                      an_importer.detail_fields)
+        sen_importer.staging = an_importer.staging
+        an_importer.batch = sen_importer.batch = an_importer.create_batch()
+
+    if dry_run or options.staging:
+        for chunk in chunked(reps, an_importer.default_batch_size):
+            for importer in (an_importer, sen_importer):
+                chamber = importer.variant['abbreviation']
+                importer.manage_batch(
+                    [rep for rep in chunk if rep['chambre'] == chamber])
+
+    if options.staging:
+        with transaction.atomic():
+            an_importer.publish()
+            checkpoint(0)
+    elif dry_run:
+        an_importer.diff_stale()
+        changeset.report(an_importer.run, full=options.diff)
+        if options.stats:
+            stats.report(an_importer.run)
+        return
+    else:
+        an_importer.run.failed += import_records(
+            reps, manage_rep, options.commit_every, checkpoint)
+        checkpoint(0)
+
+    # A corrupt or truncated dump raises before this point, a partial one
+    # yields an incomplete run: only sweep after a complete run
+    if an_importer.finish_run().complete and options.sweep:
+        an_importer.sweep()
+
+    if options.stats:
+        stats.report(an_importer.run)
@@ -1,24 +1,29 @@
 import pytest
 import os
 import copy
+import json
+from StringIO import StringIO
 
 from django.core.serializers.json import Deserializer
-from representatives.models import Representative
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from ijson.common import JSONError
+from representatives.models import Group, Representative
 from representatives.contrib.francedata import import_representatives
 
 
-@pytest.mark.django_db
-def test_francedata_import_representatives():
-    inputjson = os.path.join(os.path.dirname(__file__),
-            'representatives_input.json')
-    expected = os.path.join(os.path.dirname(__file__),
-            'representatives_expected.json')
+inputjson = os.path.join(os.path.dirname(__file__),
+        'representatives_input.json')
+expected = os.path.join(os.path.dirname(__file__),
+        'representatives_expected.json')
 
+
+def assert_imported(argv=None):
     # Disable django auto fields
     exclude = ('id', '_state', 'created', 'updated', 'fingerprint')
 
     with open(inputjson, 'r') as f:
-        import_representatives.main(f)
+        import_representatives.main(f, argv)
 
     missing = []
     with open(expected, 'r') as f:
@@ -36,3 +41,159 @@ def test_francedata_import_representatives():
 
     assert len(missing) is 0
     assert Representative.objects.count() == 2
+
+
+@pytest.mark.django_db
+def test_francedata_import_representatives():
+    assert_imported()
+
+
+@pytest.mark.django_db
+def test_francedata_import_representatives_commit_every():
+    assert_imported(['--commit-every', '10'])
+
+
+@pytest.mark.django_db
+def test_francedata_reimport_skips_unchanged():
+    assert_imported()
+    before = dict(Representative.objects.values_list('slug', 'updated'))
+
+    with CaptureQueriesContext(connection) as queries:
+        with open(inputjson, 'r') as f:
+            import_representatives.main(f)
+
+    # Unchanged reps are only touched in bulk, never looked up one by one
+    assert not [q for q in queries
+                if 'SELECT "representatives_mandate"' in q['sql']]
+    after = dict(Representative.objects.values_list('slug', 'updated'))
+    assert all(after[slug] > before[slug] for slug in before)
+
+
+@pytest.mark.django_db
+def test_francedata_stats(capsys):
+    assert_imported(['--stats'])
+    summary = json.loads(capsys.readouterr()[0])
+    assert summary['records'] == 2
+    assert summary['rows']['Representative'] == {'inserted': 2}
+    assert summary['phases']['details']['queries'] > 0
+    assert summary['queries_per_record'] == summary['queries'] / 2.
+
+
+@pytest.mark.django_db
+def test_francedata_dry_run(capsys):
+    with CaptureQueriesContext(connection) as queries:
+        with open(inputjson, 'r') as f:
+            import_representatives.main(f, ['--dry-run'])
+
+    assert not [q for q in queries if 'INSERT INTO' in q['sql'] or
+                'UPDATE "' in q['sql'] or 'DELETE FROM' in q['sql']]
+    changeset = json.loads(capsys.readouterr()[0])
+    assert not Representative.objects.exists()
+    groups = Group.objects.count()
+
+    assert_imported()
+    assert changeset['summary']['Representative'] == {'created': 2}
+    assert changeset['summary']['Group'] == {
+        'created': Group.objects.count() - groups}
+
+
+@pytest.mark.django_db
+def test_francedata_staging():
+    assert_imported(['--staging'])
+    groups = Group.objects.count()
+    # Re-importing matches live rows instead of duplicating them
+    assert_imported(['--staging'])
+    assert Group.objects.count() == groups
+
+    with open(inputjson, 'r') as f:
+        reps = json.load(f)
+    reps[0]['photo_url'] = 'http://example.com/photo.jpg'
+    import_representatives.main(StringIO(json.dumps(reps)), ['--staging'])
+
+    assert Representative.objects.filter(
+        photo='http://example.com/photo.jpg').count() == 1
+
+
+@pytest.mark.django_db
+def test_francedata_reimport_changed():
+    assert_imported()
+
+    with open(inputjson, 'r') as f:
+        reps = json.load(f)
+    reps[0]['photo_url'] = 'http://example.com/photo.jpg'
+    import_representatives.main(StringIO(json.dumps(reps)))
+
+    assert Representative.objects.filter(
+        photo='http://example.com/photo.jpg').count() == 1
+
+
+@pytest.mark.django_db
+def test_francedata_import_accented_committee_abbreviation():
+    with open(inputjson, 'r') as f:
+        reps = json.load(f)
+    reps[0]['responsabilites'].append({'responsabilite': {
+        'organisme': u'Commission des affaires \xe9conomiques',
+        'fonction': 'membre'}})
+    import_representatives.main(StringIO(json.dumps(reps)))
+
+    assert Group.objects.filter(abbreviation=u'\xc9conomie',
+                                kind='committee').count() == 1
+
+
+@pytest.mark.django_db
+def test_francedata_import_streams_records():
+    with open(inputjson, 'r') as f:
+        reps = json.load(f)
+
+    # The first representative is imported before the broken tail is read
+    dump = '[%s,%s{"broken' % (json.dumps(reps[0]), ' ' * 10 ** 6)
+    with pytest.raises(JSONError):
+        import_representatives.main(StringIO(dump))
+
+    assert Representative.objects.count() == 1
+
+
+def test_francedata_mandate_definition():
+    mdef = import_representatives.MandateDefinition({
+        'kind': 'group',
+        'abbr': '%(sigle)s',
+        'name_path': 'groupe/organisme',
+        'role': u'D\xe9put\xe9',
+        'start': '%(debut)s-%(fin)s',
+    })
+    elem = {'sigle': 'ABC', 'groupe': {'organisme': u'Groupe'}}
+
+    assert (mdef.abbr(elem), mdef.name(elem), mdef.role(elem)) == \
+        ('ABC', u'Groupe', u'D\xe9put\xe9')
+    # Formats missing keys fall back to defaults
+    assert (mdef.abbr({}), mdef.start(elem), mdef.end(elem)) == \
+        ('', None, None)
+
+    class Interrupted(dict):
+        def __getitem__(self, key):
+            raise KeyboardInterrupt()
+
+    # Only lookup and formatting errors are swallowed
+    with pytest.raises(KeyboardInterrupt):
+        mdef.abbr(Interrupted())
+    with pytest.raises(KeyboardInterrupt):
+        mdef.start(Interrupted())
+
+
+@pytest.mark.django_db
+def test_francedata_pre_import_signal():
+    senders = []
+
+    def skip(sender, representatives_data, **kwargs):
+        senders.append(sender.variant['abbreviation'])
+        return []
+
+    import_representatives.representatives_pre_import.connect(skip)
+    try:
+        with open(inputjson, 'r') as f:
+            import_representatives.main(f, [])
+    finally:
+        import_representatives.representatives_pre_import.disconnect(skip)
+
+    assert senders == ['AN', 'SEN']
+    assert Representative.objects.count() == 0
@@ -7,10 +7,27 @@ class DelegationHelper:
     given dicts for equivalences and abbreviations
     '''
 
+    # Lower-cased prefixes of organisms that are committees, unless they
+    # start with one of the excluded prefixes
+    committee_prefix = u'commission'
+    excluded_prefixes = (u'commission spéciale', u'commission d\'enquête')
+
     def __init__(self, equivs, abbrevs, committees=True):
         self.equivs = equivs
         self.abbrevs = abbrevs
         self.committees = committees
+        # Organism name -> whether it is a committee
+        self.classification = {}
+
+    def is_committee(self, orga):
+        try:
+            return self.classification[orga]
+        except KeyError:
+            lower = orga.lower()
+            is_committee = self.classification[orga] = (
+                lower.startswith(self.committee_prefix) and
+                not lower.startswith(self.excluded_prefixes))
+            return is_committee
 
     def __call__(self, data):
         items = []
@@ -27,12 +44,7 @@ class DelegationHelper:
             orga = g['organisme']
             role = g['fonction']
 
-            is_committee = orga.lower().startswith('commission') and not (
-                orga.lower().startswith(u'commission spéciale') or
-                orga.lower().startswith(u'commission d\'enquête')
-            )
-
-            if self.committees != is_committee:
+            if self.committees != self.is_committee(orga):
                 continue
 
             if orga in self.equivs:
@@ -72,29 +84,29 @@ _get_sen_committees = DelegationHelper({
             u"l'équipement et de l'aménagement du territoire")
 }, {
     u"Commission de la culture, de l'éducation et de la communication":
-        "Culture",
-    u"Commission des affaires économiques": "Économie",
+        u"Culture",
+    u"Commission des affaires économiques": u"Économie",
     u"Commission des affaires étrangères, de la défense et des forces armées":
-        "Défense",
-    u"Commission des affaires européennes": "Europe",
-    u"Commission des affaires sociales": "Social",
+        u"Défense",
+    u"Commission des affaires européennes": u"Europe",
+    u"Commission des affaires sociales": u"Social",
     (u"Commission des finances, du contrôle budgétaire et des comptes "
-        u"économiques de la nation"): "Finances",
+        u"économiques de la nation"): u"Finances",
     (u"Commission des lois constitutionnelles, de législation, du suffrage "
-        u"universel, du Règlement et d'administration générale"): "Lois",
+        u"universel, du Règlement et d'administration générale"): u"Lois",
 })
 
 _get_an_committees = DelegationHelper({}, {
-    u"Commission de la défense nationale et des forces armées": "Défense",
-    u"Commission des affaires culturelles et de l'éducation": "Culture",
-    u"Commission des affaires économiques": "Économie",
-    u"Commission des affaires étrangères": "Étranger",
-    u"Commission des affaires européennes": "Europe",
-    u"Commission des affaires sociales": "Social",
+    u"Commission de la défense nationale et des forces armées": u"Défense",
+    u"Commission des affaires culturelles et de l'éducation": u"Culture",
+    u"Commission des affaires économiques": u"Économie",
+    u"Commission des affaires étrangères": u"Étranger",
+    u"Commission des affaires européennes": u"Europe",
+    u"Commission des affaires sociales": u"Social",
     (u"Commission des finances, de l'économie générale et du contrôle "
-        u"budgétaire"): "Finances",
+        u"budgétaire"): u"Finances",
     (u"Commission des lois constitutionnelles, de la législation et de "
-        u"l'administration générale de la république"): "Lois"
+        u"l'administration générale de la république"): u"Lois"
 })
 
 _get_sen_delegations = DelegationHelper({}, {}, False)
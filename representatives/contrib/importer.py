@@ -0,0 +1,2175 @@
+# coding: utf-8
+
+import hashlib
+import importlib
+import json
+import logging
+import os
+import stat
+import sys
+import time
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+from io import BytesIO
+from itertools import islice
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.backends.utils import CursorWrapper
+from django.db.models import Case, Func, Model, Q, Value, When
+from django.db.models.signals import post_delete, pre_delete
+from django.utils import timezone
+from ijson.common import ObjectBuilder
+
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    resource = None
+
+from representatives.models import (Address, Chamber, Constituency,
+                                    Country, CurrentAffiliation, Email, Group,
+                                    ImportRun, Mandate, Phone, RecordDigest,
+                                    Representative, SearchDocument,
+                                    SearchDocumentQuerySet, WebSite,
+                                    delete_search_document, fold_names)
+
+logger = logging.getLogger(__name__)
+
+# ijson backends, fastest first
+IJSON_BACKENDS = ('yajl2_c', 'yajl2_cffi', 'yajl2', 'python')
+
+# Backends building items in C, faster than any projection done in python
+NATIVE_ITEMS_BACKENDS = ('yajl2_c',)
+
+
+def get_ijson_backend(name=None):
+    '''
+    Return the ijson backend module called name, or the fastest installed
+    one for 'auto'. name defaults to the REPRESENTATIVES_IJSON_BACKEND
+    setting, and to 'auto' when it is not set. When the requested backend
+    is not installed, the fastest installed one is used instead.
+    '''
+    if name is None:
+        name = getattr(settings, 'REPRESENTATIVES_IJSON_BACKEND', 'auto')
+
+    names = IJSON_BACKENDS
+    if name != 'auto':
+        names = (name,) + IJSON_BACKENDS
+
+    for candidate in names:
+        try:
+            backend = importlib.import_module('ijson.backends.' + candidate)
+        except ImportError:
+            if candidate == name:
+                logger.warning('ijson backend %s is not available', name)
+            continue
+
+        logger.info('Parsing with ijson backend %s', candidate)
+        return backend
+
+    raise ImportError('No ijson backend available')
+
+
+def _project_events(events, keys):
+    depth = 0
+    builder = None
+    for event, value in events:
+        if event == 'map_key' and depth == 2:
+            if keys is None or value in keys:
+                builder.event(event, value)
+                continue
+
+            # Skip the value of this key without building it
+            nested = 0
+            for event, value in events:
+                if event == 'start_map' or event == 'start_array':
+                    nested += 1
+                elif event == 'end_map' or event == 'end_array':
+                    nested -= 1
+                if nested == 0:
+                    break
+            continue
+
+        if event == 'start_map' or event == 'start_array':
+            depth += 1
+            if depth == 2:
+                builder = ObjectBuilder()
+        elif event == 'end_map' or event == 'end_array':
+            depth -= 1
+            if depth == 1:
+                builder.event(event, value)
+                yield builder.value
+                builder = None
+                continue
+        elif depth == 1:
+            yield value
+            continue
+
+        if builder is not None:
+            builder.event(event, value)
+
+
+def _skip_events(events, count):
+    # Drop the events of the first count items of the top-level array
+    depth = 0
+    skipped = 0
+    for event, value in events:
+        if event == 'start_map' or event == 'start_array':
+            depth += 1
+        elif event == 'end_map' or event == 'end_array':
+            depth -= 1
+
+        if skipped < count and depth > 0 and not (
+                depth == 1 and event == 'start_array'):
+            if depth == 1:
+                skipped += 1
+            continue
+
+        yield event, value
+
+
+def project_items(backend, stream, keys=None, skip=0):
+    '''
+    Iterate over the objects of the top-level array of stream, keeping only
+    the given keys, or all of them if keys is None. Values of other keys are
+    skipped at the parser event level without being built, except with
+    backends that build objects in C where they are dropped after parsing.
+
+    The first skip objects are skipped at the event level, with any backend.
+    '''
+    if keys is not None:
+        keys = frozenset(keys)
+
+    native = backend.__name__.rsplit('.', 1)[-1] in NATIVE_ITEMS_BACKENDS
+    if native and not skip:
+        for item in backend.items(stream, 'item'):
+            if keys is not None and isinstance(item, dict):
+                for key in [k for k in item if k not in keys]:
+                    del item[key]
+            yield item
+    else:
+        events = backend.basic_parse(stream)
+        if skip:
+            events = _skip_events(events, skip)
+        for item in _project_events(events, keys):
+            yield item
+
+
+# Size of the head of dumps identifying them, see fingerprint_stream()
+DUMP_DIGEST_SIZE = 1 << 16
+
+
+class _ReplayStream(object):
+    '''
+    File-like object reading head, then the rest of stream
+    '''
+
+    def __init__(self, head, stream):
+        self.head = head
+        self.stream = stream
+
+    def read(self, size=-1):
+        if not self.head:
+            return self.stream.read(size)
+
+        if size is None or size < 0:
+            data, self.head = self.head + self.stream.read(), ''
+        else:
+            data, self.head = self.head[:size], self.head[size:]
+        return data
+
+
+def _file_stat(stream):
+    '''
+    Return the stat of the regular file stream reads, or None for pipes,
+    sockets and in-memory streams
+    '''
+    try:
+        status = os.fstat(stream.fileno())
+    except (AttributeError, EnvironmentError, ValueError):
+        return None
+    return status if stat.S_ISREG(status.st_mode) else None
+
+
+def fingerprint_stream(stream):
+    '''
+    Return a digest identifying the dump stream reads, and a stream reading
+    the whole dump again. The digest covers the head of the dump with the
+    size and modification time of its file, consecutive dumps may begin
+    with the same bytes; it is empty when stream does not read a regular
+    file, as dumps piped to the importers cannot be identified.
+    '''
+    head = stream.read(DUMP_DIGEST_SIZE)
+    status = _file_stat(stream)
+    if status is None:
+        digest = ''
+    else:
+        digest = hashlib.sha1(b'%s\0%d\0%d' % (
+            head, status.st_size, status.st_mtime)).hexdigest()
+    return digest, _ReplayStream(head, stream)
+
+
+def chunked(iterable, size):
+    '''
+    Yield successive lists of at most size items from iterable
+    '''
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _pk_token(value):
+    '''
+    Hashable identity of a lookup value; unsaved model instances are
+    identified by their python id until they get a primary key
+    '''
+    if isinstance(value, Model):
+        if value.pk is None:
+            return ('new', id(value))
+        return value.pk
+    return value
+
+
+def _instance_token(instance, name):
+    field = instance._meta.get_field(name)
+    if not field.is_relation:
+        return getattr(instance, name)
+
+    cache = field.get_cache_name()
+    if hasattr(instance, cache):
+        return _pk_token(getattr(instance, cache))
+    return getattr(instance, field.attname)
+
+
+class _Cast(Func):
+    template = 'CAST(%(expressions)s AS %(db_type)s)'
+
+
+def bulk_update(model, instances, fields, batch_size=500):
+    '''
+    Update fields of instances with one UPDATE ... CASE statement per chunk
+    '''
+    connection = connections[router.db_for_write(model)]
+    cast = connection.vendor == 'postgresql'
+
+    for chunk in chunked(instances, batch_size):
+        changes = {}
+        for name in fields:
+            field = model._meta.get_field(name)
+            whens = []
+            for instance in chunk:
+                value = Value(getattr(instance, field.attname),
+                              output_field=field)
+                if cast:
+                    value = _Cast(value, output_field=field,
+                                  db_type=field.db_type(connection))
+                whens.append(When(pk=instance.pk, then=value))
+            changes[name] = Case(*whens, output_field=field)
+
+        model.objects.filter(pk__in=[i.pk for i in chunk]).update(**changes)
+
+
+def touch_rows(model, pks, now=None, batch_size=500):
+    '''
+    Move the updated timestamp of the given rows forward without loading them
+    '''
+    now = now or timezone.now()
+    for chunk in chunked(sorted(pks), batch_size):
+        model.objects.filter(pk__in=chunk).update(updated=now)
+    stats.count(model, 'touched', len(pks))
+
+
+def import_records(records, manage, commit_every=0, on_commit=None,
+                   checkpoint_every=100):
+    '''
+    Import records one by one with manage(record), which must be atomic.
+
+    By default each record is committed on its own. With commit_every,
+    records are committed commit_every at a time: each record then runs in
+    its own savepoint, so that a failing record is logged and rolled back
+    alone. Return the number of records that failed.
+
+    on_commit(failed) is called with the number of records that failed so
+    far after each chunk of commit_every records was committed, or every
+    checkpoint_every records by default.
+    '''
+    if not commit_every:
+        for index, record in enumerate(records, 1):
+            manage(record)
+            if on_commit is not None and index % checkpoint_every == 0:
+                on_commit(0)
+        return 0
+
+    failed = 0
+    for chunk in chunked(records, commit_every):
+        with transaction.atomic():
+            for record in chunk:
+                try:
+                    manage(record)
+                except Exception:
+                    failed += 1
+                    logger.exception('Could not import record')
+
+        if on_commit is not None:
+            on_commit(failed)
+
+    return failed
+
+
+class ImportStats(object):
+    '''
+    Timings, query counts and row counts of an import, reported as JSON by
+    the --stats option of the import commands
+
+    Rows written are always counted. Once enable() is called, time spent in
+    the parser and in the details, mandates, contacts and publish (of staged
+    imports) phases is measured, and queries are counted and timed by phase
+    with a cursor wrapper; queries run outside of phases are accounted to
+    'other'.
+    '''
+
+    phases = ('details', 'mandates', 'contacts', 'publish', 'other')
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.enabled = False
+        self.started = time.time()
+        self.records = 0
+        self.parse = 0.
+        self.times = defaultdict(float)
+        self.db = defaultdict(float)
+        self.queries = defaultdict(int)
+        self.rows = defaultdict(lambda: defaultdict(int))
+        # Queries and database time since the last phase change
+        self.pending = [0, 0.]
+
+    def enable(self, using='default'):
+        self.reset()
+        self.enabled = True
+        self.connection = connections[using]
+        # Cursors are only wrapped by make_debug_cursor() when forced
+        self.debug_cursor = self.connection.force_debug_cursor
+        self.connection.force_debug_cursor = True
+        self.connection.make_debug_cursor = lambda cursor: _TimedCursor(
+            cursor, self.connection, self)
+
+    def disable(self):
+        if self.enabled:
+            self._drain('other')
+            del self.connection.make_debug_cursor
+            self.connection.force_debug_cursor = self.debug_cursor
+            self.enabled = False
+
+    def count(self, model, action, rows=1):
+        '''
+        Count rows of model inserted, updated, upserted, touched or deleted
+        '''
+        if rows:
+            self.rows[model._meta.object_name][action] += rows
+
+    def query(self, duration):
+        self.pending[0] += 1
+        self.pending[1] += duration
+
+    def _drain(self, phase):
+        self.queries[phase] += self.pending[0]
+        self.db[phase] += self.pending[1]
+        self.pending = [0, 0.]
+
+    @contextmanager
+    def phase(self, name):
+        '''
+        Account time and queries of the block to phase name
+        '''
+        if not self.enabled:
+            yield
+            return
+
+        self._drain('other')
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.times[name] += time.time() - start
+            self._drain(name)
+
+    def timed(self, records, progress=0):
+        '''
+        Iterate over records measuring time spent reading them, and log a
+        progress line every progress records
+        '''
+        records = iter(records)
+        while True:
+            start = time.time()
+            try:
+                record = next(records)
+            except StopIteration:
+                return
+            finally:
+                self.parse += time.time() - start
+            self.records += 1
+            if progress and self.records % progress == 0:
+                logger.info(self.progress())
+            yield record
+
+    def progress(self):
+        elapsed = time.time() - self.started
+        line = '%s records in %.1fs, %.1f records/s' % (
+            self.records, elapsed, self.records / max(elapsed, 1e-6))
+        if self.enabled:
+            self._drain('other')
+            line += ', %.1f queries/record' % (
+                sum(self.queries.values()) / float(max(self.records, 1)))
+        return line
+
+    def summary(self, run=None):
+        '''
+        Return the statistics collected since enable() as a dict
+        '''
+        if self.enabled:
+            self._drain('other')
+
+        queries = sum(self.queries.values())
+        phases = {}
+        for name in self.phases:
+            phases[name] = {'time': round(self.times[name], 6),
+                            'db': round(self.db[name], 6),
+                            'queries': self.queries[name]}
+
+        summary = {
+            'records': self.records,
+            'elapsed': round(time.time() - self.started, 6),
+            'parse': round(self.parse, 6),
+            'transform': round(sum(self.times[name] - self.db[name]
+                                   for name in self.phases[:-1]), 6),
+            'db': round(sum(self.db.values()), 6),
+            'phases': phases,
+            'queries': queries,
+            'queries_per_record': round(
+                queries / float(max(self.records, 1)), 3),
+            'rows': {model: dict(actions)
+                     for model, actions in self.rows.items()},
+            'peak_rss_kb': peak_rss(),
+        }
+
+        if run is not None:
+            summary.update(run=run.pk, source=run.source, failed=run.failed,
+                           complete=run.complete)
+        return summary
+
+    def report(self, run=None, stream=None):
+        '''
+        Write the summary as JSON to stream, stdout by default
+        '''
+        stream = stream or sys.stdout
+        stream.write(json.dumps(self.summary(run), sort_keys=True) + '\n')
+        self.disable()
+
+
+class _TimedCursor(CursorWrapper):
+    '''
+    Cursor reporting the number and duration of its queries to ImportStats
+    '''
+
+    def __init__(self, cursor, db, stats):
+        super(_TimedCursor, self).__init__(cursor, db)
+        self.stats = stats
+
+    def execute(self, sql, params=None):
+        start = time.time()
+        try:
+            return super(_TimedCursor, self).execute(sql, params)
+        finally:
+            self.stats.query(time.time() - start)
+
+    def executemany(self, sql, param_list):
+        start = time.time()
+        try:
+            return super(_TimedCursor, self).executemany(sql, param_list)
+        finally:
+            self.stats.query(time.time() - start)
+
+
+def peak_rss():
+    '''
+    Return the peak resident set size of the process in kilobytes, or None
+    where the resource module is not available
+    '''
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on OS X, kilobytes on Linux
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+
+# Statistics of the import running in this process
+stats = ImportStats()
+
+
+def delete_rows(model, pks, batch_size=500):
+    '''
+    Delete rows by chunks of primary keys. Rows are deleted without being
+    loaded unless models of other applications refer to them or delete
+    signals are connected, in which case Django collects them to honour
+    cascades and signals. Rows of this application referring to deleted
+    rows must have been deleted before. Search documents of deleted rows
+    are deleted with them.
+    '''
+    external = [
+        related for related in model._meta.related_objects
+        if related.related_model._meta.app_label != model._meta.app_label
+    ]
+    # Search documents are deleted by chunk below
+    receivers = [
+        receiver for signal in (pre_delete, post_delete)
+        for receiver in signal._live_receivers(model)
+        if receiver is not delete_search_document
+    ]
+    collect = external or receivers
+    kind = model._meta.model_name
+
+    for chunk in chunked(pks, batch_size):
+        rows = model._base_manager.filter(pk__in=chunk)
+        if collect:
+            rows.delete()
+        else:
+            rows._raw_delete(rows.db)
+        if kind in SearchDocumentQuerySet.fields:
+            documents = SearchDocument.objects.filter(kind=kind,
+                                                      object_id__in=chunk)
+            documents._raw_delete(documents.db)
+    stats.count(model, 'deleted', len(pks))
+
+
+def sweep_rows(queryset, batch_size=500):
+    '''
+    Delete the rows matched by queryset, see delete_rows()
+    '''
+    pks = list(queryset.values_list('pk', flat=True))
+    delete_rows(queryset.model, pks, batch_size)
+    return len(pks)
+
+
+def resolve_relations(instances):
+    '''
+    Copy primary keys of related instances, which may have been saved since
+    assignment, to foreign key columns
+    '''
+    for instance in instances:
+        for field in instance._meta.concrete_fields:
+            cache = field.get_cache_name() if field.is_relation else None
+            if cache and getattr(instance, cache, None) is not None:
+                setattr(instance, field.attname, getattr(instance, cache).pk)
+
+
+# ON CONFLICT target of mandates, matching their natural key index created
+# by migration 0025
+MANDATE_CONFLICT_INDEX = 'representatives_mandate_natural_key'
+MANDATE_CONFLICT_TARGET = (
+    "representative_id, COALESCE(group_id, 0), COALESCE(constituency_id, 0), "
+    "role, COALESCE(begin_date, '0001-01-01'), "
+    "COALESCE(end_date, '0001-01-01')")
+
+MANDATE_KEY = ('representative_id', 'group_id', 'constituency_id', 'role',
+               'begin_date', 'end_date')
+
+
+def index_exists(connection, name):
+    '''
+    Return True if the database has an index called name
+    '''
+    if connection.vendor == 'sqlite':
+        sql = "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = %s"
+    else:
+        sql = 'SELECT 1 FROM pg_indexes WHERE indexname = %s'
+    cursor = connection.cursor()
+    cursor.execute(sql, [name])
+    return cursor.fetchone() is not None
+
+
+def upsert_rows(model, instances, key, index, target, now=None):
+    '''
+    Insert instances in bulk without looking them up first. Rows conflicting
+    with the unique index called index on target, the SQL expressions
+    indexing the key columns, only have their updated field moved forward:
+
+    - INSERT ... ON CONFLICT (target) DO UPDATE on PostgreSQL and SQLite
+      3.24+,
+    - INSERT OR IGNORE then an UPDATE of rows matching key on older SQLite,
+    - one lookup per row on other databases, or when the index is missing.
+    '''
+    now = now or timezone.now()
+    connection = connections[router.db_for_write(model)]
+    fields = [f for f in model._meta.concrete_fields if not f.primary_key]
+    columns = ', '.join(connection.ops.quote_name(f.column) for f in fields)
+    table = connection.ops.quote_name(model._meta.db_table)
+
+    rows = {}
+    for instance in instances:
+        instance.created = instance.updated = now
+        prepared = tuple(f.get_db_prep_save(getattr(instance, f.attname),
+                                            connection) for f in fields)
+        # A statement may not update the same row twice
+        rows.setdefault(tuple(getattr(instance, k) for k in key), prepared)
+    rows = list(rows.values())
+    stats.count(model, 'upserted', len(rows))
+
+    vendor = connection.vendor
+    indexed = vendor in ('postgresql', 'sqlite')
+    if indexed and not index_exists(connection, index):
+        # SQLite drops it when a migration remakes the table
+        logger.warning('Index %s is missing, looking up %s one by one',
+                       index, model._meta.verbose_name_plural)
+        indexed = False
+    native = indexed and (vendor == 'postgresql' or
+                          connection.Database.sqlite_version_info >=
+                          (3, 24, 0))
+
+    if not indexed:
+        for instance in instances:
+            updated = model._base_manager.filter(
+                **{k: getattr(instance, k) for k in key}).update(updated=now)
+            if not updated:
+                instance.save()
+        return
+
+    batch_size = max(connection.ops.bulk_batch_size(fields, rows), 1)
+    placeholders = '(%s)' % ', '.join(['%s'] * len(fields))
+    cursor = connection.cursor()
+    for batch in chunked(rows, batch_size):
+        values = ', '.join([placeholders] * len(batch))
+        params = [value for row in batch for value in row]
+        if native:
+            cursor.execute(
+                'INSERT INTO %s (%s) VALUES %s ON CONFLICT (%s) DO UPDATE '
+                'SET updated = excluded.updated' % (
+                    table, columns, values, target), params)
+        else:
+            cursor.execute('INSERT OR IGNORE INTO %s (%s) VALUES %s' % (
+                table, columns, values), params)
+
+    if not native:
+        # IS compares NULLs as equal on SQLite
+        attnames = [f.attname for f in fields]
+        index = [attnames.index(k) for k in key]
+        stamp = rows and rows[0][attnames.index('updated')]
+        cursor.executemany(
+            'UPDATE %s SET updated = %%s WHERE updated < %%s AND %s' % (
+                table, ' AND '.join('%s IS %%s' % k for k in key)),
+            [[stamp, stamp] + [row[i] for i in index] for row in rows])
+
+
+class IdentityMap(object):
+    '''
+    In-memory set of instances of a model, looked up by whatever combination
+    of fields the importer uses as natural key
+    '''
+
+    def __init__(self, model, refetch_field):
+        self.model = model
+        self.refetch_field = refetch_field
+        self.clear()
+
+    def clear(self):
+        self.instances = []
+        self.indexes = {}
+        self.pending = []
+        self.dirty = []
+        self.touched = set()
+
+    def load(self, instances):
+        for instance in instances:
+            self.add(instance)
+
+    def add(self, instance):
+        self.instances.append(instance)
+        for fields, index in self.indexes.items():
+            index.setdefault(self._key(instance, fields), instance)
+
+    def _key(self, instance, fields):
+        return tuple(_instance_token(instance, f) for f in fields)
+
+    def _index(self, fields):
+        if fields not in self.indexes:
+            index = {}
+            for instance in self.instances:
+                index.setdefault(self._key(instance, fields), instance)
+            self.indexes[fields] = index
+        return self.indexes[fields]
+
+    def find(self, **data):
+        fields = tuple(sorted(data))
+        key = tuple(_pk_token(data[f]) for f in fields)
+        return self._index(fields).get(key)
+
+    def create(self, **data):
+        instance = self.model(**data)
+        self.pending.append(instance)
+        self.add(instance)
+        return instance
+
+    def mark_dirty(self, instance):
+        if instance.pk is None:
+            if instance not in self.pending:
+                self.pending.append(instance)
+                self.add(instance)
+        elif not any(i is instance for i in self.dirty):
+            self.dirty.append(instance)
+        # Natural key fields may have changed
+        self.indexes = {}
+
+    def flush(self, now):
+        if hasattr(self.model, 'folded_fields'):
+            for instance in self.pending + self.dirty:
+                fold_names(instance)
+        if self.pending:
+            self.resolve_relations()
+            self.model.objects.bulk_create(self.pending)
+            stats.count(self.model, 'inserted', len(self.pending))
+            if self.refetch_field:
+                self._fetch_pending_pks()
+        if self.dirty:
+            fields = [f.name for f in self.model._meta.concrete_fields
+                      if not f.primary_key and f.name != 'created']
+            for instance in self.dirty:
+                instance.updated = now
+            bulk_update(self.model, self.dirty, fields)
+            stats.count(self.model, 'updated', len(self.dirty))
+        if self.touched:
+            touch_rows(self.model, self.touched, now)
+        if self.model._meta.model_name in SearchDocumentQuerySet.fields:
+            written = [i.pk for i in self.pending + self.dirty
+                       if i.pk is not None]
+            stats.count(SearchDocument, 'updated',
+                        SearchDocument.objects.rebuild(self.model, written))
+
+        self.pending = []
+        self.dirty = []
+        self.touched = set()
+        # Primary keys of pending instances changed
+        self.indexes = {}
+
+    def resolve_relations(self):
+        resolve_relations(self.pending)
+
+    def _fetch_pending_pks(self):
+        # bulk_create does not set primary keys, fetch them back by key
+        field = self.model._meta.get_field(self.refetch_field)
+        known = set(i.pk for i in self.instances if i.pk is not None)
+        lookup = set(getattr(i, field.attname) for i in self.pending)
+        fields = tuple(f.attname for f in self.model._meta.concrete_fields
+                       if not f.primary_key and
+                       f.name not in ('created', 'updated'))
+
+        candidates = {}
+        for chunk in chunked(lookup, 500):
+            rows = self.model.objects.filter(
+                **{'%s__in' % field.attname: chunk}).exclude(pk__in=known)
+            for row in rows.values_list('pk', *fields):
+                candidates.setdefault(row[1:], []).append(row[0])
+
+        for instance in self.pending:
+            key = tuple(getattr(instance, f) for f in fields)
+            if key in candidates and candidates[key]:
+                instance.pk = candidates[key].pop(0)
+
+
+class BatchWriter(object):
+    '''
+    Unit of work for batched imports: lookups are served from identity maps
+    and writes are queued until flush(), which issues bulk statements model
+    by model in foreign key order
+    '''
+
+    def __init__(self, import_start_datetime, models):
+        self.import_start_datetime = import_start_datetime
+        self.maps = [IdentityMap(model, field) for model, field in models]
+        self.by_model = {m.model: m for m in self.maps}
+
+    def load(self, model, instances):
+        self.by_model[model].load(instances)
+
+    def clear(self, *models):
+        for model in models:
+            self.by_model[model].clear()
+
+    def get(self, model, **data):
+        instance = self.by_model[model].find(**data)
+        if instance is None:
+            raise model.DoesNotExist()
+        return instance
+
+    def get_or_create(self, model, **data):
+        identity_map = self.by_model[model]
+        instance = identity_map.find(**data)
+        if instance is not None:
+            return (instance, False)
+        return (identity_map.create(**data), True)
+
+    def save(self, instance):
+        self.by_model[type(instance)].mark_dirty(instance)
+
+    def touch(self, instance):
+        if instance.pk is not None and \
+                instance.updated < self.import_start_datetime:
+            self.by_model[type(instance)].touched.add(instance.pk)
+
+    def flush(self):
+        now = timezone.now()
+        for identity_map in self.maps:
+            identity_map.flush(now)
+
+
+class DryRunWriter(BatchWriter):
+    '''
+    BatchWriter recording the rows flush() would insert and update in a
+    Changeset instead of writing them; created rows keep no primary key
+    '''
+
+    def __init__(self, import_start_datetime, models, changeset):
+        super(DryRunWriter, self).__init__(import_start_datetime, models)
+        self.changeset = changeset
+        # id of loaded instance -> its field values when loaded
+        self.original = {}
+
+    def load(self, model, instances):
+        instances = list(instances)
+        for instance in instances:
+            self.original[id(instance)] = instance.__dict__.copy()
+        super(DryRunWriter, self).load(model, instances)
+
+    def clear(self, *models):
+        for model in models:
+            for instance in self.by_model[model].instances:
+                self.original.pop(id(instance), None)
+        super(DryRunWriter, self).clear(*models)
+
+    def flush(self):
+        for identity_map in self.maps:
+            for instance in identity_map.pending:
+                self.changeset.add('created', instance)
+            for instance in identity_map.dirty:
+                self.changeset.add('updated', instance,
+                                   self.original.get(id(instance)))
+
+            identity_map.pending = []
+            identity_map.dirty = []
+            identity_map.touched = set()
+
+
+class StagingWriter(BatchWriter):
+    '''
+    BatchWriter of staged imports: representatives and digests are loaded
+    into Staging tables instead, and groups and constituencies are only
+    written by publish(), in the transaction publishing the staging tables
+    '''
+
+    staged = (Representative, RecordDigest)
+
+    def flush(self):
+        for model in self.staged:
+            identity_map = self.by_model[model]
+            identity_map.pending = []
+            identity_map.dirty = []
+            identity_map.touched = set()
+
+    def publish(self):
+        now = timezone.now()
+        for identity_map in self.maps:
+            if identity_map.model not in self.staged:
+                identity_map.flush(now)
+
+
+class Changeset(object):
+    '''
+    Rows an import would create, update, or leave stale for --sweep to
+    delete, computed by dry runs without writing. Rows are identified by
+    their natural key, see key().
+    '''
+
+    # Fields identifying rows of these models, rows of other models are
+    # identified by all their fields
+    natural_keys = {
+        Chamber: ('abbreviation',),
+        Constituency: ('name',),
+        Country: ('code',),
+        Group: ('kind', 'abbreviation', 'name', 'chamber'),
+        Representative: ('slug',),
+    }
+
+    # Bookkeeping models left out
+    ignored = (RecordDigest,)
+
+    def __init__(self, source):
+        self.source = source
+        self.unchanged = 0
+        # Slugs of representatives read from the dump
+        self.seen = set()
+        # {model name: {action: {dumped key: entry}}}
+        self.changes = defaultdict(lambda: defaultdict(OrderedDict))
+
+    def key(self, instance):
+        '''
+        Return the natural key of instance as a dict, related rows are
+        represented by their own natural key when they are cached
+        '''
+        model = type(instance)
+        names = self.natural_keys.get(model)
+        key = {}
+        for field in model._meta.concrete_fields:
+            if field.primary_key or field.name in ('created', 'updated') or \
+                    (names and field.name not in names):
+                continue
+
+            related = None
+            if field.is_relation:
+                related = getattr(instance, field.get_cache_name(), None)
+            if related is not None:
+                key[field.name] = self.key(related)
+            else:
+                key[field.attname] = getattr(instance, field.attname)
+        return key
+
+    def add(self, action, instance, original=None):
+        '''
+        Record instance as created, updated or stale; updates list the
+        fields that differ from original, a dict of attribute values
+        '''
+        model = type(instance)
+        if model in self.ignored:
+            return
+
+        key = self.key(instance)
+        dumped = json.dumps(key, sort_keys=True, default=unicode)
+        entries = self.changes[model._meta.object_name][action]
+        entry = entries.setdefault(dumped, {'key': key})
+
+        if original is not None:
+            resolve_relations([instance])
+            changes = entry.setdefault('changes', {})
+            for field in model._meta.concrete_fields:
+                old = original.get(field.attname)
+                new = getattr(instance, field.attname)
+                if field.name not in ('created', 'updated') and old != new:
+                    changes[field.name] = [
+                        changes.get(field.name, [old])[0], new]
+
+    def summary(self):
+        return {model: {action: len(entries)
+                        for action, entries in actions.items()}
+                for model, actions in self.changes.items()}
+
+    def report(self, run, full=False, stream=None):
+        '''
+        Write the changeset as JSON to stream, stdout by default: counts of
+        rows by model and action, and the rows themselves when full
+        '''
+        changeset = {
+            'source': self.source,
+            'records': run.records,
+            'unchanged': self.unchanged,
+            'summary': self.summary(),
+        }
+        if full:
+            changeset['changes'] = {
+                model: {action: list(entries.values())
+                        for action, entries in actions.items()}
+                for model, actions in self.changes.items()}
+
+        stream = stream or sys.stdout
+        stream.write(json.dumps(changeset, sort_keys=True, indent=1,
+                                default=unicode) + '\n')
+
+
+class ContactSync(object):
+    '''
+    Contacts read from records, synced with the existing contacts of their
+    representatives by set difference: apply() inserts missing rows, keeps
+    rows still listed and deletes the others, with a constant number of
+    bulk queries per call
+    '''
+
+    models = (Address, Phone, Email, WebSite)
+
+    # Fields not part of the natural key of contacts
+    excluded = ('id', 'representative', 'address', 'created', 'updated')
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.representatives = []
+        self.contacts = []
+
+    def _key(self, instance, address=None):
+        return (type(instance), address) + tuple(
+            getattr(instance, f.attname)
+            for f in instance._meta.concrete_fields
+            if f.name not in self.excluded)
+
+    def add(self, representative, model, **data):
+        '''
+        Add a contact of representative and return its key, to be passed as
+        address of phones
+        '''
+        address = data.pop('address', None)
+        instance = model(**data)
+        key = self._key(instance, address)
+        if not any(r is representative for r in self.representatives):
+            self.representatives.append(representative)
+        self.contacts.append((representative, key, instance))
+        return key
+
+    def _existing(self, pks):
+        # {representative pk: {key: [rows]}}, phones are keyed on the key
+        # of their address
+        existing = defaultdict(lambda: defaultdict(list))
+        addresses = {}
+        for model in self.models:
+            rows = []
+            for chunk in chunked(pks, 500):
+                rows.extend(model.objects.select_related(None).filter(
+                    representative_id__in=chunk))
+            for row in rows:
+                address_id = getattr(row, 'address_id', None)
+                key = self._key(row, addresses.get(address_id, address_id))
+                if model is Address:
+                    addresses[row.pk] = key
+                existing[row.representative_id][key].append(row)
+        return existing
+
+    def _plan(self):
+        # Return (primary keys of kept rows, (key, instance) to insert and
+        # rows to delete) by model
+        existing = self._existing([r.pk for r in self.representatives
+                                   if r.pk is not None])
+
+        kept = defaultdict(set)
+        inserted = defaultdict(list)
+        seen = set()
+        # Addresses first, phones are only kept with their address
+        contacts = sorted(self.contacts, key=lambda c: c[1][0] is Phone)
+        for representative, key, instance in contacts:
+            owner = _pk_token(representative)
+            if (owner, key) in seen:
+                continue
+            seen.add((owner, key))
+
+            rows = [r for r in existing[representative.pk].get(key, [])
+                    if getattr(r, 'address_id', None) is None or
+                    r.address_id in kept[Address]]
+            if rows:
+                kept[key[0]].add(rows[0].pk)
+            else:
+                instance.representative = representative
+                inserted[key[0]].append((key, instance))
+
+        # Rows not kept are no longer listed or duplicates
+        removed = defaultdict(list)
+        for rows in existing.values():
+            for key, matches in rows.items():
+                removed[key[0]].extend(row for row in matches
+                                       if row.pk not in kept[key[0]])
+        return kept, inserted, removed
+
+    def diff(self, changeset):
+        '''
+        Record contacts added since the last call that apply() would insert
+        and delete in changeset, without writing
+        '''
+        kept, inserted, removed = self._plan()
+        representatives = {r.pk: r for r in self.representatives}
+        for model in self.models:
+            for key, instance in inserted[model]:
+                changeset.add('created', instance)
+            for row in removed[model]:
+                row.representative = representatives[row.representative_id]
+                changeset.add('stale', row)
+        self.clear()
+
+    def apply(self):
+        '''
+        Sync contacts added since the last call, representatives must have
+        been saved. Return primary keys of kept rows by model.
+        '''
+        pks = [r.pk for r in self.representatives]
+        kept, inserted, removed = self._plan()
+        for model in (Phone, Address, Email, WebSite):
+            delete_rows(model, [row.pk for row in removed[model]])
+
+        for model in (Address, Email, WebSite):
+            if inserted[model]:
+                model.objects.bulk_create([i for k, i in inserted[model]])
+                stats.count(model, 'inserted', len(inserted[model]))
+
+        phones = inserted[Phone]
+        if any(k[1] is not None for k, i in phones):
+            # bulk_create does not set primary keys, fetch them back
+            new = set(k for k, i in inserted[Address])
+            addresses = {}
+            for chunk in chunked(pks, 500):
+                for row in Address.objects.select_related(None).filter(
+                        representative_id__in=chunk):
+                    key = self._key(row)
+                    if row.pk in kept[Address] or key in new:
+                        addresses[(row.representative_id, key)] = row.pk
+            for key, instance in phones:
+                if key[1] is not None:
+                    instance.address_id = addresses[
+                        (instance.representative_id, key[1])]
+        if phones:
+            Phone.objects.bulk_create([i for k, i in phones])
+            stats.count(Phone, 'inserted', len(phones))
+
+        self.clear()
+        return kept
+
+
+def _copy_value(value):
+    # Text format of COPY ... FROM STDIN
+    if value is None:
+        return u'\\N'
+    if isinstance(value, bool):
+        return u't' if value else u'f'
+    return unicode(value).replace(u'\\', u'\\\\').replace(
+        u'\t', u'\\t').replace(u'\n', u'\\n').replace(u'\r', u'\\r')
+
+
+def _null_safe(field, column):
+    # Nullable columns are coalesced like in the natural key index of
+    # mandates, so that NULLs compare equal
+    if field is not None and not field.null:
+        return column
+    if field is not None and field.get_internal_type() == 'DateField':
+        sentinel = "'0001-01-01'"
+    elif field is None or field.is_relation or \
+            'Integer' in field.get_internal_type():
+        sentinel = '0'
+    else:
+        sentinel = "''"
+    return 'COALESCE(%s, %s)' % (column, sentinel)
+
+
+class Staging(object):
+    '''
+    Temporary tables the rows of an import are bulk loaded into, with COPY
+    on PostgreSQL and executemany on other databases, before publish()
+    reconciles the live tables with them using set-based statements
+
+    Staged rows refer to their representative by slug, and to groups and
+    constituencies created by the import by negative references until
+    StagingWriter.publish() inserts them.
+    '''
+
+    contact_models = ContactSync.models
+
+    def __init__(self, source, detail_fields, using='default'):
+        self.source = source
+        self.detail_fields = detail_fields
+        self.connection = connections[using]
+        # id of unsaved instance -> (reference, instance)
+        self.refs = {}
+        # (slug, key of address) -> reference of staged address
+        self.addresses = {}
+        # Slugs of staged representatives and (slug, key) of contacts
+        self.seen = set()
+
+        slug = ('slug', Representative._meta.get_field('slug'))
+        self.columns = OrderedDict()
+        self.columns[Representative] = [slug] + [
+            (name, Representative._meta.get_field(name))
+            for name in detail_fields]
+        self.columns[RecordDigest] = [
+            slug, ('digest', RecordDigest._meta.get_field('digest'))]
+
+        # Columns matching staged rows of representatives with live ones
+        self.keys = {}
+        for model in (Mandate,) + self.contact_models:
+            fields = [(f.column, f) for f in model._meta.concrete_fields
+                      if f.name not in ContactSync.excluded or
+                      f.name == 'address']
+            self.columns[model] = [slug, ('representative_id', None)] + \
+                fields
+            self.keys[model] = [(c, f) for c, f in fields
+                                if model is not Mandate or c in MANDATE_KEY]
+        self.columns[Address].append(('ref', None))
+        self.columns[Phone].append(('address_ref', None))
+        # Primary keys of the rows behind references
+        self.columns[None] = [('ref', None), ('id', None)]
+
+        cursor = self.connection.cursor()
+        for model, columns in self.columns.items():
+            table = self.table(model)
+            cursor.execute('DROP TABLE IF EXISTS %s' % table)
+            cursor.execute('CREATE TEMPORARY TABLE %s (%s)' % (
+                table, ', '.join(
+                    '%s %s' % (self.qn(column), 'integer' if field is None
+                               else field.db_type(self.connection))
+                    for column, field in columns)))
+
+    def qn(self, name):
+        return self.connection.ops.quote_name(name)
+
+    def table(self, model):
+        return self.qn('staging_%s' % (
+            'ref' if model is None else model._meta.db_table))
+
+    def ref(self, instance):
+        '''
+        Return the primary key of instance, or a negative reference to it
+        while it is not saved
+        '''
+        if instance is None or instance.pk is not None:
+            return instance and instance.pk
+        if id(instance) not in self.refs:
+            self.refs[id(instance)] = (-len(self.refs) - 1, instance)
+        return self.refs[id(instance)][0]
+
+    def _values(self, model, instance, slug):
+        values = [slug, None]
+        for column, field in self.columns[model][2:]:
+            if field is None:
+                values.append(None)
+            elif field.is_relation:
+                related = getattr(instance, field.get_cache_name(), None)
+                values.append(getattr(instance, field.attname)
+                              if related is None else self.ref(related))
+            else:
+                values.append(getattr(instance, field.attname))
+        return values
+
+    def _load(self, model, rows):
+        if not rows:
+            return
+
+        columns = self.columns[model]
+        rows = [[value if field is None or field.is_relation
+                 else field.get_db_prep_save(value, self.connection)
+                 for (column, field), value in zip(columns, row)]
+                for row in rows]
+        table = self.table(model)
+        names = ', '.join(self.qn(column) for column, field in columns)
+
+        cursor = self.connection.cursor()
+        if self.connection.vendor == 'postgresql':
+            data = u''.join(u'\t'.join(_copy_value(v) for v in row) + u'\n'
+                            for row in rows)
+            cursor.copy_expert('COPY %s (%s) FROM STDIN' % (table, names),
+                               BytesIO(data.encode('utf-8')))
+        else:
+            cursor.executemany('INSERT INTO %s (%s) VALUES (%s)' % (
+                table, names, ', '.join(['%s'] * len(columns))), rows)
+
+    def add_representatives(self, imported):
+        '''
+        Stage representatives with the digests of their records, imported
+        is a list of (slug, digest, representative)
+        '''
+        representatives, digests = [], []
+        for slug, digest, representative in imported:
+            if slug in self.seen:
+                continue
+            self.seen.add(slug)
+            representatives.append([slug] + [
+                getattr(representative, name) for name in self.detail_fields])
+            digests.append([slug, digest])
+        self._load(Representative, representatives)
+        self._load(RecordDigest, digests)
+
+    def add_mandates(self, mandates):
+        self._load(Mandate, [
+            self._values(Mandate, mandate, mandate.representative.slug)
+            for mandate in mandates])
+
+    def add_contacts(self, contacts):
+        '''
+        Stage contacts queued by a ContactSync, phones refer to the staged
+        row of their address
+        '''
+        rows = defaultdict(list)
+        # Addresses first, for phones to find their reference
+        for representative, key, instance in sorted(
+                contacts, key=lambda c: c[1][0] is Phone):
+            slug = representative.slug
+            if (slug, key) in self.seen:
+                continue
+            self.seen.add((slug, key))
+
+            values = self._values(key[0], instance, slug)
+            if key[0] is Address:
+                values[-1] = len(self.addresses) + 1
+                self.addresses[(slug, key)] = values[-1]
+            elif key[0] is Phone:
+                values[-1] = self.addresses.get((slug, key[1]))
+            rows[key[0]].append(values)
+
+        for model in self.contact_models:
+            self._load(model, rows[model])
+
+    def _match(self, model, left, right):
+        return ' AND '.join(
+            ['%s.representative_id = %s.representative_id' % (left, right)] +
+            ['%s = %s' % (_null_safe(field, '%s.%s' % (left, column)),
+                          _null_safe(field, '%s.%s' % (right, column)))
+             for column, field in self.keys[model]])
+
+    def _execute(self, sql, params=()):
+        cursor = self.connection.cursor()
+        cursor.execute(sql, params)
+        return cursor
+
+    def _insert(self, model, where, now, params=(), **values):
+        # Insert distinct staged rows matching no live row with where, other
+        # fields are set from values or defaults
+        columns = set(f.column for f in model._meta.concrete_fields)
+        staged = [self.qn(column) for column, field in self.columns[model]
+                  if column in columns]
+        names, defaults = [], []
+        for field in model._meta.concrete_fields:
+            if field.primary_key or self.qn(field.column) in staged:
+                continue
+            if field.name in ('created', 'updated'):
+                value = now
+            else:
+                value = values.get(field.name, field.get_default())
+            names.append(self.qn(field.column))
+            defaults.append(field.get_db_prep_save(value, self.connection))
+
+        cursor = self._execute(
+            'INSERT INTO %s (%s) SELECT %s FROM (SELECT DISTINCT %s FROM %s) '
+            's WHERE NOT EXISTS (SELECT 1 FROM %s l WHERE %s)' % (
+                self.qn(model._meta.db_table), ', '.join(staged + names),
+                ', '.join(['s.%s' % c for c in staged] +
+                          ['%s'] * len(names)),
+                ', '.join(staged), self.table(model),
+                self.qn(model._meta.db_table), where),
+            defaults + list(params))
+        stats.count(model, 'inserted', cursor.rowcount)
+
+    def _resolve_addresses(self, missing):
+        # Point staged phones to the first live row of their address,
+        # missing is the id of addresses not inserted yet
+        phones = self.table(Phone)
+        self._execute(
+            'UPDATE %s SET address_id = COALESCE((SELECT MIN(l.id) FROM %s l, '
+            '%s s WHERE s.ref = %s.address_ref AND %s), %%s) '
+            'WHERE address_ref IS NOT NULL' % (
+                phones, self.qn(Address._meta.db_table), self.table(Address),
+                phones, self._match(Address, 'l', 's')), [missing])
+
+    def publish(self):
+        '''
+        Reconcile the live tables with the staging tables, within the
+        transaction of the caller once StagingWriter.publish() inserted
+        groups and constituencies: staged representatives, digests,
+        mandates and contacts are inserted or touched, and contacts of
+        staged representatives that were not staged are deleted. Mandates
+        that were not staged are left to sweep().
+        '''
+        now = timezone.now()
+        self._load(None, [[ref, instance.pk]
+                          for ref, instance in self.refs.values()])
+
+        for model, columns in self.columns.items():
+            if model is not None:
+                self._execute('CREATE INDEX %s ON %s (slug)' % (
+                    self.qn('staging_%s_slug' % model._meta.db_table),
+                    self.table(model)))
+            if self.connection.vendor == 'postgresql':
+                self._execute('ANALYZE %s' % self.table(model))
+
+        representatives = self.qn(Representative._meta.db_table)
+        staged = self.table(Representative)
+        cursor = self._execute(
+            'UPDATE %s SET %s, updated = %%s WHERE slug IN '
+            '(SELECT slug FROM %s)' % (representatives, ', '.join(
+                '%s = (SELECT s.%s FROM %s s WHERE s.slug = %s.slug)' % (
+                    self.qn(name), self.qn(name), staged, representatives)
+                for name in self.detail_fields), staged), [now])
+        stats.count(Representative, 'updated', cursor.rowcount)
+        self._insert(Representative, 'l.slug = s.slug', now)
+        # Folded names and search documents of the staged representatives,
+        # their names were written by SQL
+        written = [row[0] for row in self._execute(
+            'SELECT r.id FROM %s r, %s s WHERE r.slug = s.slug' % (
+                representatives, staged)).fetchall()]
+        for start in range(0, len(written), 500):
+            stats.count(Representative, 'updated',
+                        Representative.objects.filter(
+                            pk__in=written[start:start + 500]).update_folded())
+        stats.count(SearchDocument, 'updated',
+                    SearchDocument.objects.rebuild(Representative, written))
+
+        digests = self.qn(RecordDigest._meta.db_table)
+        staged = self.table(RecordDigest)
+        cursor = self._execute(
+            'UPDATE %s SET digest = (SELECT s.digest FROM %s s WHERE '
+            's.slug = %s.slug), updated = %%s WHERE source = %%s AND slug IN '
+            '(SELECT slug FROM %s)' % (digests, staged, digests, staged),
+            [now, self.source])
+        stats.count(RecordDigest, 'updated', cursor.rowcount)
+        self._insert(RecordDigest, 'l.source = %s AND l.slug = s.slug', now,
+                     [self.source], source=self.source)
+
+        # Rows of representatives point to their primary key from now on
+        for model in (Mandate,) + self.contact_models:
+            table = self.table(model)
+            self._execute(
+                'UPDATE %s SET representative_id = (SELECT r.id FROM %s r '
+                'WHERE r.slug = %s.slug)' % (table, representatives, table))
+            for column, field in self.columns[model]:
+                if field is not None and field.is_relation:
+                    self._execute(
+                        'UPDATE %s SET %s = (SELECT s.id FROM %s s WHERE '
+                        's.ref = %s.%s) WHERE %s < 0' % (
+                            table, column, self.table(None), table, column,
+                            column))
+
+        mandates = self.qn(Mandate._meta.db_table)
+        cursor = self._execute(
+            'UPDATE %s SET updated = %%s WHERE EXISTS (SELECT 1 FROM %s s '
+            'WHERE %s)' % (mandates, self.table(Mandate),
+                           self._match(Mandate, 's', mandates)), [now])
+        stats.count(Mandate, 'touched', cursor.rowcount)
+        self._insert(Mandate, self._match(Mandate, 'l', 's'), now)
+
+        # Phones are deleted before the addresses they may refer to, and
+        # refer to addresses inserted last once they are
+        owned = 'representative_id IN (SELECT r.id FROM %s r, %s s WHERE ' \
+            'r.slug = s.slug)' % (representatives, self.table(Representative))
+        self._resolve_addresses(-1)
+        for model in (Phone, Address, Email, WebSite):
+            table = self.qn(model._meta.db_table)
+            rows = self._execute(
+                'SELECT l.id FROM %s l WHERE l.%s AND (NOT EXISTS (SELECT 1 '
+                'FROM %s s WHERE %s) OR EXISTS (SELECT 1 FROM %s d WHERE '
+                'd.id < l.id AND %s))' % (
+                    table, owned, self.table(model),
+                    self._match(model, 's', 'l'), table,
+                    self._match(model, 'd', 'l'))).fetchall()
+            delete_rows(model, [row[0] for row in rows])
+        for model in self.contact_models:
+            cursor = self._execute('UPDATE %s SET updated = %%s WHERE %s' % (
+                self.qn(model._meta.db_table), owned), [now])
+            stats.count(model, 'touched', cursor.rowcount)
+
+        self._insert(Address, self._match(Address, 'l', 's'), now)
+        self._resolve_addresses(None)
+        for model in (Phone, Email, WebSite):
+            self._insert(model, self._match(model, 'l', 's'), now)
+
+        self.drop()
+
+    def drop(self):
+        for model in self.columns:
+            self._execute('DROP TABLE IF EXISTS %s' % self.table(model))
+
+
+class ReferenceData(object):
+    '''
+    Countries and the fixed chambers, groups and constituencies records
+    refer to, loaded once and shared by the importers of a run
+
+    Call refresh() to reload them, eg. after countries were added. In dry
+    runs, missing rows are recorded in changeset instead of being created.
+    '''
+
+    def __init__(self, changeset=None):
+        self.changeset = changeset
+        self.refresh()
+
+    def refresh(self):
+        self.countries = {c.name: c for c in Country.objects.all()}
+        self.rows = {}
+
+    def country(self, name):
+        try:
+            return self.countries[name]
+        except KeyError:
+            raise Country.DoesNotExist('Unknown country %s' % name)
+
+    def get_or_create(self, model, **data):
+        key = (model, frozenset(data.items()))
+        if key in self.rows:
+            return self.rows[key]
+
+        if self.changeset is None:
+            self.rows[key], _ = model.objects.get_or_create(**data)
+            return self.rows[key]
+
+        instance = None
+        if not any(isinstance(value, Model) and value.pk is None
+                   for value in data.values()):
+            instance = model.objects.filter(**data).first()
+        if instance is None:
+            instance = model(**data)
+            self.changeset.add('created', instance)
+        self.rows[key] = instance
+        return instance
+
+
+class GenericImporter(object):
+    # Name of the data source, digests of imported records are stored under
+    # it so that unchanged records can be skipped on the next import
+    source = None
+
+    # Bump when the import logic changes to re-import unchanged records
+    digest_version = 1
+
+    # A run reading less records than this ratio of the previous complete
+    # run is not considered complete, and will not sweep stale rows
+    complete_ratio = 0.9
+
+    # BatchWriter serving lookups and queuing writes in batched mode
+    batch = None
+
+    # Models of the BatchWriter of manage_batch(), each with the field used
+    # to fetch back primary keys of the rows it creates
+    batch_models = (
+        (Representative, 'slug'),
+        (Constituency, 'name'),
+        (Group, 'name'),
+        (RecordDigest, None),
+    )
+
+    # Changeset of dry runs, which record changes instead of writing them
+    changeset = None
+
+    # Staging tables of staged imports, which load every record before
+    # publishing them at once
+    staging = None
+
+    # Number of records dry runs and staged imports read at once
+    default_batch_size = 100
+
+    # Models whose rows are created and touched by another process, see
+    # the --workers option of parltrack_import_representatives
+    shared_models = ()
+
+    # Signals sent before importing records, one record at a time or as
+    # lists of records, see filter_records()
+    pre_import_signal = None
+    batch_pre_import_signal = None
+
+    # Number of records sent at once with batch_pre_import_signal
+    pre_import_batch_size = 100
+
+    # Representative fields set from source records, see
+    # import_representative()
+    detail_fields = ('first_name', 'last_name', 'full_name', 'gender',
+                     'birth_place', 'birth_date', 'cv', 'photo', 'active')
+
+    def pre_import(self):
+        self.import_start_datetime = timezone.now()
+        self.touched = defaultdict(set)
+
+        # slug -> (pk, digest of detail fields) of existing representatives
+        self.representatives = {}
+        for row in Representative.objects.values_list(
+                'slug', 'pk', *self.detail_fields).iterator():
+            self.representatives[row[0]] = (row[1],
+                                            self.details_digest(row[2:]))
+
+        self.contacts = ContactSync()
+        self.mandates = []
+
+        # Position in the dump of the last record handed over by
+        # pre_filter(), None when records are not filtered
+        self.position = None
+
+        self.unchanged = []
+        self.digests = {}
+        if self.source is not None:
+            # Ignore digests of representatives removed since last import
+            self.digests = dict(RecordDigest.objects.filter(
+                source=self.source,
+                slug__in=Representative.objects.values('slug')
+            ).values_list('slug', 'digest'))
+
+    def has_pre_import_receivers(self):
+        return any(signal is not None and signal.has_listeners(self)
+                   for signal in (self.pre_import_signal,
+                                  self.batch_pre_import_signal))
+
+    def filter_records(self, records):
+        '''
+        Return the list of records to import among records. Receivers of
+        batch_pre_import_signal get the list and return the records they let
+        import, or None, which are matched by slug so that receivers may
+        return copies; receivers of pre_import_signal get one record at a
+        time and return False to skip it.
+        '''
+        count = len(records)
+
+        signal = self.batch_pre_import_signal
+        if signal is not None and signal.has_listeners(self):
+            responses = signal.send(sender=self, representatives_data=records)
+            for receiver, response in responses:
+                if response is not None:
+                    kept = set(self.record_slug(record)
+                               for record in response)
+                    records = [r for r in records
+                               if self.record_slug(r) in kept]
+
+        signal = self.pre_import_signal
+        if signal is not None and signal.has_listeners(self):
+            records = [
+                record for record in records
+                if not any(response is False for receiver, response in
+                           signal.send(sender=self,
+                                       representative_data=record))
+            ]
+
+        if len(records) < count:
+            logger.debug('Skipping %s of %s records', count - len(records),
+                         count)
+        return records
+
+    def pre_filter(self, records, size=None, filter_records=None):
+        '''
+        Filter a stream of journaled records with filter_records(), which
+        defaults to the method of the same name, by chunks of size records;
+        it is returned as is when no receiver is connected
+        '''
+        if filter_records is None:
+            if not self.has_pre_import_receivers():
+                return records
+            filter_records = self.filter_records
+
+        def filtered():
+            for chunk in chunked(records, size or self.pre_import_batch_size):
+                end = self.run.records
+                for record in filter_records(chunk):
+                    yield record
+                # Every record of the chunk was handed over
+                self.position = end
+
+        self.position = self.run.records
+        return filtered()
+
+    def start_run(self, dump_digest='', resume=False):
+        '''
+        Start a run reading the dump identified by dump_digest. With resume,
+        the last run of the source is continued instead if it read the same
+        dump and did not finish: run.records is then the number of records
+        to skip, that were committed by the previous attempt.
+        '''
+        if self.changeset is not None:
+            # Dry runs are not recorded
+            self.run = ImportRun(source=self.source,
+                                 started=self.import_start_datetime,
+                                 dump_digest=dump_digest)
+            return self.run
+
+        run = ImportRun.objects.filter(source=self.source).first()
+        if resume:
+            if run is None:
+                logger.warning('No run of %s to resume, starting a new run',
+                               self.source)
+            elif run.finished is not None:
+                logger.warning('Last run %s finished, starting a new run',
+                               run.pk)
+            elif not dump_digest or run.dump_digest != dump_digest:
+                logger.warning('Last run %s read another dump, starting a '
+                               'new run', run.pk)
+            else:
+                logger.info('Resuming %s after %s records', run,
+                            run.checkpoint)
+                self.import_start_datetime = run.started
+                run.records = run.checkpoint
+                self.run = run
+                return self.run
+
+        self.run = ImportRun.objects.create(
+            source=self.source, started=self.import_start_datetime,
+            dump_digest=dump_digest)
+        return self.run
+
+    def checkpoint(self, failed=0):
+        '''
+        Record the position of the last committed record of the run with the
+        number of records that failed so far in addition to run.failed, once
+        rows seen so far are touched
+        '''
+        if self.changeset is not None:
+            return
+
+        self.flush_touched()
+        self.touch_unchanged()
+
+        self.run.checkpoint = self.run.records if self.position is None \
+            else self.position
+        ImportRun.objects.filter(pk=self.run.pk).update(
+            checkpoint=self.run.checkpoint, failed=self.run.failed + failed)
+
+    def journal(self, records):
+        '''
+        Count records of the source in the current run as they are read
+        '''
+        for record in records:
+            self.run.records += 1
+            yield record
+
+    def finish_run(self):
+        '''
+        Mark the current run as finished, it is complete when no record
+        failed and it read at least complete_ratio of the records of the
+        previous complete run. Groups and constituencies are set active and
+        current affiliations rebuilt according to the mandates imported.
+        '''
+        self.update_active()
+
+        previous = ImportRun.objects.filter(
+            source=self.source, complete=True).exclude(pk=self.run.pk).first()
+
+        self.run.finished = timezone.now()
+        self.run.complete = self.run.records > 0 and not self.run.failed and (
+            previous is None or
+            self.run.records >= previous.records * self.complete_ratio)
+        self.run.save()
+
+        if self.run.failed:
+            logger.warning('Import run %s failed to import %s records',
+                           self.run.pk, self.run.failed)
+        elif not self.run.complete:
+            logger.warning('Import run %s read %s records only, previous run '
+                           'read %s', self.run.pk, self.run.records,
+                           previous.records if previous else 0)
+        return self.run
+
+    @transaction.atomic
+    def sweep(self):
+        '''
+        Delete rows of this source not seen during the current run, which
+        must be complete: representatives that disappeared from the source,
+        contacts and mandates of representatives of the source that were not
+        touched, and groups and constituencies left without mandates.
+        '''
+        if not self.run.complete:
+            raise ValueError('Refusing to sweep after incomplete run %s' %
+                             self.run.pk)
+
+        started = self.run.started
+        digests = RecordDigest.objects.filter(source=self.source)
+        owned = digests.values('slug')
+        stale = digests.filter(updated__lt=started).values('slug')
+
+        swept = {}
+        swept[Phone] = sweep_rows(Phone.objects.filter(
+            Q(updated__lt=started) | Q(address__updated__lt=started),
+            representative__slug__in=owned))
+        for model in (Address, Email, WebSite, Mandate):
+            swept[model] = sweep_rows(model.objects.filter(
+                updated__lt=started, representative__slug__in=owned))
+        sweep_rows(CurrentAffiliation.objects.filter(
+            representative__slug__in=stale))
+        swept[Representative] = sweep_rows(
+            Representative.objects.filter(slug__in=stale))
+        sweep_rows(digests.filter(updated__lt=started))
+
+        # Swept mandates may have been the last current ones, and current
+        # affiliations must not refer to groups swept below
+        self.update_active(Representative.objects.filter(slug__in=owned))
+
+        # Anti-joins: LEFT OUTER JOIN mandates ... WHERE mandate.id IS NULL
+        for model in (Group, Constituency):
+            swept[model] = sweep_rows(model.objects.filter(
+                updated__lt=started, mandates=None))
+
+        for model, count in swept.items():
+            logger.info('Swept %s stale %s', count,
+                        model._meta.verbose_name_plural)
+
+        self.run.swept = True
+        self.run.save()
+
+    def update_active(self, representatives=None):
+        '''
+        Recompute the active field of groups and constituencies in bulk, and
+        the current affiliations of representatives, by default those which
+        gained mandates during the current run or have none yet
+        '''
+        for model in (Group, Constituency):
+            stats.count(model, 'updated', model.objects.update_active())
+
+        if representatives is None:
+            representatives = Representative.objects.filter(
+                Q(mandates__created__gte=self.run.started) |
+                Q(current=None)).distinct()
+        stats.count(CurrentAffiliation, 'updated',
+                    CurrentAffiliation.objects.rebuild(representatives))
+
+    def diff_stale(self):
+        '''
+        Record representatives of the source missing from the dump in the
+        changeset of a dry run, as --sweep would delete them with their
+        contacts and mandates after a complete run
+        '''
+        slugs = RecordDigest.objects.filter(
+            source=self.source).values_list('slug', flat=True)
+        stale = [slug for slug in slugs if slug not in self.changeset.seen]
+        for chunk in chunked(stale, 500):
+            for representative in Representative.objects.filter(
+                    slug__in=chunk):
+                self.changeset.add('stale', representative)
+
+    def record_slug(self, record):
+        '''
+        Return the slug of the representative of a source record
+        '''
+        raise NotImplementedError()
+
+    def import_record(self, record):
+        '''
+        Import a changed source record, return its representative
+        '''
+        raise NotImplementedError()
+
+    def create_batch(self):
+        '''
+        Return the writer of manage_batch(), preloaded with groups and
+        constituencies
+        '''
+        if self.changeset is not None:
+            batch = DryRunWriter(self.import_start_datetime,
+                                 self.batch_models, self.changeset)
+        elif self.staging is not None:
+            batch = StagingWriter(self.import_start_datetime,
+                                  self.batch_models)
+        else:
+            batch = BatchWriter(self.import_start_datetime,
+                                self.batch_models)
+        batch.load(Group, Group.objects.all())
+        batch.load(Constituency, Constituency.objects.all())
+        return batch
+
+    @transaction.atomic
+    def manage_batch(self, records):
+        '''
+        Import a batch of records: rows they may touch are preloaded in
+        identity maps and changes are written with bulk queries at the end,
+        recorded in the changeset of dry runs or loaded into the staging
+        tables of staged imports
+        '''
+        if self.batch is None:
+            self.batch = self.create_batch()
+
+        changed = []
+        for record in records:
+            slug = self.record_slug(record)
+            digest = self.record_digest(record)
+            if self.changeset is not None:
+                self.changeset.seen.add(slug)
+            if not self.is_unchanged(slug, digest):
+                changed.append((slug, digest, record))
+
+        if self.changeset is not None:
+            # Unchanged records are not touched by dry runs
+            self.changeset.unchanged += len(self.unchanged)
+            self.unchanged = []
+
+        batch_models = (Representative, RecordDigest)
+        self.batch.clear(*batch_models)
+
+        slugs = [record[0] for record in changed]
+        with stats.phase('details'):
+            self.batch.load(Representative, Representative.objects.filter(
+                slug__in=slugs))
+            self.batch.load(RecordDigest, RecordDigest.objects.filter(
+                source=self.source, slug__in=slugs))
+
+        imported = []
+        for slug, digest, record in changed:
+            imported.append((slug, digest, self.import_record(record)))
+            self.save_digest(slug, digest)
+
+        with stats.phase('details'):
+            self.batch.flush()
+        if self.staging is not None:
+            self.stage(imported)
+        else:
+            # Representatives created by the batch have a primary key now
+            with stats.phase('mandates'):
+                self.flush_mandates()
+            with stats.phase('contacts'):
+                self.sync_contacts()
+        self.batch.clear(*batch_models)
+
+    def stage(self, imported):
+        '''
+        Load representatives imported by manage_batch(), as (slug, digest,
+        representative), with queued mandates and contacts into the staging
+        tables
+        '''
+        with stats.phase('details'):
+            self.staging.add_representatives(imported)
+        with stats.phase('mandates'):
+            self.staging.add_mandates(self.mandates)
+            self.mandates = []
+        with stats.phase('contacts'):
+            self.staging.add_contacts(self.contacts.contacts)
+            self.contacts.clear()
+
+    def publish(self):
+        '''
+        Write a staged import to the live tables: groups and constituencies
+        it created, then the rows of the staging tables. Call it in one
+        transaction with checkpoint() for readers to see the whole import at
+        once.
+        '''
+        if self.batch is not None:
+            self.batch.publish()
+        with stats.phase('publish'):
+            self.staging.publish()
+
+    def record_digest(self, data):
+        '''
+        Return a digest of a source record, stable across key ordering
+        '''
+        dump = json.dumps([self.digest_version, data], sort_keys=True,
+                          separators=(',', ':'), default=unicode)
+        return hashlib.sha1(dump.encode('utf-8')).hexdigest()
+
+    def is_unchanged(self, slug, digest):
+        '''
+        Tell whether the record was already imported as is; if so it is
+        queued for touch_unchanged() instead of being imported again
+        '''
+        if self.digests.get(slug) != digest:
+            return False
+
+        self.unchanged.append(slug)
+        return True
+
+    def save_digest(self, slug, digest):
+        try:
+            record = self.get(RecordDigest, source=self.source, slug=slug)
+        except RecordDigest.DoesNotExist:
+            record = RecordDigest(source=self.source, slug=slug)
+
+        record.digest = digest
+        self.save(record)
+        self.digests[slug] = digest
+
+    def details_digest(self, values):
+        dump = json.dumps(list(values), separators=(',', ':'),
+                          default=unicode)
+        return hashlib.sha1(dump.encode('utf-8')).hexdigest()
+
+    def import_representative(self, slug, details):
+        '''
+        Return the representative with slug updated with details, a dict of
+        detail_fields values: it is saved if created or changed and touched
+        otherwise. Changes are detected on the digests preloaded by
+        pre_import(), the row is only fetched to be updated.
+        '''
+        pk, digest = self.representatives.get(slug, (None, None))
+        if pk is not None and len(details) == len(self.detail_fields) and \
+                digest == self.details_digest(
+                    details[field] for field in self.detail_fields):
+            self.touch_pk(Representative, pk)
+            return Representative(pk=pk, slug=slug, **details)
+
+        representative = None
+        if slug in self.representatives:
+            try:
+                representative = self.get(Representative, slug=slug)
+            except Representative.DoesNotExist:
+                pass
+
+        changed = representative is None
+        if changed:
+            representative = Representative(slug=slug)
+
+        for field, value in details.items():
+            if getattr(representative, field) != value:
+                setattr(representative, field, value)
+                changed = True
+
+        if changed:
+            self.save(representative)
+        else:
+            self.touch(representative)
+
+        self.representatives[slug] = (representative.pk, self.details_digest(
+            getattr(representative, field) for field in self.detail_fields))
+        return representative
+
+    def touch_unchanged(self):
+        '''
+        Move the updated timestamp of unchanged representatives and of the
+        rows they own or reference forward, with a few bulk updates
+        '''
+        now = timezone.now()
+        for slugs in chunked(self.unchanged, 500):
+            stats.count(RecordDigest, 'touched', RecordDigest.objects.filter(
+                source=self.source, slug__in=slugs).update(updated=now))
+            stats.count(Representative, 'touched',
+                        Representative.objects.filter(
+                            slug__in=slugs).update(updated=now))
+            for model in (Mandate, Address, Phone, Email, WebSite):
+                stats.count(model, 'touched', model.objects.filter(
+                    representative__slug__in=slugs).update(updated=now))
+            for model in (Group, Constituency):
+                stats.count(model, 'touched', model.objects.filter(
+                    mandates__representative__slug__in=slugs
+                ).update(updated=now))
+        self.unchanged = []
+
+    def load_shared(self, model, **data):
+        '''
+        Load into the batch a row of a shared model created by another
+        process after the batch was preloaded
+        '''
+        if model in self.shared_models and \
+                self.batch.by_model[model].find(**data) is None:
+            self.batch.load(model, model.objects.filter(**data)[:1])
+
+    def get(self, model, **data):
+        if self.batch is not None:
+            self.load_shared(model, **data)
+            return self.batch.get(model, **data)
+        return model.objects.get(**data)
+
+    def get_or_create(self, model, **data):
+        if self.batch is not None:
+            self.load_shared(model, **data)
+            return self.batch.get_or_create(model, **data)
+        instance, created = model.objects.get_or_create(**data)
+        if created:
+            stats.count(model, 'inserted')
+        return (instance, created)
+
+    def save(self, instance):
+        if self.batch is not None:
+            self.batch.save(instance)
+        else:
+            stats.count(type(instance),
+                        'updated' if instance.pk else 'inserted')
+            instance.save()
+
+    def touch_model(self, model, **data):
+        '''
+        This method create or look up a model with the given data
+        it saves the given model if it exists, updating its
+        updated field
+        '''
+        instance, created = self.get_or_create(model, **data)
+
+        if not created:
+            self.touch(instance)
+
+        return (instance, created)
+
+    def touch(self, instance):
+        '''
+        Mark an existing instance as seen during this import
+        '''
+        if instance.pk is None or type(instance) in self.shared_models:
+            return
+
+        if self.batch is not None:
+            self.batch.touch(instance)
+        elif instance.updated < self.import_start_datetime:
+            # Updated field is moved forward by flush_touched()
+            self.touched[type(instance)].add(instance.pk)
+
+    def add_mandate(self, representative, group, constituency, role='',
+                    begin_date=None, end_date=None):
+        '''
+        Queue a mandate for flush_mandates()
+        '''
+        self.mandates.append(Mandate(
+            representative=representative, group=group,
+            constituency=constituency, role=role, begin_date=begin_date,
+            end_date=end_date))
+
+    def flush_mandates(self):
+        '''
+        Insert queued mandates in bulk, existing ones are touched
+        '''
+        resolve_relations(self.mandates)
+        if self.changeset is not None:
+            self.diff_mandates()
+        else:
+            upsert_rows(Mandate, self.mandates, MANDATE_KEY,
+                        MANDATE_CONFLICT_INDEX, MANDATE_CONFLICT_TARGET)
+        self.mandates = []
+
+    def diff_mandates(self):
+        '''
+        Record queued mandates missing from the database as created in the
+        changeset, and other mandates of their representatives as stale
+        '''
+        existing = {}
+        pks = set(m.representative_id for m in self.mandates)
+        pks.discard(None)
+        for chunk in chunked(pks, 500):
+            for mandate in Mandate.objects.filter(
+                    representative_id__in=chunk).select_related(
+                        'representative', 'group', 'constituency'):
+                key = tuple(getattr(mandate, k) for k in MANDATE_KEY)
+                existing.setdefault(key, mandate)
+
+        kept = set()
+        for mandate in self.mandates:
+            key = tuple(getattr(mandate, k) for k in MANDATE_KEY)
+            # Mandates of rows created by the dry run have no key yet
+            if key in existing and None not in key[:3]:
+                kept.add(key)
+            else:
+                self.changeset.add('created', mandate)
+
+        for key, mandate in existing.items():
+            if key not in kept:
+                self.changeset.add('stale', mandate)
+
+    def discard_queued(self):
+        '''
+        Drop mandates and contacts queued and not flushed, such as those of
+        a record that failed and was rolled back to its savepoint
+        '''
+        self.mandates = []
+        self.contacts.clear()
+
+    def add_contact(self, representative, model, **data):
+        '''
+        Queue a contact of representative for sync_contacts(), return its
+        key to pass as address of phones
+        '''
+        return self.contacts.add(representative, model, **data)
+
+    def sync_contacts(self):
+        '''
+        Sync queued contacts with existing rows, rows kept are touched
+        '''
+        if self.changeset is not None:
+            self.contacts.diff(self.changeset)
+            return
+
+        for model, pks in self.contacts.apply().items():
+            self.touched[model].update(pks)
+
+    def touch_pk(self, model, pk):
+        '''
+        Mark an existing row as seen during this import, by primary key
+        '''
+        if self.batch is not None:
+            self.batch.by_model[model].touched.add(pk)
+        else:
+            self.touched[model].add(pk)
+
+    def flush_touched(self):
+        '''
+        Update the updated field of rows touched since last flush, with one
+        UPDATE per model and chunk of primary keys
+        '''
+        now = timezone.now()
+        for model, pks in self.touched.items():
+            touch_rows(model, pks, now)
+        self.touched.clear()
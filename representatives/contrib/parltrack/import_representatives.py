@@ -1,148 +1,140 @@
 # coding: utf-8
 
+import argparse
 import logging
+import multiprocessing
 import sys
+import zlib
 from datetime import datetime
+from Queue import Full
 
 import django.dispatch
-import ijson
 import django
 from django.apps import apps
-from django.db import transaction
-from django.utils import timezone
+from django.db import connections, transaction
 from django.utils.text import slugify
 
-from representatives.models import (Address, Constituency, Country, Email,
-                                    Group, Mandate, Phone, Representative,
-                                    WebSite, Chamber)
+from representatives.contrib.importer import (IJSON_BACKENDS, Changeset,
+                                              GenericImporter, ReferenceData,
+                                              Staging, chunked,
+                                              fingerprint_stream,
+                                              get_ijson_backend,
+                                              import_records, project_items,
+                                              stats)
+from representatives.models import (Address, Constituency, Email, Group,
+                                    Phone, WebSite, Chamber)
 
 logger = logging.getLogger(__name__)
 
 representative_pre_import = django.dispatch.Signal(
     providing_args=['representative_data'])
 
+# Sent with lists of meps, receivers return the list of meps to import
+representatives_pre_import = django.dispatch.Signal(
+    providing_args=['representatives_data'])
+
 
 def _parse_date(date):
     return datetime.strptime(date, "%Y-%m-%dT00:%H:00").date()
 
 
-class GenericImporter(object):
-
-    def pre_import(self):
-        self.import_start_datetime = timezone.now()
-
-    def post_import(self):
-        # Clean not touched models
-        models = [Representative, Group, Constituency,
-                  Mandate, Address, Phone, Email, WebSite]
-        for model in models:
-            model.objects.filter(
-                updated__lt=self.import_start_datetime).delete()
-
-    def touch_model(self, model, **data):
-        '''
-        This method create or look up a model with the given data
-        it saves the given model if it exists, updating its
-        updated field
-        '''
-        instance, created = model.objects.get_or_create(**data)
-
-        if not created:
-            if instance.updated < self.import_start_datetime:
-                instance.save()     # Updates updated field
-
-        return (instance, created)
+def _mep_slug(mep_json):
+    return slugify('%s-%s' % (
+        mep_json["Name"]["full"] if 'full' in mep_json["Name"]
+        else mep_json["Name"]["sur"] + " " + mep_json["Name"]["family"],
+        _parse_date(mep_json["Birth"]["date"])
+    ))
 
 
 class ParltrackImporter(GenericImporter):
     url = 'http://parltrack.euwiki.org/dumps/ep_meps_current.json.xz'
     check_etag = True
+    source = 'parltrack'
+    pre_import_signal = representative_pre_import
+    batch_pre_import_signal = representatives_pre_import
+
+    # Keys of mep records used by the importer, other keys of the dump such
+    # as activities or changes histories are skipped while parsing
+    fields = ('Name', 'Birth', 'active', 'Photo', 'Gender', 'CV',
+              'Committees', 'Delegations', 'Groups', 'Constituencies',
+              'Staff', 'Addresses', 'Mail', 'UserID', 'Homepage', 'Twitter',
+              'Facebook')
 
     def parse_date(self, date):
         return _parse_date(date)
 
-    def __init__(self):
-        self.cache = {
-            'countries': {c.name: c.pk for c in Country.objects.all()},
-        }
-        self.ep_chamber, _ = Chamber.objects.get_or_create(
-            name='European Parliament', abbreviation='EP')
-        self.ep_constituency, _ = Constituency.objects.get_or_create(
-            name='European Parliament')
-        self.ep_group, _ = Group.objects.get_or_create(
-            name='European Parliament', kind='chamber', abbreviation='EP',
-            chamber=self.ep_chamber)
+    def __init__(self, reference=None):
+        self.reference = reference or ReferenceData()
+        self.ep_chamber = self.reference.get_or_create(
+            Chamber, name='European Parliament', abbreviation='EP')
+        self.ep_constituency = self.reference.get_or_create(
+            Constituency, name='European Parliament')
+        self.ep_group = self.reference.get_or_create(
+            Group, name='European Parliament', kind='chamber',
+            abbreviation='EP', chamber=self.ep_chamber)
+        # Keys of mandate targets handled by ensure_shared()
+        self.shared = set()
 
     @transaction.atomic
     def manage_mep(self, mep_json):
         '''
         Import a mep as a representative from the json dict fetched from
-        parltrack
+        parltrack, meps skipped by pre import receivers must have been
+        filtered out, see pre_filter()
         '''
 
-        # Some versions of memopol will connect to this and skip inactive meps.
-        responses = representative_pre_import.send(sender=self,
-                representative_data=mep_json)
-
-        for receiver, response in responses:
-            if response is False:
-                logger.debug(
-                    'Skipping MEP %s', mep_json['Name']['full'])
-                return
-
-        changed = False
-        slug = slugify('%s-%s' % (
-            mep_json["Name"]["full"] if 'full' in mep_json["Name"]
-            else mep_json["Name"]["sur"] + " " + mep_json["Name"]["family"],
-            _parse_date(mep_json["Birth"]["date"])
-        ))
-        try:
-            representative = Representative.objects.get(slug=slug)
-        except Representative.DoesNotExist:
-            representative = Representative(slug=slug)
-            changed = True
+        # Left over by a previous record that failed
+        self.discard_queued()
+
+        slug = _mep_slug(mep_json)
+        digest = self.record_digest(mep_json)
+        if self.is_unchanged(slug, digest):
+            logger.debug('Unchanged MEP %s', slug)
+            return
+
+        representative = self.import_mep(mep_json)
+        self.save_digest(slug, digest)
+        return representative
+
+    def record_slug(self, mep_json):
+        return _mep_slug(mep_json)
+
+    def import_record(self, mep_json):
+        return self.import_mep(mep_json)
+
+    def import_mep(self, mep_json):
+        slug = _mep_slug(mep_json)
 
         # Save representative attributes
-        self.import_representative_details(representative, mep_json, changed)
+        with stats.phase('details'):
+            representative = self.import_representative_details(slug,
+                                                                mep_json)
 
-        self.add_mandates(representative, mep_json)
+        with stats.phase('mandates'):
+            self.add_mandates(representative, mep_json)
 
-        self.add_contacts(representative, mep_json)
+        with stats.phase('contacts'):
+            self.add_contacts(representative, mep_json)
 
         logger.debug('Imported MEP %s', unicode(representative))
 
         return representative
 
-    def import_representative_details(self, representative, mep_json, changed):
-        if representative.active != mep_json['active']:
-            representative.active = mep_json['active']
-            changed = True
+    def import_representative_details(self, slug, mep_json):
+        details = {
+            'active': mep_json['active'],
+            'first_name': mep_json["Name"]["sur"],
+            'full_name': mep_json["Name"]["full"],
+            'photo': mep_json["Photo"],
+        }
 
         if mep_json.get("Birth"):
-            birth_date = _parse_date(mep_json["Birth"]["date"])
-            if representative.birth_date != birth_date:
-                representative.birth_date = birth_date
-                changed = True
+            details['birth_date'] = _parse_date(mep_json["Birth"]["date"])
             if "place" in mep_json["Birth"]:
-                birth_place = mep_json["Birth"]["place"]
-                if representative.birth_place != birth_place:
-                    representative.birth_place = birth_place
-                    changed = True
-
-        if representative.first_name != mep_json["Name"]["sur"]:
-            representative.first_name = mep_json["Name"]["sur"]
-            changed = True
+                details['birth_place'] = mep_json["Birth"]["place"]
 
         last_name = mep_json["Name"]["family"]
 
-        if representative.full_name != mep_json["Name"]["full"]:
-            representative.full_name = mep_json["Name"]["full"]
-            changed = True
-
-        if representative.photo != mep_json["Photo"]:
-            representative.photo = mep_json["Photo"]
-            changed = True
-
         fix_last_name_with_prefix = {
             "Esther de LANGE": "de LANGE",
             "Patricia van der KAMMEN": "van der KAMMEN",
@@ -175,31 +167,24 @@ class ParltrackImporter(GenericImporter):
             'Luigi de MAGISTRIS': 'de MAGISTRIS',
         }
 
-        if fix_last_name_with_prefix.get(representative.full_name):
-            last_name = fix_last_name_with_prefix[representative.full_name]
+        if fix_last_name_with_prefix.get(details['full_name']):
+            last_name = fix_last_name_with_prefix[details['full_name']]
         elif last_name == "J.A.J. STASSEN":
             last_name = "STASSEN"
 
-        if representative.last_name != last_name:
-            representative.last_name = last_name
-            changed = True
+        details['last_name'] = last_name
 
         gender_convertion_dict = {u"F": 1, u"M": 2}
         if 'Gender' in mep_json:
-            gender = gender_convertion_dict.get(mep_json['Gender'], 0)
+            details['gender'] = gender_convertion_dict.get(
+                mep_json['Gender'], 0)
         else:
-            gender = 0
-        if representative.gender != gender:
-            representative.gender = gender
-            changed = True
+            details['gender'] = 0
 
-        cv = "\n".join([cv_title for cv_title in mep_json.get("CV", [])])
-        if representative.cv != cv:
-            representative.cv = cv
-            changed = True
+        details['cv'] = "\n".join(
+            [cv_title for cv_title in mep_json.get("CV", [])])
 
-        if changed:
-            representative.save()
+        return self.import_representative(slug, details)
 
     def add_mandates(self, representative, mep_json):
         def create_mandate(mandate_data, representative, group, constituency):
@@ -209,40 +194,39 @@ class ParltrackImporter(GenericImporter):
                 end_date = _parse_date(mandate_data.get("end"))
 
             role = mandate_data['role'] if 'role' in mandate_data else ''
-            mandate, _ = Mandate.objects.get_or_create(
-                representative=representative,
-                group=group,
-                constituency=constituency,
-                role=role,
-                begin_date=begin_date,
-                end_date=end_date
-            )
-
-            if _:
-                logger.debug('Created mandate %s with %s', mandate.pk,
-                             mandate_data)
+            self.add_mandate(representative, group, constituency, role,
+                             begin_date, end_date)
+
+        for mandate_data, group_data, constituency_data in \
+                self.mandate_targets(mep_json):
+            group = self.get_group(group_data)
+            constituency = self.get_constituency(constituency_data)
+            create_mandate(mandate_data, representative, group, constituency)
+
+        # Batched imports insert mandates of the whole batch at once
+        if self.batch is None:
+            self.flush_mandates()
+
+    def mandate_targets(self, mep_json):
+        '''
+        Yield (mandate_data, group_data, constituency_data) for each mandate
+        of a mep; group_data and constituency_data are None for the European
+        Parliament group and constituency
+        '''
 
         # Committee
         for mandate_data in mep_json.get('Committees', []):
             if mandate_data.get("committee_id"):
-                group, _ = self.touch_model(model=Group,
-                        abbreviation=mandate_data['committee_id'],
-                        kind='committee', name=mandate_data['Organization'],
-                        chamber=self.ep_chamber)
-
-                create_mandate(mandate_data, representative, group,
-                               self.ep_constituency)
+                yield mandate_data, dict(
+                    abbreviation=mandate_data['committee_id'],
+                    kind='committee', name=mandate_data['Organization'],
+                    chamber=self.ep_chamber), None
 
         # Delegations
         for mandate_data in mep_json.get('Delegations', []):
-            group, _ = self.touch_model(model=Group,
-                                        kind='delegation',
-                                        name=mandate_data['Organization'],
-                                        chamber=self.ep_chamber
-                                        )
-
-            create_mandate(mandate_data, representative, group,
-                           self.ep_constituency)
+            yield mandate_data, dict(kind='delegation',
+                                     name=mandate_data['Organization'],
+                                     chamber=self.ep_chamber), None
 
         # Group
         convert = {
@@ -261,73 +245,88 @@ class ParltrackImporter(GenericImporter):
                 abbreviation = mandate_data.get('groupid')
 
             abbreviation = convert.get(abbreviation, abbreviation)
-            group, _ = self.touch_model(model=Group,
-                                        abbreviation=abbreviation,
-                                        kind='group',
-                                        name=mandate_data['Organization'],
-                                        chamber=self.ep_chamber
-                                        )
-
-            create_mandate(mandate_data, representative, group,
-                           self.ep_constituency)
+            yield mandate_data, dict(abbreviation=abbreviation,
+                                     kind='group',
+                                     name=mandate_data['Organization'],
+                                     chamber=self.ep_chamber), None
 
         # Countries
         for mandate_data in mep_json.get('Constituencies', []):
             if not mandate_data:
                 continue
 
-            _country = Country.objects.get(name=mandate_data['country'])
-
-            group, _ = self.touch_model(model=Group,
-                                        abbreviation=_country.code,
-                                        kind='country',
-                                        name=_country.name
-                                        )
+            _country = self.reference.country(mandate_data['country'])
 
             local_party = mandate_data['party'] if mandate_data[
                 'party'] and mandate_data['party'] != '-' else 'unknown'
 
-            country_id = (self.cache['countries'].get(mandate_data['country'])
-                if 'country' in mandate_data else None)
+            yield mandate_data, dict(abbreviation=_country.code,
+                                     kind='country',
+                                     name=_country.name), dict(
+                                         name=local_party,
+                                         country_id=_country.pk)
 
-            save_constituency = False
-            try:
-                constituency = Constituency.objects.get(name=local_party)
-            except Constituency.DoesNotExist:
-                constituency = Constituency(name=local_party)
-                save_constituency = True
+            yield mandate_data, None, None
 
-            if constituency.country_id != country_id:
-                constituency.country_id = country_id
-                save_constituency = True
+        # Organisations
+        for mandate_data in mep_json.get('Staff', []):
+            yield mandate_data, dict(abbreviation='',
+                                     kind='organization',
+                                     name=mandate_data['Organization']), None
 
-            if save_constituency:
-                constituency.save()
+    def get_group(self, group_data):
+        if group_data is None:
+            return self.ep_group
 
-            create_mandate(mandate_data, representative, group, constituency)
+        group, _ = self.touch_model(model=Group, **group_data)
+        return group
 
-            create_mandate(mandate_data, representative, self.ep_group,
-                           self.ep_constituency)
+    def get_constituency(self, constituency_data):
+        if constituency_data is None:
+            return self.ep_constituency
 
-        # Organisations
-        for mandate_data in mep_json.get('Staff', []):
+        save_constituency = False
+        try:
+            constituency = self.get(Constituency,
+                                    name=constituency_data['name'])
+        except Constituency.DoesNotExist:
+            constituency = Constituency(name=constituency_data['name'])
+            save_constituency = True
+
+        if constituency.country_id != constituency_data['country_id']:
+            constituency.country_id = constituency_data['country_id']
+            save_constituency = True
+
+        if save_constituency:
+            self.save(constituency)
+        else:
+            self.touch(constituency)
 
-            group, _ = self.touch_model(model=Group,
-                                        abbreviation='',
-                                        kind='organization',
-                                        name=mandate_data['Organization']
-                                        )
+        return constituency
 
-            create_mandate(mandate_data, representative, group,
-                           self.ep_constituency)
+    def ensure_shared(self, mep_json):
+        '''
+        Create or touch the groups and constituencies a mep references, so
+        that worker processes importing meps only ever look them up
+        '''
+        for mandate_data, group_data, constituency_data in \
+                self.mandate_targets(mep_json):
+            key = (frozenset((group_data or {}).items()),
+                   frozenset((constituency_data or {}).items()))
+            if key in self.shared:
+                continue
+
+            self.get_group(group_data)
+            self.get_constituency(constituency_data)
+            self.shared.add(key)
 
     def add_contacts(self, representative, mep_json):
         # Addresses
         if mep_json.get('Addresses', None):
             address = mep_json.get('Addresses')
 
-            belgium = Country.objects.get(name="Belgium")
-            france = Country.objects.get(name="France")
+            belgium = self.reference.country('Belgium')
+            france = self.reference.country('France')
 
             for city in address:
                 if city in ['Brussels', 'Strasbourg']:
@@ -344,16 +343,16 @@ class ParltrackImporter(GenericImporter):
                         postcode = '67070'
                         name = "Strasbourg European Parliament"
 
-                    address_model, _ = self.touch_model(model=Address,
-                        representative=representative, country=country,
+                    address_key = self.add_contact(representative, Address,
+                        country=country,
                         city=city,
                         floor=address[city]['Address']['Office'][:3],
                         office_number=address[city]['Address']['Office'][3:],
                         street=street, number=number, postcode=postcode,
                         kind='official', name=name)
 
-                    self.touch_model(model=Phone,
-                        representative=representative, address=address_model,
+                    self.add_contact(representative, Phone,
+                        address=address_key,
                         kind='office phone',
                         number=address[city].get('Phone', ''))
 
@@ -364,63 +363,248 @@ class ParltrackImporter(GenericImporter):
                 mails = list(mails)
 
             for mail in mails:
-                self.touch_model(
-                    model=Email,
-                    representative=representative,
+                self.add_contact(
+                    representative, Email,
                     kind=('official' if '@europarl.europa.eu' in mail
                         else 'other'),
                     email=mail)
 
         # EP page
-        changed = False
-        try:
-            site = WebSite.objects.get(kind='EP',
-                                       representative=representative)
-        except WebSite.DoesNotExist:
-            site = WebSite(kind='EP', representative=representative)
-            changed = True
-
         uid = mep_json['UserID']
-        url = 'http://www.europarl.europa.eu/meps/en/%s/_home.html' % uid
-        if site.url != url:
-            site.url = url
-            changed = True
-
-        if changed:
-            site.save()
+        self.add_contact(
+            representative, WebSite, kind='EP',
+            url='http://www.europarl.europa.eu/meps/en/%s/_home.html' % uid)
 
         # WebSite
         websites = mep_json.get('Homepage', [])
         for url in websites:
-            self.touch_model(model=WebSite,
-                             url=url,
-                             representative=representative
-                             )
+            self.add_contact(representative, WebSite, url=url)
 
         if mep_json.get('Twitter', None):
-            self.touch_model(model=WebSite,
-                             representative=representative,
+            self.add_contact(representative, WebSite,
                              kind='twitter',
                              url=mep_json.get('Twitter')[0]
                              )
 
         if mep_json.get('Facebook', None):
-            self.touch_model(model=WebSite,
-                             representative=representative,
+            self.add_contact(representative, WebSite,
                              kind='facebook',
                              url=mep_json.get('Facebook')[0]
                              )
 
+        # Batched imports sync contacts of the whole batch at once
+        if self.batch is None:
+            self.sync_contacts()
+
+
+def _partition(slug, workers):
+    return zlib.crc32(slug.encode('utf-8')) % workers
+
+
+def _send(process, queue, item):
+    while True:
+        try:
+            queue.put(item, timeout=1)
+            return
+        except Full:
+            if not process.is_alive():
+                raise RuntimeError('Import failed in %s' % process.name)
+
+
+def _stop(processes, queues):
+    '''
+    Terminate workers after a failure. Meps still buffered in their queues
+    are dropped, otherwise this process would wait for them to be received
+    on exit.
+    '''
+    for queue in queues:
+        queue.cancel_join_thread()
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+        process.join()
+
+
+def _import_worker(queue, import_start_datetime, batch_size=0,
+                   commit_every=0):
+    '''
+    Import meps received on queue until None is received
+    '''
+    importer = ParltrackImporter()
+    importer.pre_import()
+    importer.import_start_datetime = import_start_datetime
+    # The parent process creates and touches groups and constituencies
+    importer.shared_models = (Group, Constituency)
+
+    meps = iter(queue.get, None)
+    failed = 0
+    if batch_size > 0:
+        for batch in chunked(meps, batch_size):
+            importer.manage_batch(batch)
+    else:
+        failed = import_records(meps, importer.manage_mep, commit_every,
+                                lambda failed: importer.flush_touched())
+
+    importer.flush_touched()
+
+    if failed:
+        # Let the parent process know the import is not complete
+        sys.exit(1)
+
+
+def import_parallel(importer, meps, workers, batch_size=0, commit_every=0):
+    '''
+    Import meps with a pool of worker processes. Meps are partitioned by slug
+    so that no two workers ever write rows of the same representative, and
+    groups and constituencies are created by this process before a mep is
+    sent to its worker so that workers never race on creating them.
+    '''
+    queues = [multiprocessing.Queue(maxsize=100) for i in range(workers)]
+    processes = [
+        multiprocessing.Process(target=_import_worker, args=(
+            queue, importer.import_start_datetime, batch_size, commit_every))
+        for queue in queues
+    ]
+
+    # Workers must open their own database connections
+    connections.close_all()
+    for process in processes:
+        process.start()
+
+    try:
+        for mep_json in meps:
+            slug = _mep_slug(mep_json)
+            if importer.is_unchanged(slug, importer.record_digest(mep_json)):
+                continue
+
+            importer.ensure_shared(mep_json)
+            partition = _partition(slug, workers)
+            _send(processes[partition], queues[partition], mep_json)
+
+        for process, queue in zip(processes, queues):
+            _send(process, queue, None)
+    except BaseException:
+        _stop(processes, queues)
+        raise
+
+    failed = []
+    for process in processes:
+        process.join()
+        if process.exitcode != 0:
+            failed.append(process.name)
+
+    if failed:
+        _stop(processes, queues)
+        raise RuntimeError('Import failed in %s' % ', '.join(failed))
+
+
+def main(stream=None, argv=None):
+    parser = argparse.ArgumentParser(
+        description='Import representatives from a parltrack MEP dump')
+    parser.add_argument('--batch-size', type=int, default=0, metavar='N',
+        help='Write meps N at a time with bulk queries instead of one '
+             'transaction per mep')
+    parser.add_argument('--parser', choices=('auto',) + IJSON_BACKENDS,
+        help='ijson backend parsing the dump, defaults to the '
+             'REPRESENTATIVES_IJSON_BACKEND setting or to the fastest one')
+    parser.add_argument('--commit-every', type=int, default=0, metavar='N',
+        help='Commit meps N at a time, a failing mep is rolled back and '
+             'logged on its own')
+    parser.add_argument('--workers', type=int, default=0, metavar='N',
+        help='Import meps in N worker processes, partitioned by slug')
+    parser.add_argument('--sweep', action='store_true', default=False,
+        help='After a complete run, delete meps missing from the dump and '
+             'their contacts and mandates that were not seen')
+    parser.add_argument('--resume', action='store_true', default=False,
+        help='Continue an interrupted run of the same dump, redirected '
+             'from a file, after its last committed mep')
+    parser.add_argument('--stats', action='store_true', default=False,
+        help='Print a JSON summary of timings, queries and rows written at '
+             'the end, of the main process only with --workers')
+    parser.add_argument('--progress', type=int, default=0, metavar='N',
+        help='Log a progress line every N meps read')
+    parser.add_argument('--dry-run', action='store_true', default=False,
+        help='Write nothing, print counts of the rows the import would '
+             'create, update and leave stale as JSON')
+    parser.add_argument('--diff', action='store_true', default=False,
+        help='Like --dry-run, listing the rows and changed fields')
+    parser.add_argument('--staging', action='store_true', default=False,
+        help='Load the whole dump into staging tables, then publish it in '
+             'one transaction so that readers never see a partial import')
+
+    if argv is None:
+        argv = sys.argv[1:] if stream is None else []
+    options = parser.parse_args(argv)
+    dry_run = options.dry_run or options.diff
+    if options.resume and options.workers > 1:
+        parser.error('--resume is not supported with --workers')
+    if dry_run and (options.resume or options.workers > 1):
+        parser.error('--dry-run is not supported with --resume or --workers')
+    if options.staging and (dry_run or options.resume or
+                            options.workers > 1):
+        parser.error('--staging is not supported with --dry-run, --resume '
+                     'or --workers')
 
-def main(stream=None):
     if not apps.ready:
         django.setup()
 
-    importer = ParltrackImporter()
-    GenericImporter.pre_import(importer)
+    if options.stats:
+        stats.enable()
 
-    for data in ijson.items(stream or sys.stdin, 'item'):
-        importer.manage_mep(data)
-    # Commenting for now, it's a bit dangerous, if a json file was corrupt it
-    # would drop valid data !
-    # importer.post_import()
+    changeset = Changeset(ParltrackImporter.source) if dry_run else None
+    importer = ParltrackImporter(ReferenceData(changeset))
+    importer.changeset = changeset
+    GenericImporter.pre_import(importer)
+    dump_digest, stream = fingerprint_stream(stream or sys.stdin)
+    if options.resume and not dump_digest:
+        parser.error('--resume needs the dump redirected from a file, a '
+                     'piped dump cannot be identified')
+    run = importer.start_run(dump_digest, options.resume)
+
+    backend = get_ijson_backend(options.parser)
+    meps = project_items(backend, stream, importer.fields, skip=run.records)
+    if options.stats or options.progress:
+        meps = stats.timed(meps, options.progress)
+    meps = importer.journal(meps)
+    # Some versions of memopol will connect to this and skip inactive meps.
+    meps = importer.pre_filter(meps, options.batch_size or
+                               options.commit_every)
+    if dry_run:
+        for batch in chunked(meps, options.batch_size or
+                             importer.default_batch_size):
+            importer.manage_batch(batch)
+        importer.diff_stale()
+        changeset.report(importer.run, full=options.diff)
+        if options.stats:
+            stats.report(importer.run)
+        return
+
+    if options.staging:
+        importer.staging = Staging(importer.source, importer.detail_fields)
+        for batch in chunked(meps, options.batch_size or
+                             importer.default_batch_size):
+            importer.manage_batch(batch)
+        with transaction.atomic():
+            importer.publish()
+            importer.checkpoint()
+    elif options.workers > 1:
+        import_parallel(importer, meps, options.workers, options.batch_size,
+                        options.commit_every)
+    elif options.batch_size > 0:
+        for batch in chunked(meps, options.batch_size):
+            importer.manage_batch(batch)
+            importer.checkpoint()
+    else:
+        importer.run.failed += import_records(
+            meps, importer.manage_mep, options.commit_every,
+            importer.checkpoint)
+
+    importer.checkpoint()
+
+    # A corrupt or truncated dump raises before this point, a partial one
+    # yields an incomplete run: only sweep after a complete run
+    if importer.finish_run().complete and options.sweep:
+        importer.sweep()
+
+    if options.stats:
+        stats.report(importer.run)
@@ -1,24 +1,42 @@
 import pytest
 import os
 import copy
+import json
+import multiprocessing
+import multiprocessing.queues
+import sys
+from datetime import date
+from StringIO import StringIO
 
+from django.core.management import call_command
 from django.core.serializers.json import Deserializer
-from representatives.models import Representative
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from ijson.common import JSONError
+from Queue import Queue
+from representatives.models import (Constituency, CurrentAffiliation, Email,
+                                    Group, ImportRun, Mandate, RecordDigest,
+                                    Representative, SearchDocument)
+from representatives.contrib import importer
 from representatives.contrib.parltrack import import_representatives
 
 
-@pytest.mark.django_db
-def test_parltrack_import_representatives():
-    fixture = os.path.join(os.path.dirname(__file__),
-            'representatives_fixture.json')
-    expected = os.path.join(os.path.dirname(__file__),
-            'representatives_expected.json')
+fixture = os.path.join(os.path.dirname(__file__),
+        'representatives_fixture.json')
+expected = os.path.join(os.path.dirname(__file__),
+        'representatives_expected.json')
 
-    # Disable django auto fields
-    exclude = ('id', '_state', 'created', 'updated', 'fingerprint')
 
+def assert_imported(argv=None):
     with open(fixture, 'r') as f:
-        import_representatives.main(f)
+        import_representatives.main(f, argv)
+
+    assert_expected()
+
+
+def assert_expected():
+    # Disable django auto fields
+    exclude = ('id', '_state', 'created', 'updated', 'fingerprint')
 
     missing = []
     with open(expected, 'r') as f:
@@ -36,3 +54,688 @@ def test_parltrack_import_representatives():
 
     assert len(missing) is 0
     assert Representative.objects.count() == 2
+
+
+@pytest.mark.django_db
+def test_parltrack_import_representatives():
+    assert_imported()
+
+
+@pytest.mark.django_db
+def test_parltrack_import_representatives_batched():
+    assert_imported(['--batch-size', '1'])
+    # Re-importing in batches matches existing rows instead of duplicating
+    assert_imported(['--batch-size', '10'])
+
+
+@pytest.mark.django_db
+def test_parltrack_import_representatives_python_parser():
+    assert_imported(['--parser', 'python'])
+
+
+@pytest.mark.django_db
+def test_parltrack_import_representatives_commit_every():
+    assert_imported(['--commit-every', '10'])
+
+
+@pytest.mark.django_db
+def test_parltrack_commit_every_isolates_failures():
+    with open(fixture, 'r') as f:
+        meps = json.load(f)
+    # Fails on its constituency once its other mandates were queued
+    broken = copy.deepcopy(meps[0])
+    broken['Name']['full'] = 'Broken MEP'
+    broken['Constituencies'][-1]['country'] = 'Atlantis'
+    meps.insert(1, broken)
+    import_representatives.main(StringIO(json.dumps(meps)),
+                                ['--commit-every', '10', '--sweep'])
+
+    run = ImportRun.objects.get()
+    assert (run.records, run.failed, run.complete) == (3, 1, False)
+    assert_expected()
+    with open(expected, 'r') as f:
+        assert Mandate.objects.count() == len([
+            obj for obj in Deserializer(f.read())
+            if isinstance(obj.object, Mandate)])
+
+
+@pytest.mark.django_db
+def test_parltrack_commit_every_discards_failed_contacts():
+    assert_imported()
+    with open(fixture, 'r') as f:
+        meps = json.load(f)
+    olle = Representative.objects.get(slug__startswith='olle-')
+    websites = set(olle.website_set.values_list('url', flat=True))
+    assert len(websites) == 4
+
+    # Fails after its other contacts were queued, then the next mep syncs
+    meps[1]['Facebook'] = True
+    meps[0]['CV'] = []
+    meps.reverse()
+    import_meps(meps, ['--commit-every', '10'])
+
+    assert ImportRun.objects.first().failed == 1
+    assert set(olle.website_set.values_list('url', flat=True)) == websites
+    assert olle.email_set.count() == 1
+    assert Representative.objects.get(slug__startswith='hubert-').cv == ''
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('argv', [[], ['--batch-size', '1']])
+def test_parltrack_pre_import_signals(argv):
+    with open(fixture, 'r') as f:
+        meps = json.load(f)
+    names = [mep['Name']['full'] for mep in meps]
+    batches = []
+
+    def skip_first(sender, representatives_data, **kwargs):
+        batches.append(len(representatives_data))
+        return [mep for mep in representatives_data
+                if mep['Name']['full'] != names[0]]
+
+    def skip_second(sender, representative_data, **kwargs):
+        return representative_data['Name']['full'] != names[1]
+
+    import_representatives.representatives_pre_import.connect(skip_first)
+    import_representatives.representative_pre_import.connect(skip_second)
+    try:
+        import_meps(meps, argv)
+    finally:
+        import_representatives.representatives_pre_import.disconnect(
+            skip_first)
+        import_representatives.representative_pre_import.disconnect(
+            skip_second)
+
+    assert batches == ([1, 1] if argv else [2])
+    assert Representative.objects.count() == 0
+
+
+@pytest.mark.django_db
+def test_parltrack_batch_pre_import_signal_copies():
+    def keep_copies(sender, representatives_data, **kwargs):
+        return json.loads(json.dumps(representatives_data))
+
+    import_representatives.representatives_pre_import.connect(keep_copies)
+    try:
+        assert_imported()
+    finally:
+        import_representatives.representatives_pre_import.disconnect(
+            keep_copies)
+
+
+def interrupt_import(monkeypatch, name):
+    import_mep = import_representatives.ParltrackImporter.import_mep
+
+    def interrupted(self, mep_json):
+        if mep_json['Name']['full'] == name:
+            raise KeyboardInterrupt()
+        return import_mep(self, mep_json)
+
+    monkeypatch.setattr(import_representatives.ParltrackImporter,
+                        'import_mep', interrupted)
+
+
+def log_warnings(monkeypatch):
+    warnings = []
+    monkeypatch.setattr(importer.logger, 'warning',
+                        lambda msg, *args: warnings.append(msg % args))
+    return warnings
+
+
+@pytest.mark.django_db
+def test_parltrack_resume(monkeypatch, tmpdir):
+    dump = tmpdir.join('meps.json')
+    with open(fixture, 'r') as f:
+        dump.write(f.read())
+    second = json.loads(dump.read())[1]['Name']['full']
+
+    # Interrupted after the first mep was committed
+    interrupt_import(monkeypatch, second)
+    with pytest.raises(KeyboardInterrupt):
+        with dump.open() as f:
+            import_representatives.main(f, ['--commit-every', '1'])
+    monkeypatch.undo()
+    run = ImportRun.objects.get()
+    assert (run.checkpoint, run.finished) == (1, None)
+
+    names = []
+
+    def seen(sender, representative_data, **kwargs):
+        names.append(representative_data['Name']['full'])
+
+    import_representatives.representative_pre_import.connect(seen)
+    try:
+        with dump.open() as f:
+            import_representatives.main(f, ['--resume', '--commit-every',
+                                            '1'])
+    finally:
+        import_representatives.representative_pre_import.disconnect(seen)
+
+    # Only the meps after the checkpoint were read again
+    assert names == [second]
+    run = ImportRun.objects.get()
+    assert (run.records, run.checkpoint, run.complete) == (2, 2, True)
+    assert_expected()
+
+    # Nothing is left to resume once the run finished
+    warnings = log_warnings(monkeypatch)
+    with dump.open() as f:
+        import_representatives.main(f, ['--resume'])
+    assert warnings == ['Last run %s finished, starting a new run' % run.pk]
+    assert ImportRun.objects.count() == 2
+
+
+@pytest.mark.django_db
+def test_parltrack_resume_other_dump(monkeypatch, tmpdir):
+    dump = tmpdir.join('meps.json')
+    with open(fixture, 'r') as f:
+        meps = json.load(f)
+    dump.write(json.dumps(meps))
+
+    monkeypatch.setattr(importer, 'DUMP_DIGEST_SIZE', 100)
+    interrupt_import(monkeypatch, meps[1]['Name']['full'])
+    with pytest.raises(KeyboardInterrupt):
+        with dump.open() as f:
+            import_representatives.main(f, ['--commit-every', '1'])
+    monkeypatch.undo()
+
+    # The next dump begins with the same bytes
+    monkeypatch.setattr(importer, 'DUMP_DIGEST_SIZE', 100)
+    meps.append(meps[1])
+    dump.write(json.dumps(meps))
+    warnings = log_warnings(monkeypatch)
+    with dump.open() as f:
+        import_representatives.main(f, ['--resume'])
+    assert warnings == ['Last run %s read another dump, starting a new run'
+                        % ImportRun.objects.last().pk]
+    assert ImportRun.objects.count() == 2
+    assert ImportRun.objects.first().records == 3
+
+
+@pytest.mark.django_db
+def test_parltrack_resume_piped_dump():
+    with open(fixture, 'r') as f:
+        with pytest.raises(SystemExit):
+            import_representatives.main(StringIO(f.read()), ['--resume'])
+    assert not ImportRun.objects.exists()
+
+
+@pytest.mark.django_db
+def test_parltrack_reimport_skips_unchanged():
+    assert_imported()
+    before = dict(Representative.objects.values_list('slug', 'updated'))
+
+    with CaptureQueriesContext(connection) as queries:
+        with open(fixture, 'r') as f:
+            import_representatives.main(f, [])
+
+    # Unchanged meps are only touched in bulk, never looked up one by one,
+    # and their search documents are left alone
+    assert not [q for q in queries
+                if 'SELECT "representatives_mandate"' in q['sql'] or
+                'FROM "representatives_searchdocument"' in q['sql']]
+    after = dict(Representative.objects.values_list('slug', 'updated'))
+    assert all(after[slug] > before[slug] for slug in before)
+
+
+@pytest.mark.django_db
+def test_parltrack_import_loads_countries_once():
+    with CaptureQueriesContext(connection) as queries:
+        with open(fixture, 'r') as f:
+            import_representatives.main(f, [])
+
+    assert len([q for q in queries
+                if 'FROM "representatives_country"' in q['sql']]) == 1
+    assert_expected()
+
+
+@pytest.mark.django_db
+def test_parltrack_reimport_changed():
+    assert_imported()
+
+    with open(fixture, 'r') as f:
+        meps = json.load(f)
+    meps[0]['Photo'] = 'http://example.com/photo.jpg'
+    import_representatives.main(StringIO(json.dumps(meps)), [])
+
+    assert Representative.objects.filter(
+        photo='http://example.com/photo.jpg').count() == 1
+
+
+@pytest.mark.django_db
+def test_parltrack_reimport_unchanged_details():
+    assert_imported()
+
+    with open(fixture, 'r') as f:
+        meps = json.load(f)
+    for mep in meps:
+        mep.setdefault('Mail', []).append('someone@example.com')
+    with CaptureQueriesContext(connection) as queries:
+        import_meps(meps)
+
+    # Details are compared to digests preloaded in one query
+    assert not [q for q in queries if
+                '"representatives_representative"."slug" = ' in q['sql']]
+    assert Representative.objects.filter(
+        email__email='someone@example.com').count() == 2
+
+
+def count_reimport_queries(meps, mails, argv):
+    for mep in meps:
+        mep['Mail'] = ['%s@example.com' % i for i in range(mails)]
+    with CaptureQueriesContext(connection) as queries:
+        import_meps(meps, argv)
+    assert Email.objects.count() == mails * len(meps)
+    return len(queries)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('argv', [[], ['--batch-size', '10']])
+def test_parltrack_contacts_sync_queries(argv):
+    assert_imported()
+
+    with open(fixture, 'r') as f:
+        meps = json.load(f)
+    # Contacts are synced by set difference with a constant number of
+    # queries, whatever the number of contacts inserted or deleted
+    assert count_reimport_queries(meps, 1, argv) == \
+        count_reimport_queries(meps, 20, argv)
+    assert count_reimport_queries(meps, 2, argv) == \
+        count_reimport_queries(meps, 3, argv)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('argv', [[], ['--batch-size', '10']])
+def test_parltrack_stats(argv, capsys):
+    with open(fixture, 'r') as f:
+        meps = len(json.load(f))
+
+    assert_imported(argv + ['--stats', '--progress', '1'])
+    summary = json.loads(capsys.readouterr()[0])
+    assert summary['records'] == meps
+    assert summary['source'] == 'parltrack'
+    assert summary['rows']['Representative']['inserted'] == meps
+    assert summary['rows']['Mandate']['upserted'] == Mandate.objects.count()
+    assert summary['queries'] == sum(
+        phase['queries'] for phase in summary['phases'].values())
+    assert summary['phases']['mandates']['queries'] > 0
+    assert summary['peak_rss_kb'] > 0
+    assert not connection.force_debug_cursor
+
+    assert_imported(argv + ['--stats'])
+    summary = json.loads(capsys.readouterr()[0])
+    assert summary['rows']['Representative'] == {'touched': meps}
+    assert summary['rows']['RecordDigest']['touched'] == meps
+
+
+def import_dry_run(meps, argv, capsys):
+    with CaptureQueriesContext(connection) as queries:
+        import_meps(meps, argv)
+
+    assert not [q for q in queries if 'INSERT INTO' in q['sql'] or
+                'UPDATE "' in q['sql'] or 'DELETE FROM' in q['sql']]
+    return json.loads(capsys.readouterr()[0])
+
+
+@pytest.mark.django_db
+def test_parltrack_dry_run_empty_database(capsys):
+    with open(fixture, 'r') as f:
+        meps = json.load(f)
+
+    changeset = import_dry_run(meps, ['--dry-run'], capsys)
+    assert changeset['summary']['Representative'] == {'created': len(meps)}
+    assert 'changes' not in changeset
+    assert not Representative.objects.exists()
+    assert not ImportRun.objects.exists()
+
+    import_meps(meps)
+    assert changeset['summary']['Mandate'] == {
+        'created': Mandate.objects.count()}
+
+
+@pytest.mark.django_db
+def test_parltrack_diff(capsys):
+    assert_imported()
+    with open(fixture, 'r') as f:
+        meps = json.load(f)
+
+    meps[0]['Photo'] = 'http://example.com/photo.jpg'
+    meps[0].setdefault('Mail', []).append('someone@example.com')
+    removed = meps.pop(1)
+
+    changeset = import_dry_run(meps, ['--diff'], capsys)
+    assert changeset['records'] == 1
+    changes = changeset['changes']
+    assert changes['Representative']['updated'][0]['changes'] == {
+        'photo': [Representative.objects.get(
+            slug=changes['Representative']['updated'][0]['key']['slug']
+        ).photo, 'http://example.com/photo.jpg']}
+    assert changes['Email']['created'][0]['key']['email'] == \
+        'someone@example.com'
+    assert changes['Representative']['stale'] == [{'key': {
+        'slug': import_representatives._mep_slug(removed)}}]
+    assert 'Mandate' not in changes
+
+    assert not Email.objects.filter(email='someone@example.com').exists()
+    assert ImportRun.objects.count() == 1
+    assert_expected()
+
+
+@pytest.mark.django_db
+def test_parltrack_staging():
+    assert_imported(['--staging'])
+    # Re-importing matches live rows instead of duplicating them
+    assert_imported(['--staging'])
+    assert ImportRun.objects.first().checkpoint == 2
+
+    with open(fixture, 'r') as f:
+        meps = json.load(f)
+    meps[0]['Photo'] = 'http://example.com/photo.jpg'
+    meps[0]['Mail'] = ['someone@example.com']
+    staff = meps[0].pop('Staff')[0]['Organization']
+    import_meps(meps, ['--staging', '--sweep'])
+
+    representative = Representative.objects.get(
+        photo='http://example.com/photo.jpg')
+    assert [e.email for e in representative.email_set.all()] == [
+        'someone@example.com']
+    assert not Group.objects.filter(name=staff).exists()
+    assert Representative.objects.count() == 2
+
+
+@pytest.mark.django_db
+def test_parltrack_staging_publishes_at_once(monkeypatch):
+    groups = Group.objects.count()
+
+    def publish(self):
+        raise RuntimeError()
+    monkeypatch.setattr(importer.Staging, 'publish', publish)
+
+    with pytest.raises(RuntimeError):
+        assert_imported(['--staging'])
+
+    # Nothing was written to live tables before publishing
+    assert not Representative.objects.exists()
+    assert not Mandate.objects.exists()
+    assert Group.objects.count() == groups
+
+
+@pytest.mark.django_db
+def test_parltrack_import_shared_then_worker():
+    importer = import_representatives.ParltrackImporter()
+    importer.pre_import()
+
+    queue = Queue()
+    with open(fixture, 'r') as f:
+        for mep_json in json.load(f):
+            importer.ensure_shared(mep_json)
+            queue.put(mep_json)
+    queue.put(None)
+
+    # Workers find every group and constituency ready
+    groups = Group.objects.count()
+    constituencies = Constituency.objects.count()
+    import_representatives._import_worker(
+        queue, importer.import_start_datetime, 0)
+    assert Group.objects.count() == groups
+    assert Constituency.objects.count() == constituencies
+
+    # As the parent does when the run finishes
+    Group.objects.update_active()
+    Constituency.objects.update_active()
+    assert_expected()
+
+
+@pytest.mark.django_db
+def test_parltrack_import_shared_then_batched_worker():
+    importer = import_representatives.ParltrackImporter()
+    importer.pre_import()
+
+    with open(fixture, 'r') as f:
+        meps = iter(json.load(f))
+
+    class ParentQueue(object):
+        # The parent creates shared rows of a mep just before sending it,
+        # after the worker has preloaded them for its first batch
+        def get(self):
+            mep_json = next(meps, None)
+            if mep_json is not None:
+                importer.ensure_shared(mep_json)
+            return mep_json
+
+    import_representatives._import_worker(
+        ParentQueue(), importer.import_start_datetime, 1)
+    groups = Group.objects.values_list('name', 'kind', 'abbreviation')
+    assert groups.count() == groups.distinct().count()
+    assert Constituency.objects.count() == Constituency.objects.values(
+        'name').distinct().count()
+
+    Group.objects.update_active()
+    Constituency.objects.update_active()
+    assert_expected()
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('commit_every', [0, 50])
+def test_parltrack_worker_checkpoints(commit_every):
+    importer = import_representatives.ParltrackImporter()
+    importer.pre_import()
+
+    with open(fixture, 'r') as f:
+        mep_json = json.load(f)[0]
+    queue = Queue()
+    # More meps than committed at each checkpoint of the worker
+    for i in range(150):
+        mep_json = copy.deepcopy(mep_json)
+        mep_json['UserID'] = 100000 + i
+        mep_json['Name']['full'] = u'Mep %s' % i
+        importer.ensure_shared(mep_json)
+        queue.put(mep_json)
+    queue.put(None)
+
+    import_representatives._import_worker(
+        queue, importer.import_start_datetime, 0, commit_every)
+    assert Representative.objects.count() == 150
+
+
+def failing_worker(queue, *args):
+    sys.exit(1)
+
+
+@pytest.mark.django_db
+def test_parltrack_parallel_import_stops_after_failure(monkeypatch):
+    queues = []
+
+    class Queue(multiprocessing.queues.Queue):
+        def __init__(self, maxsize=0):
+            super(Queue, self).__init__(maxsize)
+            queues.append(self)
+
+    monkeypatch.setattr(import_representatives.multiprocessing, 'Queue',
+                        Queue)
+    monkeypatch.setattr(import_representatives, '_import_worker',
+                        failing_worker)
+    with open(fixture, 'r') as f:
+        mep_json = json.load(f)[0]
+    meps = []
+    # More meps than the queues of the workers buffer
+    for i in range(300):
+        meps.append(dict(mep_json, UserID=100000 + i,
+                         Name=dict(mep_json['Name'], full=u'Mep %s' % i)))
+
+    importer = import_representatives.ParltrackImporter()
+    importer.pre_import()
+    with pytest.raises(RuntimeError):
+        import_representatives.import_parallel(importer, meps, 2)
+    # Meps left in the queues must not keep this process from exiting
+    assert all(queue._joincancelled for queue in queues)
+    assert not multiprocessing.active_children()
+
+
+@pytest.mark.django_db
+def test_parltrack_reimport_touches_in_bulk():
+    assert_imported()
+    before = dict(Group.objects.values_list('pk', 'updated'))
+
+    # Force a full re-import
+    RecordDigest.objects.all().delete()
+    with CaptureQueriesContext(connection) as queries:
+        with open(fixture, 'r') as f:
+            import_representatives.main(f, [])
+
+    group_updates = [q for q in queries
+                     if 'UPDATE "representatives_group" SET "updated"'
+                     in q['sql']]
+    assert len(group_updates) == 1
+    after = dict(Group.objects.values_list('pk', 'updated'))
+    assert all(after[pk] > before[pk] for pk in before
+               if pk != import_representatives.ParltrackImporter().ep_group.pk)
+
+
+def import_meps(meps, argv=None):
+    import_representatives.main(StringIO(json.dumps(meps)), argv or [])
+
+
+@pytest.mark.django_db
+def test_parltrack_sweep_after_complete_run():
+    assert_imported()
+    run = ImportRun.objects.get()
+    assert (run.source, run.records, run.complete) == ('parltrack', 2, True)
+
+    with open(fixture, 'r') as f:
+        meps = json.load(f)
+    staff = meps[0].pop('Staff')[0]['Organization']
+    import_meps(meps, ['--sweep'])
+
+    assert ImportRun.objects.first().swept
+    assert Representative.objects.count() == 2
+    assert not Mandate.objects.filter(group__name=staff).exists()
+    assert not Group.objects.filter(name=staff).exists()
+
+
+@pytest.mark.django_db
+def test_parltrack_sweep_deletes_without_loading(monkeypatch):
+    # A run reading one of two meps is complete
+    monkeypatch.setattr(importer.GenericImporter, 'complete_ratio', 0.5)
+    assert_imported()
+    call_command('update_search_documents')
+    with open(fixture, 'r') as f:
+        meps = json.load(f)
+    removed = Representative.objects.get(
+        slug=import_representatives._mep_slug(meps.pop())).pk
+
+    with CaptureQueriesContext(connection) as queries:
+        import_meps(meps, ['--sweep'])
+
+    assert not Representative.objects.filter(pk=removed).exists()
+    assert not SearchDocument.objects.filter(kind='representative',
+                                             object_id=removed).exists()
+    # Swept rows are deleted with one query per chunk, documents included
+    sql = [q['sql'] for q in queries]
+    assert len([q for q in sql if
+                'DELETE FROM "representatives_searchdocument"' in q]) == 2
+    assert not [q for q in sql if 'SELECT' in q and
+                'FROM "representatives_representative" WHERE '
+                '"representatives_representative"."id" IN' in q]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('argv', [[], ['--batch-size', '10'], ['--staging']])
+def test_parltrack_import_updates_active(argv):
+    def active():
+        return (set(Group.objects.filter(active=True)),
+                set(Constituency.objects.filter(active=True)))
+
+    with open(fixture, 'r') as f:
+        meps = json.load(f)
+    import_meps(meps, argv)
+    before = active()
+    assert CurrentAffiliation.objects.filter(
+        group__isnull=False).count() == Representative.objects.filter(
+            mandates__group__kind='group',
+            mandates__end_date__gte=date.today()).distinct().count()
+
+    group = meps[0]['Groups'][0]
+    constituency = meps[0]['Constituencies'][0]
+    ended = group['end']
+    group['end'] = constituency['end'] = '9999-12-31T00:00:00'
+    import_meps(meps, argv)
+
+    after = active()
+    assert Group.objects.get(abbreviation=group['groupid']) in \
+        after[0] - before[0]
+    assert after[1] - before[1] == set(Constituency.objects.filter(
+        name=constituency['party']))
+
+    Group.objects.update(active=True)
+    call_command('update_active')
+    assert active() == after
+
+    # Sweeping the current mandates leaves their group inactive
+    group['end'] = constituency['end'] = ended
+    import_meps(meps, argv + ['--sweep'])
+    assert active() == before
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('argv', [[], ['--batch-size', '10'], ['--staging']])
+def test_parltrack_import_search_documents(argv):
+    def documents(kind):
+        return set(SearchDocument.objects.filter(kind=kind).values_list(
+            'object_id', flat=True))
+
+    # Documents of existing rows are built once after migrating
+    call_command('update_search_documents')
+    with open(fixture, 'r') as f:
+        meps = json.load(f)
+    import_meps(meps, argv)
+    assert documents('representative') == set(
+        Representative.objects.values_list('pk', flat=True))
+    assert documents('group') == set(Group.objects.values_list('pk',
+                                                               flat=True))
+
+    # Only folded names of the rows written are updated
+    Representative.objects.exclude(
+        slug=import_representatives._mep_slug(meps[0])).update(
+            folded_last_name='')
+    meps[0]['Name']['sur'] = u'Huberto'
+    meps[0]['Staff'][0]['Organization'] = u'Transport Intergroup'
+    import_meps(meps, argv + ['--sweep'])
+    rep = Representative.objects.get(first_name=u'Huberto')
+    assert rep.folded_first_name == u'huberto'
+    assert not Representative.objects.exclude(pk=rep.pk).exclude(
+        folded_last_name='').exists()
+    assert u'huberto' in SearchDocument.objects.get(
+        kind='representative', object_id=rep.pk).document.split()
+    # Documents of swept groups are deleted with them
+    assert documents('group') == set(Group.objects.values_list('pk',
+                                                               flat=True))
+
+
+@pytest.mark.django_db
+def test_parltrack_no_sweep_after_partial_run():
+    assert_imported()
+    mandates = Mandate.objects.count()
+
+    with open(fixture, 'r') as f:
+        meps = json.load(f)
+    import_meps(meps[:1], ['--sweep'])
+
+    run = ImportRun.objects.first()
+    assert (run.records, run.complete, run.swept) == (1, False, False)
+    assert Representative.objects.count() == 2
+    assert Mandate.objects.count() == mandates
+
+
+@pytest.mark.django_db
+def test_parltrack_no_sweep_after_corrupt_dump():
+    assert_imported()
+
+    with open(fixture, 'r') as f:
+        dump = f.read()
+    with pytest.raises(JSONError):
+        import_representatives.main(StringIO(dump[:len(dump) // 2]),
+                                    ['--sweep'])
+
+    assert not ImportRun.objects.first().complete
+    assert_expected()
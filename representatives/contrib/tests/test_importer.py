@@ -0,0 +1,93 @@
+from StringIO import StringIO
+
+import pytest
+from django.db import connection
+from django.test.utils import override_settings
+
+from representatives.contrib import importer
+from representatives.contrib.importer import (MANDATE_CONFLICT_INDEX,
+                                              MANDATE_CONFLICT_TARGET,
+                                              MANDATE_KEY, get_ijson_backend,
+                                              project_items, upsert_rows)
+from representatives.models import Group, Mandate, Representative
+
+
+def test_ijson_backend_from_setting():
+    with override_settings(REPRESENTATIVES_IJSON_BACKEND='python'):
+        assert get_ijson_backend().__name__ == 'ijson.backends.python'
+
+    assert get_ijson_backend('python').__name__ == 'ijson.backends.python'
+
+
+def test_ijson_backend_fallback():
+    # The fastest installed backend replaces a missing one
+    assert get_ijson_backend('missing').__name__ == \
+        get_ijson_backend('auto').__name__
+
+
+@pytest.mark.parametrize('backend', ['python', 'auto'])
+def test_project_items(backend):
+    dump = StringIO('''[
+        {"a": {"b": [1, {"c": 2}]}, "skip": {"x": [[], {}, {"y": 1}]},
+         "d": "e", "skip2": 3},
+        {"skip": [], "a": null},
+        "scalar"
+    ]''')
+
+    items = list(project_items(get_ijson_backend(backend), dump, ['a', 'd']))
+    assert items == [
+        {'a': {'b': [1, {'c': 2}]}, 'd': 'e'},
+        {'a': None},
+        'scalar',
+    ]
+
+
+@pytest.mark.parametrize('backend', ['python', 'auto'])
+def test_project_items_skip(backend):
+    dump = '[{"a": [{"b": []}, [1]]}, [[], {}], "scalar", {"a": 1}]'
+
+    items = list(project_items(get_ijson_backend(backend), StringIO(dump),
+                               skip=2))
+    assert items == ['scalar', {'a': 1}]
+
+    items = list(project_items(get_ijson_backend(backend), StringIO(dump),
+                               skip=5))
+    assert items == []
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('sqlite_version', [None, (3, 8, 0), 'unindexed'])
+def test_upsert_mandates(monkeypatch, sqlite_version):
+    warnings = []
+    if sqlite_version == 'unindexed':
+        # As after a migration remaking the table on SQLite
+        connection.cursor().execute('DROP INDEX %s' % MANDATE_CONFLICT_INDEX)
+        monkeypatch.setattr(importer.logger, 'warning',
+                            lambda msg, *args: warnings.append(msg % args))
+    elif sqlite_version:
+        # Exercise the INSERT OR IGNORE fallback
+        if connection.vendor != 'sqlite':
+            pytest.skip('SQLite only')
+        monkeypatch.setattr(connection.Database, 'sqlite_version_info',
+                            sqlite_version)
+
+    rep = Representative.objects.create(slug='rep', full_name='Rep')
+    group = Group.objects.create(name='Group', kind='group')
+
+    def mandates():
+        # Committee mandates have no constituency nor dates
+        return [Mandate(representative=rep, group=group, role='Member'),
+                Mandate(representative=rep, group=group, role='Member'),
+                Mandate(representative=rep, group=group, role='Chair')]
+
+    upsert_rows(Mandate, mandates(), MANDATE_KEY, MANDATE_CONFLICT_INDEX,
+                MANDATE_CONFLICT_TARGET)
+    before = dict(Mandate.objects.values_list('role', 'updated'))
+    assert len(before) == 2 and Mandate.objects.count() == 2
+
+    upsert_rows(Mandate, mandates(), MANDATE_KEY, MANDATE_CONFLICT_INDEX,
+                MANDATE_CONFLICT_TARGET)
+    after = dict(Mandate.objects.values_list('role', 'updated'))
+    assert Mandate.objects.count() == 2
+    assert all(after[role] > before[role] for role in before)
+    assert len(warnings) == (2 if sqlite_version == 'unindexed' else 0)
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from representatives.models import Constituency, CurrentAffiliation, Group
+
+
+class Command(BaseCommand):
+    help = ('Recompute the active field of groups and constituencies and '
+            'the current affiliations of representatives, to run daily as '
+            'mandates end')
+
+    def handle(self, *args, **options):
+        for model in (Group, Constituency):
+            changed = model.objects.update_active()
+            print 'Updated %s %s' % (changed, model._meta.verbose_name_plural)
+
+        changed = CurrentAffiliation.objects.rebuild()
+        print 'Updated %s current affiliations' % changed
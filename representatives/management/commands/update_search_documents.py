@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from representatives.models import Group, Representative, SearchDocument
+
+
+class Command(BaseCommand):
+    help = ('Bring the folded names and search documents of every '
+            'representative and group up to date, for example after '
+            'migrating; saves and imports keep folded names and search '
+            'documents of the rows they write up to date')
+
+    def handle(self, *args, **options):
+        for model in (Representative, Group):
+            changed = model.objects.update_folded()
+            print 'Updated %s folded names of %s' % (
+                changed, model._meta.verbose_name_plural)
+
+            changed = SearchDocument.objects.rebuild(model)
+            print 'Updated %s search documents of %s' % (
+                changed, model._meta.verbose_name_plural)
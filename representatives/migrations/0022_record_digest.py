@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('representatives', '0021_update_fr_committees'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecordDigest',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('source', models.CharField(max_length=50)),
+                ('slug', models.SlugField(max_length=100)),
+                ('digest', models.CharField(max_length=40)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='recorddigest',
+            unique_together=set([('source', 'slug')]),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('representatives', '0022_record_digest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportRun',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('source', models.CharField(max_length=50, db_index=True)),
+                ('started', models.DateTimeField()),
+                ('finished', models.DateTimeField(null=True, blank=True)),
+                ('records', models.PositiveIntegerField(default=0)),
+                ('complete', models.BooleanField(default=False)),
+                ('swept', models.BooleanField(default=False)),
+            ],
+            options={
+                'ordering': ('-started',),
+            },
+        ),
+    ]
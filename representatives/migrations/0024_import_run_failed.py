@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('representatives', '0023_import_run'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importrun',
+            name='failed',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+KEY = ('representative', 'group', 'constituency', 'role', 'begin_date',
+       'end_date')
+
+# Nullable columns are coalesced so that NULLs compare equal, the importers
+# use the same expressions as ON CONFLICT target
+INDEX = '''
+CREATE UNIQUE INDEX representatives_mandate_natural_key
+ON representatives_mandate (
+    representative_id,
+    COALESCE(group_id, 0),
+    COALESCE(constituency_id, 0),
+    role,
+    COALESCE(begin_date, '0001-01-01'),
+    COALESCE(end_date, '0001-01-01')
+)
+'''
+
+
+def deduplicate_mandates(apps, schema_editor):
+    """
+    Delete duplicate mandates, keeping the first one of each natural key
+    """
+
+    Mandate = apps.get_model("representatives", "Mandate")
+
+    duplicates = Mandate.objects.order_by().values(*KEY).annotate(
+        count=Count('pk'), keep=Min('pk')).filter(count__gt=1)
+
+    for duplicate in duplicates:
+        lookup = {}
+        for field in KEY:
+            if duplicate[field] is None:
+                lookup['%s__isnull' % field] = True
+            else:
+                lookup[field] = duplicate[field]
+
+        Mandate.objects.filter(**lookup).exclude(
+            pk=duplicate['keep']).delete()
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('postgresql', 'sqlite'):
+        schema_editor.execute(INDEX)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('postgresql', 'sqlite'):
+        schema_editor.execute(
+            'DROP INDEX representatives_mandate_natural_key')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('representatives', '0024_import_run_failed'),
+    ]
+
+    operations = [
+        migrations.RunPython(deduplicate_mandates,
+                             migrations.RunPython.noop),
+
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('representatives', '0025_mandate_natural_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importrun',
+            name='checkpoint',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='importrun',
+            name='dump_digest',
+            field=models.CharField(default=b'', max_length=40, blank=True),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from datetime import date
+
+from django.db import migrations, models
+
+
+def update_active(apps, schema_editor):
+    Mandate = apps.get_model('representatives', 'Mandate')
+    current = Mandate.objects.order_by().filter(end_date__gte=date.today())
+
+    for name, field in (('Group', 'group'), ('Constituency', 'constituency')):
+        model = apps.get_model('representatives', name)
+        model.objects.filter(pk__in=current.filter(
+            **{'%s__isnull' % field: False}).values(field)).update(
+                active=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('representatives', '0026_import_run_checkpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='constituency',
+            name='active',
+            field=models.BooleanField(default=False, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='group',
+            name='active',
+            field=models.BooleanField(default=False, db_index=True),
+        ),
+        migrations.RunPython(update_active, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+# Same as migration 0025
+INDEX = '''
+CREATE UNIQUE INDEX IF NOT EXISTS representatives_mandate_natural_key
+ON representatives_mandate (
+    representative_id,
+    COALESCE(group_id, 0),
+    COALESCE(constituency_id, 0),
+    role,
+    COALESCE(begin_date, '0001-01-01'),
+    COALESCE(end_date, '0001-01-01')
+)
+'''
+
+
+def restore_index(apps, schema_editor):
+    """
+    SQLite alters index_together by remaking the table, which drops the
+    expression index of the mandate natural key
+    """
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('representatives', '0027_group_constituency_active'),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, restore_index),
+
+        migrations.AlterIndexTogether(
+            name='mandate',
+            index_together=set([
+                ('representative', 'end_date'),
+                ('group', 'end_date'),
+                ('constituency', 'end_date'),
+            ]),
+        ),
+
+        migrations.RunPython(restore_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('representatives', '0028_mandate_end_date_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CurrentAffiliation',
+            fields=[
+                ('representative', models.OneToOneField(related_name='current', primary_key=True, serialize=False, to='representatives.Representative')),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('chamber', models.ForeignKey(related_name='+', on_delete=django.db.models.deletion.SET_NULL, to='representatives.Chamber', null=True)),
+                ('committee', models.ForeignKey(related_name='+', on_delete=django.db.models.deletion.SET_NULL, to='representatives.Group', null=True)),
+                ('country', models.ForeignKey(related_name='+', on_delete=django.db.models.deletion.SET_NULL, to='representatives.Country', null=True)),
+                ('group', models.ForeignKey(related_name='+', on_delete=django.db.models.deletion.SET_NULL, to='representatives.Group', null=True)),
+            ],
+        ),
+    ]
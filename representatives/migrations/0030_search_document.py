@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import logging
+
+from django.db import DatabaseError, migrations, models, transaction
+
+logger = logging.getLogger(__name__)
+
+SQLITE = [
+    # External content table indexing representatives_searchdocument, kept
+    # in sync by triggers; prefix indexes serve autocompletion
+    """CREATE VIRTUAL TABLE representatives_searchdocument_fts USING fts5(
+        document, content='representatives_searchdocument',
+        content_rowid='id', tokenize='unicode61 remove_diacritics 1',
+        prefix='2 3')""",
+    """CREATE TRIGGER representatives_searchdocument_ai
+        AFTER INSERT ON representatives_searchdocument BEGIN
+        INSERT INTO representatives_searchdocument_fts(rowid, document)
+            VALUES (new.id, new.document);
+    END""",
+    """CREATE TRIGGER representatives_searchdocument_ad
+        AFTER DELETE ON representatives_searchdocument BEGIN
+        INSERT INTO representatives_searchdocument_fts(
+            representatives_searchdocument_fts, rowid, document)
+            VALUES ('delete', old.id, old.document);
+    END""",
+    """CREATE TRIGGER representatives_searchdocument_au
+        AFTER UPDATE ON representatives_searchdocument BEGIN
+        INSERT INTO representatives_searchdocument_fts(
+            representatives_searchdocument_fts, rowid, document)
+            VALUES ('delete', old.id, old.document);
+        INSERT INTO representatives_searchdocument_fts(rowid, document)
+            VALUES (new.id, new.document);
+    END""",
+]
+
+SQLITE_REVERSE = [
+    'DROP TRIGGER IF EXISTS representatives_searchdocument_ai',
+    'DROP TRIGGER IF EXISTS representatives_searchdocument_ad',
+    'DROP TRIGGER IF EXISTS representatives_searchdocument_au',
+    'DROP TABLE IF EXISTS representatives_searchdocument_fts',
+]
+
+POSTGRESQL = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    """CREATE INDEX representatives_searchdocument_vector
+        ON representatives_searchdocument
+        USING gin (to_tsvector('simple', document))""",
+    """CREATE INDEX representatives_searchdocument_trigram
+        ON representatives_searchdocument
+        USING gin (document gin_trgm_ops)""",
+]
+
+POSTGRESQL_REVERSE = [
+    'DROP INDEX IF EXISTS representatives_searchdocument_vector',
+    'DROP INDEX IF EXISTS representatives_searchdocument_trigram',
+]
+
+
+def execute(schema_editor, statements):
+    with schema_editor.connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+def create_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        execute(schema_editor, POSTGRESQL)
+    elif vendor == 'sqlite':
+        # Searches fall back to icontains without FTS5
+        try:
+            with transaction.atomic(using=schema_editor.connection.alias):
+                execute(schema_editor, SQLITE)
+        except DatabaseError as e:
+            logger.warning('Search documents are not indexed: %s', e)
+
+
+def drop_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        execute(schema_editor, POSTGRESQL_REVERSE)
+    elif vendor == 'sqlite':
+        execute(schema_editor, SQLITE_REVERSE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('representatives', '0029_current_affiliation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('kind', models.CharField(max_length=20)),
+                ('object_id', models.PositiveIntegerField()),
+                ('document', models.TextField()),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='searchdocument',
+            unique_together=set([('kind', 'object_id')]),
+        ),
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
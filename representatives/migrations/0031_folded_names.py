@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import unicodedata
+
+from django.db import migrations, models
+from django.utils.encoding import smart_unicode
+
+# Same as representatives.models, copied as the migration must not depend on
+# later changes of the models module
+FOLDED_LETTERS = {
+    u'ß': u'ss', u'æ': u'ae', u'Æ': u'ae', u'œ': u'oe', u'Œ': u'oe',
+    u'ø': u'o', u'Ø': u'o', u'ł': u'l', u'Ł': u'l', u'đ': u'd', u'Đ': u'd',
+    u'ð': u'd', u'Ð': u'd', u'þ': u'th', u'Þ': u'th', u'ı': u'i',
+    u'’': u"'", u'‘': u"'",
+}
+
+
+def fold(value):
+    value = unicodedata.normalize('NFKD', smart_unicode(value or u''))
+    return u' '.join(u''.join(
+        FOLDED_LETTERS.get(c, c) for c in value
+        if not unicodedata.combining(c)).lower().split())
+
+
+def fold_names(apps, schema_editor, batch_size=500):
+    for name, pairs in (
+            ('Representative', (('first_name', 'folded_first_name'),
+                                ('last_name', 'folded_last_name'),
+                                ('full_name', 'folded_full_name'))),
+            ('Group', (('name', 'folded_name'),))):
+        model = apps.get_model('representatives', name)
+        names = [field for field, folded in pairs]
+        rows = [(row[0], dict(
+            (folded, fold(value))
+            for (field, folded), value in zip(pairs, row[1:])))
+            for row in model.objects.values_list('pk', *names).iterator()]
+
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            model.objects.filter(pk__in=[pk for pk, f in batch]).update(
+                **dict((folded, models.Case(*[
+                    models.When(pk=pk, then=models.Value(values[folded]))
+                    for pk, values in batch
+                ], output_field=models.CharField()))
+                    for field, folded in pairs))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('representatives', '0030_search_document'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='group',
+            name='folded_name',
+            field=models.CharField(default='', max_length=511, editable=False, db_index=True, blank=True),
+        ),
+        migrations.AddField(
+            model_name='representative',
+            name='folded_first_name',
+            field=models.CharField(default='', max_length=255, editable=False, db_index=True, blank=True),
+        ),
+        migrations.AddField(
+            model_name='representative',
+            name='folded_full_name',
+            field=models.CharField(default='', max_length=255, editable=False, db_index=True, blank=True),
+        ),
+        migrations.AddField(
+            model_name='representative',
+            name='folded_last_name',
+            field=models.CharField(default='', max_length=255, editable=False, db_index=True, blank=True),
+        ),
+        migrations.RunPython(fold_names, migrations.RunPython.noop),
+    ]
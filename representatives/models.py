@@ -1,10 +1,34 @@
 # coding: utf-8
 
-from datetime import datetime
-
-from django.db import models
+import re
+import unicodedata
+from datetime import date, datetime
+
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
 from django.utils.encoding import smart_unicode
-from django.utils.functional import cached_property
+
+# Letters without a decomposition to ASCII
+FOLDED_LETTERS = {
+    u'ß': u'ss', u'æ': u'ae', u'Æ': u'ae', u'œ': u'oe', u'Œ': u'oe',
+    u'ø': u'o', u'Ø': u'o', u'ł': u'l', u'Ł': u'l', u'đ': u'd', u'Đ': u'd',
+    u'ð': u'd', u'Ð': u'd', u'þ': u'th', u'Þ': u'th', u'ı': u'i',
+    u'’': u"'", u'‘': u"'",
+}
+
+
+def fold(value):
+    """
+    Return value lower-cased with accents removed and letters folded to
+    ASCII, as stored in folded name columns. Letters of other scripts are
+    kept.
+    """
+    value = unicodedata.normalize('NFKD', smart_unicode(value or u''))
+    return u' '.join(u''.join(
+        FOLDED_LETTERS.get(c, c) for c in value
+        if not unicodedata.combining(c)).lower().split())
 
 
 class TimeStampedModel(models.Model):
@@ -28,6 +52,56 @@ class Country(models.Model):
         return u'{} [{}]'.format(self.name, self.code)
 
 
+class FoldedQuerySet(models.QuerySet):
+    """
+    Queryset of a model with folded copies of name fields, listed in its
+    folded_fields as (field, folded field) pairs
+    """
+
+    def update_folded(self, batch_size=500):
+        """
+        Set folded fields which differ from the folded values of their
+        fields, with one UPDATE per batch of rows, and return the number of
+        rows updated
+        """
+        pairs = self.model.folded_fields
+        names = [name for pair in pairs for name in pair]
+        changed = []
+        for row in self.order_by().values_list('pk', *names).iterator():
+            values = dict(zip(names, row[1:]))
+            folded = dict((target, fold(values[name]))
+                          for name, target in pairs)
+            if any(values[target] != value
+                   for target, value in folded.items()):
+                changed.append((row[0], folded))
+
+        for start in range(0, len(changed), batch_size):
+            batch = changed[start:start + batch_size]
+            self.model.objects.filter(pk__in=[pk for pk, f in batch]).update(
+                **dict((target, models.Case(*[
+                    models.When(pk=pk, then=models.Value(folded[target]))
+                    for pk, folded in batch
+                ], output_field=models.CharField()))
+                    for name, target in pairs))
+        return len(changed)
+
+
+def fold_names(instance, update_fields=None):
+    """
+    Set the folded fields of instance. Return update_fields, the fields
+    about to be saved if not all, with the folded fields of those fields.
+    """
+    if update_fields is not None:
+        update_fields = list(update_fields)
+
+    for name, target in instance.folded_fields:
+        setattr(instance, target, fold(getattr(instance, name)))
+        if update_fields is not None and name in update_fields and \
+                target not in update_fields:
+            update_fields.append(target)
+    return update_fields
+
+
 class Representative(TimeStampedModel):
     """
     Base model for representatives
@@ -49,9 +123,29 @@ class Representative(TimeStampedModel):
     photo = models.CharField(max_length=512, null=True)
     active = models.BooleanField(default=False)
 
+    # Folded names, see fold(), set on save and by update_folded()
+    folded_first_name = models.CharField(max_length=255, blank=True,
+        default='', db_index=True, editable=False)
+    folded_last_name = models.CharField(max_length=255, blank=True,
+        default='', db_index=True, editable=False)
+    folded_full_name = models.CharField(max_length=255, blank=True,
+        default='', db_index=True, editable=False)
+
+    folded_fields = (('first_name', 'folded_first_name'),
+                     ('last_name', 'folded_last_name'),
+                     ('full_name', 'folded_full_name'))
+
+    objects = FoldedQuerySet.as_manager()
+
     def __unicode__(self):
         return smart_unicode(self.full_name)
 
+    def save(self, *args, **kwargs):
+        update_fields = fold_names(self, kwargs.get('update_fields'))
+        if update_fields is not None:
+            kwargs['update_fields'] = update_fields
+        super(Representative, self).save(*args, **kwargs)
+
     def gender_as_str(self):
         genders = {0: 'N/A', 1: 'F', 2: 'M'}
         return genders[self.gender]
@@ -59,6 +153,49 @@ class Representative(TimeStampedModel):
     class Meta:
         ordering = ['last_name', 'first_name']
 
+
+class RecordDigest(TimeStampedModel):
+    """
+    Digest of the source record a representative was last imported from,
+    used by importers to skip records that did not change
+    """
+
+    source = models.CharField(max_length=50)
+    slug = models.SlugField(max_length=100)
+    digest = models.CharField(max_length=40)
+
+    def __unicode__(self):
+        return u'{} [{}]'.format(self.slug, self.source)
+
+    class Meta:
+        unique_together = (('source', 'slug'),)
+
+
+class ImportRun(models.Model):
+    """
+    Journal of importer runs, a run is complete when its whole source was
+    read, no record failed and it is not suspiciously smaller than the
+    previous complete run
+    """
+
+    source = models.CharField(max_length=50, db_index=True)
+    started = models.DateTimeField()
+    finished = models.DateTimeField(blank=True, null=True)
+    records = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    complete = models.BooleanField(default=False)
+    swept = models.BooleanField(default=False)
+    # Identifies the dump read by the run, and the number of its records
+    # that were committed, see --resume
+    dump_digest = models.CharField(max_length=40, blank=True, default='')
+    checkpoint = models.PositiveIntegerField(default=0)
+
+    def __unicode__(self):
+        return u'{} run #{} [{}]'.format(self.source, self.pk, self.started)
+
+    class Meta:
+        ordering = ('-started',)
+
 # Contact related models
 
 
@@ -111,6 +248,35 @@ class Chamber(models.Model):
         return u'{} [{}]'.format(self.name, self.abbreviation)
 
 
+class ActiveQuerySet(models.QuerySet):
+    """
+    Queryset of groups or constituencies, which are active while one of
+    their mandates has not ended
+    """
+
+    def update_active(self):
+        """
+        Recompute the stored active field in bulk, with one UPDATE per
+        value, and return the number of rows that changed
+        """
+        field = self.model._meta.get_field('mandates').field.name
+        # NOT IN is never true if the subquery returns NULL
+        current = Mandate.objects.order_by().filter(
+            end_date__gte=date.today(),
+            **{'%s__isnull' % field: False}).values(field)
+
+        changed = self.filter(active=False, pk__in=current).update(
+            active=True)
+        return changed + self.filter(active=True).exclude(
+            pk__in=current).update(active=False)
+
+
+class GroupQuerySet(ActiveQuerySet, FoldedQuerySet):
+    """
+    Queryset of groups
+    """
+
+
 class Group(TimeStampedModel):
     """
     An entity represented by a representative through a mandate
@@ -121,13 +287,26 @@ class Group(TimeStampedModel):
     kind = models.CharField(max_length=255, db_index=True)
     chamber = models.ForeignKey(Chamber, null=True, related_name='groups')
 
-    @cached_property
-    def active(self):
-        return self.mandates.filter(end_date__gte=datetime.now()).exists()
+    # Maintained by ActiveQuerySet.update_active()
+    active = models.BooleanField(default=False, db_index=True)
+
+    # Folded name, see fold(), set on save and by update_folded()
+    folded_name = models.CharField(max_length=511, blank=True, default='',
+        db_index=True, editable=False)
+
+    folded_fields = (('name', 'folded_name'),)
+
+    objects = GroupQuerySet.as_manager()
 
     def __unicode__(self):
         return unicode(self.name)
 
+    def save(self, *args, **kwargs):
+        update_fields = fold_names(self, kwargs.get('update_fields'))
+        if update_fields is not None:
+            kwargs['update_fields'] = update_fields
+        super(Group, self).save(*args, **kwargs)
+
     class Meta:
         ordering = ('name',)
 
@@ -140,15 +319,44 @@ class Constituency(TimeStampedModel):
     country = models.ForeignKey('Country', null=True, blank=True,
         related_name='constituencies')
 
-    @cached_property
-    def active(self):
-        return self.mandates.filter(end_date__gte=datetime.now()).exists()
+    # Maintained by ActiveQuerySet.update_active()
+    active = models.BooleanField(default=False, db_index=True)
+
+    objects = ActiveQuerySet.as_manager()
 
     def __unicode__(self):
         return unicode(self.name)
 
 
-class MandateManager(models.Manager):
+class MandateQuerySet(models.QuerySet):
+    """
+    Queryset of mandates, filtered on their dates in SQL. A mandate without
+    begin date is considered started, one without end date ended.
+    """
+
+    def between(self, start, end):
+        """
+        Mandates running at some point from start to end, both included
+        """
+        return self.filter(
+            models.Q(begin_date__lte=end) | models.Q(begin_date__isnull=True),
+            end_date__gte=start)
+
+    def active(self, on=None):
+        """
+        Mandates running on the given date, today by default
+        """
+        on = on or date.today()
+        return self.between(on, on)
+
+    def current_for(self, representative):
+        """
+        Active mandates of a representative, given as an instance or pk
+        """
+        return self.active().filter(representative=representative)
+
+
+class MandateManager(models.Manager.from_queryset(MandateQuerySet)):
     """ This satisfies repr(Mandate) """
     def get_queryset(self):
         return super(
@@ -192,3 +400,221 @@ class Mandate(TimeStampedModel):
 
     class Meta:
         ordering = ('-end_date',)
+        # Serve MandateQuerySet date filters per representative or entity
+        index_together = (
+            ('representative', 'end_date'),
+            ('group', 'end_date'),
+            ('constituency', 'end_date'),
+        )
+        # Migration 0025 adds a unique index on the natural key, which
+        # coalesces nullable columns and cannot be declared here. SQLite
+        # drops it whenever a migration remakes the table, as AddField or
+        # AlterIndexTogether do: such migrations must create it again, like
+        # 0028 does, or imports fall back to looking mandates up one by one
+
+
+class CurrentAffiliationQuerySet(models.QuerySet):
+    """
+    Queryset of current affiliation snapshots
+    """
+
+    # Committee seats with these roles are not a main committee
+    substitute = re.compile(r'substitute|suppl', re.IGNORECASE)
+
+    def compute(self, representatives):
+        """
+        Return {representative pk: (chamber, group, country, committee)} from
+        the active mandates of representatives, latest mandates first
+        """
+        mandates = Mandate.objects.active().order_by().filter(
+            representative__in=representatives,
+            group__kind__in=('chamber', 'group', 'country', 'committee'))
+        rows = sorted(mandates.values_list(
+            'representative_id', 'group__kind', 'group_id',
+            'group__chamber_id', 'constituency__country_id', 'role',
+            'begin_date', 'pk'), key=lambda row: (
+                row[1] != 'committee' or not self.substitute.search(row[5]),
+                row[6] or date.min, row[7]))
+
+        affiliations = {}
+        for rep, kind, group, chamber, country, role, begin, pk in rows:
+            current = affiliations.setdefault(rep, [None] * 4)
+            if kind == 'chamber':
+                current[0] = chamber
+            elif kind == 'group':
+                current[1] = group
+            elif kind == 'country':
+                current[2] = country
+            else:
+                current[3] = group
+        return {rep: tuple(current) for rep, current in affiliations.items()}
+
+    @transaction.atomic
+    def rebuild(self, representatives=None, batch_size=500):
+        """
+        Bring the snapshots of a representative queryset, all by default,
+        up to date with their active mandates: missing rows are created and
+        rows which changed updated, with one UPDATE per value. Return the
+        number of rows written.
+        """
+        if representatives is None:
+            representatives = Representative.objects.all()
+        pks = list(representatives.values_list('pk', flat=True))
+        fields = ('chamber_id', 'group_id', 'country_id', 'committee_id')
+
+        created = []
+        changed = {}
+        for start in range(0, len(pks), batch_size):
+            chunk = pks[start:start + batch_size]
+            stored = {row[0]: row[1:] for row in self.filter(
+                pk__in=chunk).values_list('pk', *fields)}
+            computed = self.compute(chunk)
+
+            for pk in chunk:
+                current = computed.get(pk, (None,) * 4)
+                if pk not in stored:
+                    created.append(self.model(
+                        representative_id=pk, **dict(zip(fields, current))))
+                elif stored[pk] != current:
+                    changed.setdefault(current, []).append(pk)
+
+        self.bulk_create(created, batch_size=batch_size)
+        now = timezone.now()
+        for current, reps in changed.items():
+            for start in range(0, len(reps), batch_size):
+                self.filter(pk__in=reps[start:start + batch_size]).update(
+                    updated=now, **dict(zip(fields, current)))
+        return len(created) + sum(len(reps) for reps in changed.values())
+
+
+class CurrentAffiliation(models.Model):
+    """
+    Snapshot of the current chamber, political group, country and main
+    committee of a representative, as Representative.current. Rebuilt from
+    active mandates by CurrentAffiliationQuerySet.rebuild().
+    """
+
+    representative = models.OneToOneField(
+        Representative, primary_key=True, related_name='current')
+    chamber = models.ForeignKey(Chamber, null=True, related_name='+',
+                                on_delete=models.SET_NULL)
+    group = models.ForeignKey(Group, null=True, related_name='+',
+                              on_delete=models.SET_NULL)
+    country = models.ForeignKey(Country, null=True, related_name='+',
+                                on_delete=models.SET_NULL)
+    committee = models.ForeignKey(Group, null=True, related_name='+',
+                                  on_delete=models.SET_NULL)
+    updated = models.DateTimeField(auto_now=True)
+
+    objects = CurrentAffiliationQuerySet.as_manager()
+
+    def __unicode__(self):
+        return u'Current affiliation of {}'.format(self.representative)
+
+
+class SearchDocumentQuerySet(models.QuerySet):
+    """
+    Queryset of search documents
+    """
+
+    # Fields making up the search document of each model
+    fields = {
+        'representative': ('full_name', 'first_name', 'last_name', 'slug'),
+        'group': ('name', 'abbreviation'),
+    }
+
+    @staticmethod
+    def document(values):
+        """
+        Return the folded words of values once each, slugs searched by their
+        words
+        """
+        words = []
+        for value in values:
+            for word in fold(value).replace('-', ' ').split():
+                if word not in words:
+                    words.append(word)
+        return u' '.join(words)
+
+    @transaction.atomic
+    def rebuild(self, model, pks=None, batch_size=500):
+        """
+        Bring the search documents of model up to date, of the rows with
+        primary keys pks or of every row: missing ones are created, changed
+        ones updated and those of deleted rows deleted. Return the number of
+        rows written.
+        """
+        kind = model._meta.model_name
+        if pks is None:
+            return self._rebuild(kind, model.objects.all(),
+                                 self.filter(kind=kind), batch_size)
+
+        pks = list(pks)
+        return sum(
+            self._rebuild(kind, model.objects.filter(pk__in=chunk),
+                          self.filter(kind=kind, object_id__in=chunk),
+                          batch_size)
+            for chunk in (pks[start:start + batch_size]
+                          for start in range(0, len(pks), batch_size)))
+
+    def _rebuild(self, kind, rows, documents, batch_size):
+        stored = dict(documents.values_list('object_id', 'document'))
+
+        created, changed = [], []
+        for row in rows.order_by().values_list(
+                'pk', *self.fields[kind]).iterator():
+            document = self.document(row[1:])
+            old = stored.pop(row[0], None)
+            if old is None:
+                created.append(self.model(kind=kind, object_id=row[0],
+                                          document=document))
+            elif old != document:
+                changed.append((row[0], document))
+
+        self.bulk_create(created, batch_size=batch_size)
+        for pk, document in changed:
+            documents.filter(object_id=pk).update(document=document)
+        deleted = list(stored)
+        for start in range(0, len(deleted), batch_size):
+            documents.filter(
+                object_id__in=deleted[start:start + batch_size]).delete()
+        return len(created) + len(changed) + len(deleted)
+
+
+class SearchDocument(models.Model):
+    """
+    Text searched for a representative or a group, indexed by migration
+    0030 and queried by representatives.search
+    """
+
+    kind = models.CharField(max_length=20)
+    object_id = models.PositiveIntegerField()
+    document = models.TextField()
+
+    objects = SearchDocumentQuerySet.as_manager()
+
+    def __unicode__(self):
+        return u'{} #{}: {}'.format(self.kind, self.object_id, self.document)
+
+    class Meta:
+        unique_together = (('kind', 'object_id'),)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_save, sender=Representative)
+def save_search_document(sender, instance, update_fields=None, **kwargs):
+    """
+    Keep the search document of a row saved on its own, in the admin or the
+    API for example, up to date; imports rebuild the documents of the rows
+    they write in bulk
+    """
+    fields = SearchDocumentQuerySet.fields[sender._meta.model_name]
+    if update_fields is None or set(update_fields) & set(fields):
+        SearchDocument.objects.rebuild(sender, [instance.pk])
+
+
+@receiver(post_delete, sender=Group)
+@receiver(post_delete, sender=Representative)
+def delete_search_document(sender, instance, **kwargs):
+    SearchDocument.objects.filter(kind=sender._meta.model_name,
+                                  object_id=instance.pk).delete()
@@ -0,0 +1,90 @@
+# coding: utf-8
+'''
+Ranked searches on the indexed documents of representatives and groups
+
+Search documents are maintained by SearchDocument.objects.rebuild() and
+indexed by migration 0030: with FTS5 on SQLite, with tsvector and trigram
+GIN indexes on PostgreSQL. Other databases, or SQLite builds without FTS5,
+have no indexed search and callers fall back to icontains lookups.
+'''
+
+import re
+
+from django.db import connections
+
+from representatives.models import SearchDocument, fold
+
+FTS_TABLE = 'representatives_searchdocument_fts'
+
+# Aliases of connections found to have indexed search documents
+_indexed = set()
+
+
+def is_indexed(connection):
+    '''
+    Return True if search documents are indexed on connection
+    '''
+    if connection.alias not in _indexed:
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                tables = connection.introspection.table_names(cursor)
+            if FTS_TABLE not in tables:
+                return False
+        elif connection.vendor != 'postgresql':
+            return False
+        _indexed.add(connection.alias)
+    return True
+
+
+def search(queryset, text):
+    '''
+    Filter a queryset of representatives or groups on the words of text,
+    prefixes of words of their search documents insensitive to case and
+    accents, best matches first.
+    Return None when the database does not index search documents.
+    '''
+    connection = connections[queryset.db]
+    if not is_indexed(connection):
+        return None
+
+    words = re.findall(r'\w+', fold(text), re.UNICODE)
+    if not words:
+        return queryset
+
+    qn = connection.ops.quote_name
+    model = queryset.model
+    document = qn(SearchDocument._meta.db_table)
+    where = [
+        '%s.kind = %%s' % document,
+        '%s.object_id = %s.%s' % (document, qn(model._meta.db_table),
+                                  qn(model._meta.pk.column)),
+    ]
+    params = [model._meta.model_name]
+
+    if connection.vendor == 'sqlite':
+        fts = qn(FTS_TABLE)
+        # bm25() rank, lower is better
+        return queryset.extra(
+            select={'search_rank': '%s.rank' % fts},
+            tables=[SearchDocument._meta.db_table, FTS_TABLE],
+            where=where + ['%s.rowid = %s.id' % (fts, document),
+                           '%s MATCH %%s' % fts],
+            params=params + [u' '.join(u'"%s"*' % w for w in words)],
+            order_by=['search_rank', 'pk'])
+
+    # Whole word prefixes through the tsvector index, substrings through
+    # the trigram index, ranked by both
+    vector = "to_tsvector('simple', %s.document)" % document
+    tsquery = u' & '.join(u'%s:*' % w for w in words)
+    likes = [u'%%%s%%' % w.replace('_', '\\_') for w in words]
+    return queryset.extra(
+        select={'search_rank': "ts_rank(%s, to_tsquery('simple', %%s)) + "
+                               "similarity(%s.document, %%s)" % (
+                                   vector, document)},
+        select_params=[tsquery, u' '.join(words)],
+        tables=[SearchDocument._meta.db_table],
+        where=where + ["(%s @@ to_tsquery('simple', %%s) OR (%s))" % (
+            vector, ' AND '.join(['%s.document ILIKE %%s' % document] *
+                                 len(words)))],
+        params=params + [tsquery] + likes,
+        order_by=['-search_rank', 'pk'])
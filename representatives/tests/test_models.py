@@ -0,0 +1,142 @@
+# coding: utf-8
+from datetime import date, timedelta
+
+import pytest
+
+from representatives.models import (Chamber, Constituency, Country,
+                                    CurrentAffiliation, Group, Mandate,
+                                    Representative, fold)
+
+
+@pytest.fixture
+def mandates():
+    today = date.today()
+    group = Group.objects.create(name='Group', kind='group')
+    rep = Representative.objects.create(slug='rep', full_name='Rep')
+
+    def mandate(role, begin, end):
+        return Mandate.objects.create(representative=rep, group=group,
+                                      role=role, begin_date=begin,
+                                      end_date=end)
+
+    return {
+        'ended': mandate('ended', date(2000, 1, 1), date(2004, 12, 31)),
+        'current': mandate('current', date(2005, 1, 1), date(9999, 12, 31)),
+        'undated': mandate('undated', None, today),
+        'future': mandate('future', today + timedelta(days=1),
+                          date(9999, 12, 31)),
+        'unended': mandate('unended', date(2000, 1, 1), None),
+    }
+
+
+def roles(queryset):
+    return set(queryset.values_list('role', flat=True))
+
+
+@pytest.mark.django_db
+def test_mandate_active(mandates):
+    assert roles(Mandate.objects.active()) == set(['current', 'undated'])
+    assert roles(Mandate.objects.active(date(2004, 12, 31))) == set([
+        'ended', 'undated'])
+
+
+@pytest.mark.django_db
+def test_mandate_between(mandates):
+    assert roles(Mandate.objects.between(
+        date(2004, 1, 1), date(2005, 1, 1))) == set([
+            'ended', 'current', 'undated'])
+    assert roles(Mandate.objects.between(
+        date(1990, 1, 1), date(1999, 12, 31))) == set(['undated'])
+
+
+@pytest.mark.django_db
+def test_mandate_current_for(mandates):
+    rep = mandates['current'].representative
+    other = Representative.objects.create(slug='other', full_name='Other')
+
+    assert roles(Mandate.objects.current_for(rep)) == set([
+        'current', 'undated'])
+    assert roles(Mandate.objects.current_for(rep.pk)) == set([
+        'current', 'undated'])
+    assert not Mandate.objects.current_for(other).exists()
+    assert roles(rep.mandates.active()) == set(['current', 'undated'])
+
+
+@pytest.mark.django_db
+def test_current_affiliation_rebuild():
+    today = date.today()
+    france, _ = Country.objects.get_or_create(code='FR',
+                                              defaults={'name': 'France'})
+    chamber = Chamber.objects.create(name='Chamber', abbreviation='CH')
+    party = Constituency.objects.create(name='Party', country=france)
+    rep = Representative.objects.create(slug='rep', full_name='Rep')
+    other = Representative.objects.create(slug='other', full_name='Other')
+
+    def mandate(kind, role='member', begin=date(2000, 1, 1),
+                end=date(9999, 12, 31), constituency=None, **group):
+        group = Group.objects.create(name='%s %s' % (kind, role), kind=kind,
+                                     chamber=chamber, **group)
+        Mandate.objects.create(representative=rep, group=group, role=role,
+                               constituency=constituency, begin_date=begin,
+                               end_date=end)
+        return group
+
+    mandate('chamber')
+    group = mandate('group')
+    mandate('group', end=today - timedelta(days=1))
+    mandate('country', constituency=party)
+    committee = mandate('committee', 'Member', begin=date(2000, 1, 1),
+                        abbreviation='COM')
+    mandate('committee', 'Substitute', begin=date(2010, 1, 1))
+    later = mandate('committee', 'Member', begin=date(2005, 1, 1),
+                    end=today)
+
+    assert CurrentAffiliation.objects.rebuild() == 2
+    current = Representative.objects.get(pk=rep.pk).current
+    assert (current.chamber, current.group, current.country,
+            current.committee) == (chamber, group, france, later)
+    assert not any([other.current.chamber, other.current.group,
+                    other.current.country, other.current.committee])
+
+    assert CurrentAffiliation.objects.rebuild() == 0
+
+    Mandate.objects.filter(group=later).update(
+        end_date=today - timedelta(days=1))
+    assert CurrentAffiliation.objects.rebuild(
+        Representative.objects.filter(pk=rep.pk)) == 1
+    assert CurrentAffiliation.objects.get(pk=rep.pk).committee == committee
+    assert Representative.objects.filter(
+        current__committee__abbreviation='COM',
+        current__country__code='FR').get() == rep
+
+
+def test_fold():
+    assert fold(u'Bairbre de BRÚN') == u'bairbre de brun'
+    assert fold(u'Søren  Łukasz O’BRIEN') == u"soren lukasz o'brien"
+    assert fold(None) == u''
+
+
+@pytest.mark.django_db
+def test_folded_names():
+    rep = Representative.objects.create(
+        slug='bairbre-de-brun', first_name=u'Bairbre', last_name=u'de BRÚN',
+        full_name=u'Bairbre de BRÚN')
+    group = Group.objects.create(name=u'Délégation', kind='delegation')
+    assert Representative.objects.filter(folded_last_name='de brun',
+                                         folded_full_name='bairbre de brun',
+                                         folded_first_name='bairbre').exists()
+    assert Group.objects.filter(folded_name='delegation').exists()
+
+    rep.last_name = u'de BRÚN-SMITH'
+    rep.save(update_fields=('last_name',))
+    assert Representative.objects.get(
+        pk=rep.pk).folded_last_name == 'de brun-smith'
+
+    # Rows written in bulk are folded by update_folded()
+    Representative.objects.filter(pk=rep.pk).update(first_name=u'Bríd')
+    Group.objects.filter(pk=group.pk).update(folded_name='')
+    assert Representative.objects.update_folded() == 1
+    assert Group.objects.update_folded() == 1
+    assert Representative.objects.update_folded() == 0
+    assert Representative.objects.get(pk=rep.pk).folded_first_name == 'brid'
+    assert Group.objects.get(pk=group.pk).folded_name == 'delegation'
@@ -0,0 +1,111 @@
+# coding: utf-8
+import json
+
+import pytest
+from django import test
+
+from representatives.models import Group, Representative, SearchDocument
+from representatives.search import search
+
+
+@pytest.fixture
+def reps():
+    names = [(u'Hubert', u'PIRKER'), (u'Anne', u'PIRKER'),
+             (u'Jürgen', u'MÜLLER')]
+    reps = [Representative.objects.create(
+        slug=u'%s-%s' % (first.lower(), last.lower()), first_name=first,
+        last_name=last, full_name=u'%s %s' % (first, last))
+        for first, last in names]
+    for model in (Representative, Group):
+        SearchDocument.objects.rebuild(model)
+    return reps
+
+
+def slugs(queryset):
+    return [rep.slug for rep in queryset]
+
+
+@pytest.mark.django_db
+def test_search_document_rebuild(reps):
+    documents = SearchDocument.objects.filter(kind='representative')
+    assert documents.get(object_id=reps[0].pk).document == u'hubert pirker'
+    assert SearchDocument.objects.rebuild(Representative) == 0
+
+    # Bulk updates are not signaled
+    Representative.objects.filter(pk__in=[reps[0].pk, reps[1].pk]).update(
+        full_name=u'Hubert PIRKER-SMITH')
+    SearchDocument.objects.create(kind='representative', object_id=0,
+                                  document=u'deleted')
+
+    assert SearchDocument.objects.rebuild(Representative, [
+        reps[0].pk, 0]) == 2
+    assert documents.get(object_id=reps[0].pk).document == \
+        u'hubert pirker smith'
+    assert documents.get(object_id=reps[1].pk).document == u'anne pirker'
+    assert not documents.filter(object_id=0).exists()
+
+    assert SearchDocument.objects.rebuild(Representative) == 1
+    assert documents.get(object_id=reps[1].pk).document == \
+        u'hubert pirker smith anne'
+
+
+@pytest.mark.django_db
+def test_search_document_signals():
+    documents = SearchDocument.objects.filter(kind='representative')
+    rep = Representative.objects.create(
+        slug='brid-smith', first_name=u'Bríd', last_name=u'SMITH',
+        full_name=u'Bríd SMITH')
+    assert documents.get(object_id=rep.pk).document == u'brid smith'
+
+    rep.last_name = u'SMITH-JONES'
+    rep.full_name = u'Bríd SMITH-JONES'
+    rep.save()
+    assert documents.get(object_id=rep.pk).document == u'brid smith jones'
+
+    pk = rep.pk
+    rep.delete()
+    assert not documents.filter(object_id=pk).exists()
+
+    group = Group.objects.create(name=u'Committee on Transport',
+                                 kind='committee', abbreviation='TRAN')
+    assert SearchDocument.objects.get(
+        kind='group', object_id=group.pk).document == \
+        u'committee on transport tran'
+
+
+@pytest.mark.django_db
+def test_search(reps):
+    found = search(Representative.objects.all(), u'pirk')
+    if found is None:
+        pytest.skip('Search documents are not indexed')
+
+    assert set(slugs(found)) == set(['hubert-pirker', 'anne-pirker'])
+    assert slugs(search(Representative.objects.all(), u'Anne pirker')) == [
+        'anne-pirker']
+    assert slugs(search(Representative.objects.filter(
+        first_name=u'Hubert'), u'pirker')) == ['hubert-pirker']
+    assert not search(Representative.objects.all(), u'smith').exists()
+    assert search(Representative.objects.all(), u'pirk').count() == 2
+    assert slugs(search(Representative.objects.all(), u'Müll')) == [
+        u'jürgen-müller']
+
+
+@pytest.mark.django_db
+def test_search_api(reps):
+    response = test.client.Client().get(
+        '/api/representatives/?format=json&search=pirk')
+    assert set(rep['slug'] for rep in json.loads(response.content)) == set([
+        'hubert-pirker', 'anne-pirker'])
+
+
+@pytest.mark.django_db
+def test_folded_filters_api(reps):
+    def get(query):
+        response = test.client.Client().get(
+            '/api/representatives/?format=json&' + query)
+        return set(rep['slug'] for rep in json.loads(response.content))
+
+    assert get('last_name=Muller') == set([u'jürgen-müller'])
+    assert get('full_name__icontains=jurgen') == set([u'jürgen-müller'])
+    assert get('last_name__icontains=irk') == set([
+        'hubert-pirker', 'anne-pirker'])